@@ -0,0 +1,278 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from typing import Optional
+from database.storage import require_sql_storage
+from models.telemetry import DeadbandConfig, RateLimitConfig
+from models.alert import AlertReplayCreate
+from services.retention_service import retention_service
+from services.deadband_service import deadband_service
+from services.idempotency_service import idempotency_service
+from services.telemetry_stream_service import telemetry_stream_service
+from services.alert_pipeline import alert_pipeline
+from services.ingest_shards import ingest_shards
+from services.alert_auto_resolver import alert_auto_resolver
+from services.notification_service import notification_dispatcher
+from services.admission_service import admission_controller
+from services.vehicle_purge_service import vehicle_purge_service
+from services.response_cache import response_cache
+from services.analytics_service import analytics_service
+from services.alert_replay_service import alert_replay_service
+from services.backup_service import backup_service
+from services.memory_accounting import memory_accounting, parse_size
+from services.telemetry_ring_buffer import telemetry_ring_buffer
+from services.request_profiler import ProfiledRoute, request_profiler
+
+router = APIRouter(prefix="/admin", tags=["admin"], route_class=ProfiledRoute)
+
+@router.get("/retention", dependencies=[Depends(require_sql_storage)])
+def get_retention_status():
+    """Get telemetry retention settings and the result of the last run"""
+    if ingest_shards.enabled:
+        return {"shards": ingest_shards.fan_out("retention_service", "get_status")}
+    return retention_service.get_status()
+
+@router.post("/retention/run", dependencies=[Depends(require_sql_storage)])
+def run_retention(retention_days: Optional[int] = Query(default=None, ge=0, description="Override the raw retention window")):
+    """Downsample, archive and purge telemetry older than the retention window"""
+    if ingest_shards.enabled:
+        return {"shards": ingest_shards.fan_out("retention_service", "run_retention", retention_days)}
+    return retention_service.run_retention(retention_days)
+
+@router.get("/deadband")
+def get_deadband_stats():
+    """Get per-fleet deadband settings with stored and suppressed sample counts"""
+    if ingest_shards.enabled:
+        return {"shards": ingest_shards.fan_out("deadband_service", "get_stats")}
+    return deadband_service.get_stats()
+
+@router.put("/deadband/{fleet_id}")
+def configure_deadband(fleet_id: str, config: DeadbandConfig):
+    """Enable or update deadband compression for a fleet"""
+    # The API process keeps the configs too, to hand them to shards as they start
+    deadband_service.configure_fleet(fleet_id, config)
+    if ingest_shards.enabled:
+        ingest_shards.fan_out("deadband_service", "configure_fleet", fleet_id, config)
+    return {"message": f"Deadband enabled for fleet {fleet_id}", "config": config}
+
+@router.delete("/deadband/{fleet_id}", status_code=status.HTTP_204_NO_CONTENT)
+def disable_deadband(fleet_id: str):
+    """Disable deadband compression for a fleet"""
+    removed = deadband_service.remove_fleet(fleet_id)
+    if ingest_shards.enabled:
+        removed = any(ingest_shards.fan_out("deadband_service", "remove_fleet", fleet_id)) or removed
+    if not removed:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Deadband not configured for fleet")
+
+@router.get("/rate-limits")
+async def get_rate_limit_stats(top: int = Query(default=20, ge=1, le=1000, description="Number of most throttled VINs to list")):
+    """Get ingest rate limits, admission counters and the most throttled vehicles"""
+    return admission_controller.get_stats(top)
+
+@router.put("/rate-limits/{fleet_id}")
+async def configure_rate_limit(fleet_id: str, config: RateLimitConfig):
+    """Override the ingest rate limits for a fleet and its vehicles"""
+    admission_controller.configure_fleet(fleet_id, config)
+    return {"message": f"Rate limits updated for fleet {fleet_id}", "config": config}
+
+@router.delete("/rate-limits/{fleet_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_rate_limit(fleet_id: str):
+    """Return a fleet to the default ingest rate limits"""
+    if not admission_controller.remove_fleet(fleet_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No rate limit override for fleet")
+
+@router.get("/idempotency")
+def get_idempotency_stats():
+    """Get duplicate filter counters and memory use"""
+    if ingest_shards.enabled:
+        return {"shards": ingest_shards.fan_out("idempotency_service", "get_stats")}
+    return idempotency_service.get_stats()
+
+@router.get("/telemetry-ring-buffer")
+def get_telemetry_ring_buffer_stats():
+    """Get how many vehicles have a recent-telemetry ring and how often reads are served from it"""
+    stats = telemetry_ring_buffer.get_stats()
+    if ingest_shards.enabled:
+        stats["shards"] = ingest_shards.fan_out("telemetry_ring_buffer", "get_stats")
+    return stats
+
+@router.get("/telemetry-streams")
+async def get_telemetry_stream_stats():
+    """Get streaming ingest connection and batch counters"""
+    return telemetry_stream_service.get_stats()
+
+@router.get("/alert-pipeline")
+def get_alert_pipeline_stats():
+    """Get alert worker queue depths and the age of the oldest unprocessed sample"""
+    if ingest_shards.enabled:
+        return {"shards": ingest_shards.fan_out("alert_pipeline", "get_stats")}
+    return alert_pipeline.get_stats()
+
+@router.get("/alert-auto-resolve")
+def get_alert_auto_resolve_stats():
+    """Get quiet periods, tracked open alerts and the alerts most recently auto-resolved"""
+    if ingest_shards.enabled:
+        return {"shards": ingest_shards.fan_out("alert_auto_resolver", "get_stats")}
+    return alert_auto_resolver.get_stats()
+
+@router.post("/alert-auto-resolve/run", dependencies=[Depends(require_sql_storage)])
+def run_alert_auto_resolve():
+    """Resolve every alert whose quiet period has already elapsed"""
+    if ingest_shards.enabled:
+        return {"shards": ingest_shards.fan_out("alert_auto_resolver", "resolve_due")}
+    return alert_auto_resolver.resolve_due()
+
+@router.post("/alert-replays", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_sql_storage)])
+def create_alert_replay(request: AlertReplayCreate):
+    """Re-evaluate alert rules over stored telemetry in a range and rebuild its alerts in the background"""
+    return alert_replay_service.create_job(request)
+
+@router.get("/alert-replays", dependencies=[Depends(require_sql_storage)])
+def list_alert_replays():
+    """Get recent replay jobs with progress and throughput"""
+    return alert_replay_service.list_jobs()
+
+@router.get("/alert-replays/{replay_id}", dependencies=[Depends(require_sql_storage)])
+def get_alert_replay(replay_id: int):
+    return alert_replay_service.get_job(replay_id)
+
+@router.post("/alert-replays/{replay_id}/pause", dependencies=[Depends(require_sql_storage)])
+def pause_alert_replay(replay_id: int):
+    """Stop a running replay after its in-flight batches; resume continues with the remaining VINs"""
+    return alert_replay_service.pause(replay_id)
+
+@router.post("/alert-replays/{replay_id}/resume", dependencies=[Depends(require_sql_storage)])
+def resume_alert_replay(replay_id: int):
+    return alert_replay_service.resume(replay_id)
+
+@router.get("/notifications")
+def get_notification_stats():
+    """Get per-sink delivery counters and outbox depth by status"""
+    if ingest_shards.enabled:
+        return {"shards": ingest_shards.fan_out("notification_dispatcher", "get_stats")}
+    return notification_dispatcher.get_stats()
+
+@router.post("/notifications/retry-dead")
+def retry_dead_notifications(sink: Optional[str] = Query(None, description="Only requeue this sink")):
+    """Requeue notifications that exhausted their delivery attempts"""
+    if ingest_shards.enabled:
+        return {"requeued": sum(ingest_shards.fan_out("notification_dispatcher", "retry_dead", sink))}
+    return {"requeued": notification_dispatcher.retry_dead(sink)}
+
+@router.get("/vehicle-purges", dependencies=[Depends(require_sql_storage)])
+def get_vehicle_purge_status():
+    """Get queued and running vehicle purges"""
+    status_report = vehicle_purge_service.get_status()
+    if ingest_shards.enabled:
+        status_report["shards"] = ingest_shards.fan_out("vehicle_purge_service", "get_status")
+    return status_report
+
+@router.post("/analytics-rollups/rebuild", dependencies=[Depends(require_sql_storage)])
+def rebuild_analytics_rollups(days: int = Query(default=1, ge=1, le=retention_service.RAW_RETENTION_DAYS, description="Whole days back from today to recompute from raw telemetry, at most the raw retention window")):
+    """Recompute time-series rollups from raw telemetry, e.g. after upgrading a database with existing samples"""
+    if ingest_shards.enabled:
+        rows = sum(ingest_shards.fan_out("analytics_service", "rebuild_rollups", days))
+    else:
+        rows = analytics_service.rebuild_rollups(days)
+    response_cache.invalidate("analytics")
+    return {"days": days, "rollup_rows": rows}
+
+@router.get("/backups", dependencies=[Depends(require_sql_storage)])
+def get_backup_status():
+    """Get the running backup's progress, the last run's duration and the stored backups"""
+    return backup_service.get_status()
+
+@router.post("/backups/run", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_sql_storage)])
+def run_backup():
+    """Start an online backup now; progress is reported by GET /admin/backups"""
+    backup_service.request_backup()
+    return backup_service.get_status()
+
+@router.get("/memory")
+def get_memory_usage():
+    """Get approximate memory use and budget of every registered in-process component"""
+    usage = memory_accounting.get_usage()
+    if ingest_shards.enabled:
+        usage["shards"] = ingest_shards.fan_out("memory_accounting", "get_usage")
+    return usage
+
+@router.put("/memory/budgets/{component}")
+def set_memory_budget(component: str, budget: Optional[str] = Query(default=None, description="e.g. 64MB or 512KB; omit to remove the budget")):
+    """Set a component's budget; it is trimmed at once if already over it"""
+    try:
+        budget_bytes = parse_size(budget) if budget else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    result = memory_accounting.set_budget(component, budget_bytes)
+    if ingest_shards.enabled:
+        ingest_shards.fan_out("memory_accounting", "set_budget", component, budget_bytes)
+    return result
+
+@router.post("/memory/tracemalloc")
+def start_tracemalloc(frames: int = Query(default=1, ge=1, le=25, description="Stack frames kept per allocation")):
+    """Start tracing allocations in the API process and take the baseline snapshot"""
+    return memory_accounting.start_tracemalloc(frames)
+
+@router.get("/memory/tracemalloc")
+def get_tracemalloc_diff(
+    top: int = Query(default=20, ge=1, le=500),
+    reset: bool = Query(default=False, description="Make this snapshot the new baseline")
+):
+    """Top allocation changes by source line since the baseline"""
+    return memory_accounting.tracemalloc_diff(top, reset)
+
+@router.delete("/memory/tracemalloc", status_code=status.HTTP_204_NO_CONTENT)
+def stop_tracemalloc():
+    memory_accounting.stop_tracemalloc()
+
+def _require_profiling_token(x_profiling_token: Optional[str] = Header(default=None)):
+    request_profiler.authorize(x_profiling_token)
+
+# Captured profiles expose the code paths and statements behind every request
+profiles_router = APIRouter(prefix="/profiles", route_class=ProfiledRoute, dependencies=[Depends(_require_profiling_token)])
+
+@profiles_router.get("")
+def list_request_profiles():
+    """Get request profiling settings and the captured profiles, newest first"""
+    return request_profiler.get_status()
+
+@profiles_router.put("/config")
+def configure_request_profiling(
+    sample_rate: Optional[float] = Query(default=None, ge=0, le=1, description="Fraction of requests captured without a header"),
+    sampled_mode: Optional[str] = Query(default=None, description="cprofile or sample, for randomly captured requests")
+):
+    """Change random request capture; header captures need FLEET_PROFILING_TOKEN"""
+    return request_profiler.configure(sample_rate, sampled_mode)
+
+@profiles_router.get("/{profile_id}")
+def get_request_profile(profile_id: int, top: int = Query(default=30, ge=1, le=500, description="Functions listed, by cumulative time")):
+    """Get a captured request's slowest functions and per-statement database timings"""
+    return request_profiler.get_profile(profile_id, top)
+
+@profiles_router.get("/{profile_id}/download")
+def download_request_profile(profile_id: int, format: str = Query(default="pstats", description="pstats, or collapsed for flamegraph tools")):
+    """Download a captured profile as a pstats dump or as collapsed stacks"""
+    body, media_type, filename = request_profiler.export(profile_id, format)
+    return Response(content=body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@profiles_router.delete("", status_code=status.HTTP_204_NO_CONTENT)
+def clear_request_profiles():
+    request_profiler.clear()
+
+router.include_router(profiles_router)
+
+@router.get("/response-cache")
+def get_response_cache_stats():
+    """Get response cache size, hit ratio and invalidation counts"""
+    return response_cache.get_stats()
+
+@router.delete("/response-cache", status_code=status.HTTP_204_NO_CONTENT)
+def clear_response_cache():
+    response_cache.clear()
+
+@router.get("/ingest-shards")
+def get_ingest_shard_stats():
+    """Get shard processes and each shard's alert pipeline backlog"""
+    stats = ingest_shards.get_stats()
+    if ingest_shards.enabled:
+        for shard, pipeline_stats in zip(stats["shards"], ingest_shards.fan_out("alert_pipeline", "get_stats")):
+            shard["alert_pipeline"] = pipeline_stats
+    return stats
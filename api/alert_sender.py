@@ -1,19 +1,25 @@
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
+import json
+from database.storage import require_sql_storage
 from models.alert_sender import (
     ActiveAlertResponse, ActiveAlertUpdate, AlertHistoryResponse,
     ActiveAlertStatus
 )
 from services.alert_sender_service import alert_sender_service
+from services.alert_event_bus import alert_event_bus
+from services.response_cache import response_cache
+from services.request_profiler import ProfiledRoute
 
-router = APIRouter(prefix="/alert-sender", tags=["alert-sender"])
+router = APIRouter(prefix="/alert-sender", tags=["alert-sender"], route_class=ProfiledRoute)
 
-@router.get("/active-alerts", response_model=List[ActiveAlertResponse])
+@router.get("/active-alerts", response_model=List[ActiveAlertResponse], dependencies=[Depends(require_sql_storage)])
 async def get_active_alerts(status: Optional[str] = Query(None, description="Filter by status: active, resolved, acknowledged")):
     """Get all active alerts, optionally filtered by status"""
     return alert_sender_service.get_all_active_alerts(status)
 
-@router.get("/active-alerts/{alert_sender_id}", response_model=ActiveAlertResponse)
+@router.get("/active-alerts/{alert_sender_id}", response_model=ActiveAlertResponse, dependencies=[Depends(require_sql_storage)])
 async def get_active_alert(alert_sender_id: str):
     """Get a specific active alert by alert_sender_id"""
     alert = alert_sender_service.get_active_alert_by_id(
@@ -26,12 +32,15 @@ async def get_active_alert(alert_sender_id: str):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Active alert not found")
     return alert
 
-@router.get("/vehicle/{vin}/active-alerts", response_model=List[ActiveAlertResponse])
-async def get_vehicle_active_alerts(vin: str):
+@router.get("/vehicle/{vin}/active-alerts", response_model=List[ActiveAlertResponse], dependencies=[Depends(require_sql_storage)])
+async def get_vehicle_active_alerts(request: Request, vin: str):
     """Get all active alerts for a specific vehicle"""
-    return alert_sender_service.get_active_alerts_by_vehicle(vin)
+    return response_cache.respond(
+        request, response_cache.make_key("active_alerts", vin=vin), (f"alerts:{vin}",),
+        response_cache.ALERTS_TTL_SECONDS, lambda: alert_sender_service.get_active_alerts_by_vehicle(vin)
+    )
 
-@router.put("/active-alerts/{alert_sender_id}", response_model=ActiveAlertResponse)
+@router.put("/active-alerts/{alert_sender_id}", response_model=ActiveAlertResponse, dependencies=[Depends(require_sql_storage)])
 async def update_alert_status(alert_sender_id: str, update_data: ActiveAlertUpdate):
     """Update alert status (resolve, acknowledge, etc.)"""
     updated_alert = alert_sender_service.update_alert_status(alert_sender_id, update_data)
@@ -39,7 +48,7 @@ async def update_alert_status(alert_sender_id: str, update_data: ActiveAlertUpda
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Active alert not found")
     return updated_alert
 
-@router.post("/active-alerts/{alert_sender_id}/resolve")
+@router.post("/active-alerts/{alert_sender_id}/resolve", dependencies=[Depends(require_sql_storage)])
 async def resolve_alert(alert_sender_id: str, resolved_by: str = Query(..., description="Who resolved the alert")):
     """Resolve an active alert"""
     update_data = ActiveAlertUpdate(status=ActiveAlertStatus.RESOLVED, resolved_by=resolved_by)
@@ -48,7 +57,7 @@ async def resolve_alert(alert_sender_id: str, resolved_by: str = Query(..., desc
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Active alert not found")
     return {"message": "Alert resolved successfully", "alert": updated_alert}
 
-@router.post("/active-alerts/{alert_sender_id}/acknowledge")
+@router.post("/active-alerts/{alert_sender_id}/acknowledge", dependencies=[Depends(require_sql_storage)])
 async def acknowledge_alert(alert_sender_id: str, acknowledged_by: str = Query(..., description="Who acknowledged the alert")):
     """Acknowledge an active alert"""
     update_data = ActiveAlertUpdate(status=ActiveAlertStatus.ACKNOWLEDGED, resolved_by=acknowledged_by)
@@ -57,15 +66,19 @@ async def acknowledge_alert(alert_sender_id: str, acknowledged_by: str = Query(.
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Active alert not found")
     return {"message": "Alert acknowledged successfully", "alert": updated_alert}
 
-@router.get("/active-alerts/{alert_sender_id}/history", response_model=AlertHistoryResponse)
-async def get_alert_history(alert_sender_id: str):
-    """Get complete alert history including all related raw alerts"""
-    history = alert_sender_service.get_alert_history(alert_sender_id)
+@router.get("/active-alerts/{alert_sender_id}/history", response_model=AlertHistoryResponse, dependencies=[Depends(require_sql_storage)])
+async def get_alert_history(
+    alert_sender_id: str,
+    limit: int = Query(default=100, ge=1, le=1000),
+    before_id: Optional[int] = Query(default=None, description="Return raw alerts older than this raw alert id (next_before_id of the previous page)")
+):
+    """Get an alert with one page of its related raw alerts, newest first"""
+    history = alert_sender_service.get_alert_history(alert_sender_id, limit, before_id)
     if not history:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alert history not found")
     return history
 
-@router.get("/dashboard/summary")
+@router.get("/dashboard/summary", dependencies=[Depends(require_sql_storage)])
 async def get_alert_dashboard():
     """Get alert dashboard summary"""
     active_alerts = alert_sender_service.get_all_active_alerts("active")
@@ -92,3 +105,33 @@ async def get_alert_dashboard():
         "alerts_by_type": type_counts,
         "recent_active_alerts": active_alerts[:10]  
     }
+
+@router.get("/stream")
+async def stream_alert_events(
+    request: Request,
+    fleet_id: Optional[str] = Query(None, description="Only events for vehicles in this fleet"),
+    vin: Optional[str] = Query(None, description="Only events for this vehicle"),
+    alert_type: Optional[str] = Query(None, description="Only events of this alert type"),
+    severity: Optional[str] = Query(None, description="Only events with this severity")
+):
+    """Server-Sent Events feed of active alert created/updated/resolved/acknowledged events"""
+    subscription = alert_event_bus.subscribe(fleet_id, vin, alert_type, severity)
+
+    async def event_stream():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                events = await subscription.next_events(timeout=15)
+                if not events:
+                    yield ": keepalive\n\n"
+                for event in events:
+                    yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/stream/stats")
+async def get_alert_stream_stats():
+    """Get alert event fan-out counters per subscriber"""
+    return alert_event_bus.get_stats()
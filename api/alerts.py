@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from typing import List
 from models.alert import AlertResponse
+from database.storage import require_sql_storage
 from services.alert_service import alert_service
+from services.response_cache import response_cache
+from services.request_profiler import ProfiledRoute
 
-router = APIRouter(prefix="/alerts", tags=["alerts"])
+router = APIRouter(prefix="/alerts", tags=["alerts"], route_class=ProfiledRoute, dependencies=[Depends(require_sql_storage)])
 
 @router.get("/", response_model=List[AlertResponse])
 async def get_all_alerts():
@@ -17,5 +20,8 @@ async def get_alert(alert_id: str):
     return alert
 
 @router.get("/vehicle/{vin}", response_model=List[AlertResponse])
-async def get_alerts_by_vin(vin: str):
-    return alert_service.get_alerts_by_vin(vin)
+async def get_alerts_by_vin(request: Request, vin: str):
+    return response_cache.respond(
+        request, response_cache.make_key("alerts", vin=vin), (f"alerts:{vin}",),
+        response_cache.ALERTS_TTL_SECONDS, lambda: alert_service.get_alerts_by_vin(vin)
+    )
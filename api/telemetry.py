@@ -1,17 +1,91 @@
-from fastapi import APIRouter, HTTPException, status, Query
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
+from datetime import datetime
+import asyncio
+import math
+from database.storage import require_sql_storage
 from models.telemetry import TelemetryCreate, TelemetryResponse
 from services.telemetry_service import telemetry_service
+from services.telemetry_stream_service import telemetry_stream_service
+from services.admission_service import admission_controller
+from services.request_profiler import ProfiledRoute
 
-router = APIRouter(prefix="/telemetry", tags=["telemetry"])
+router = APIRouter(prefix="/telemetry", tags=["telemetry"], route_class=ProfiledRoute)
 
+def _retry_after(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+# Ingest endpoints are plain functions: a full alert pipeline makes ingest wait,
+# and that wait must happen on a worker thread, not the event loop
 @router.post("/", response_model=TelemetryResponse, status_code=status.HTTP_201_CREATED)
-async def receive_telemetry(telemetry_data: TelemetryCreate):
+def receive_telemetry(telemetry_data: TelemetryCreate):
+    retry_after = admission_controller.admit([telemetry_data.vehicle_vin])[0]
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Telemetry rate limit exceeded for VIN {telemetry_data.vehicle_vin}",
+            headers={"Retry-After": _retry_after(retry_after)}
+        )
     return telemetry_service.receive_telemetry(telemetry_data)
 
 @router.post("/batch", response_model=List[TelemetryResponse], status_code=status.HTTP_201_CREATED)
-async def receive_multiple_telemetry(telemetry_list: List[TelemetryCreate]):
-    return telemetry_service.receive_multiple_telemetry(telemetry_list)
+def receive_multiple_telemetry(telemetry_list: List[TelemetryCreate], response: Response):
+    decisions = admission_controller.admit([t.vehicle_vin for t in telemetry_list])
+    admitted = [t for t, retry_after in zip(telemetry_list, decisions) if retry_after is None]
+    throttled = [retry_after for retry_after in decisions if retry_after is not None]
+    if throttled:
+        if not admitted:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Telemetry rate limit exceeded for every sample in the batch",
+                headers={"Retry-After": _retry_after(min(throttled))}
+            )
+        # Partially admitted batches are stored; the header tells the client how many were dropped
+        response.headers["X-Telemetry-Throttled"] = str(len(throttled))
+        response.headers["Retry-After"] = _retry_after(min(throttled))
+    return telemetry_service.receive_multiple_telemetry(admitted)
+
+@router.post("/binary", status_code=status.HTTP_201_CREATED)
+async def receive_binary_telemetry(request: Request):
+    """Bulk ingest of a binary column-major telemetry batch (see services.telemetry_codec)"""
+    payload = await request.body()
+    return await run_in_threadpool(telemetry_service.receive_binary_batch, payload)
+
+@router.websocket("/stream")
+async def stream_telemetry(websocket: WebSocket):
+    """Streaming ingest: JSON-lines text or binary batch frames in, per-seq acks with credits out.
+
+    A client that sends more samples than its outstanding credit is closed with 1008.
+    """
+    await websocket.accept()
+    session = telemetry_stream_service.open_session()
+    try:
+        await websocket.send_json(telemetry_stream_service.initial_credit())
+        while True:
+            try:
+                message = await asyncio.wait_for(websocket.receive(), session.time_until_flush())
+            except asyncio.TimeoutError:
+                message = None
+            if message:
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("text"):
+                    session.add_text_frame(message["text"])
+                elif message.get("bytes"):
+                    session.add_binary_frame(message["bytes"])
+                if session.credit_exceeded:
+                    await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Sent more samples than granted credits")
+                    break
+            if session.should_flush():
+                await websocket.send_json(await run_in_threadpool(session.flush))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Samples already received are stored even if the client went away before its ack
+        if session.pending:
+            await run_in_threadpool(session.flush)
+        telemetry_stream_service.close_session(session)
 
 @router.get("/{vin}/latest", response_model=TelemetryResponse)
 async def get_latest_telemetry(vin: str):
@@ -23,3 +97,7 @@ async def get_latest_telemetry(vin: str):
 @router.get("/{vin}/history", response_model=List[TelemetryResponse])
 async def get_telemetry_history(vin: str, limit: int = Query(default=100, ge=1, le=1000)):
     return telemetry_service.get_telemetry_history(vin, limit)
+
+@router.get("/{vin}/export", response_model=List[TelemetryResponse], dependencies=[Depends(require_sql_storage)])
+async def export_telemetry(vin: str, start: Optional[datetime] = Query(default=None), end: Optional[datetime] = Query(default=None)):
+    return telemetry_service.export_telemetry(vin, start, end)
@@ -1,30 +1,80 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
+import anyio
+from database.storage import require_sql_storage
 from models.vehicle import Vehicle, VehicleCreate, VehicleResponse
 from services.vehicle_service import vehicle_service
+from services.vehicle_import_service import vehicle_import_service, ImportFormat, ImportConflictMode
+from services.vehicle_purge_service import vehicle_purge_service
+from services.ingest_shards import ingest_shards
+from services.response_cache import response_cache
+from services.request_profiler import ProfiledRoute
 
-router = APIRouter(prefix="/vehicles", tags=["vehicles"])
+router = APIRouter(prefix="/vehicles", tags=["vehicles"], route_class=ProfiledRoute)
 
 @router.post("/", response_model=VehicleResponse, status_code=status.HTTP_201_CREATED)
 async def create_vehicle(vehicle_data: VehicleCreate):
     return vehicle_service.create_vehicle(vehicle_data)
 
+@router.post("/import", dependencies=[Depends(require_sql_storage)])
+async def import_vehicles(
+    request: Request,
+    format: Optional[ImportFormat] = Query(default=None, description="csv or ndjson; inferred from Content-Type when omitted"),
+    on_conflict: ImportConflictMode = Query(default=ImportConflictMode.SKIP, description="skip: report registered VINs as errors; update_status: update their registration_status")
+):
+    """Bulk-register vehicles from a CSV or NDJSON body and return a per-row error report"""
+    import_format = format or (ImportFormat.CSV if "csv" in request.headers.get("content-type", "") else ImportFormat.NDJSON)
+    body = request.stream().__aiter__()
+    
+    def body_chunks():
+        # Pulls the request body from the event loop while the import runs in a worker thread
+        while True:
+            try:
+                yield anyio.from_thread.run(body.__anext__)
+            except StopAsyncIteration:
+                return
+    
+    return await run_in_threadpool(vehicle_import_service.import_vehicles, body_chunks(), import_format, on_conflict)
+
 @router.get("/", response_model=List[VehicleResponse])
-async def list_vehicles():
-    return vehicle_service.get_all_vehicles()
+async def list_vehicles(request: Request):
+    return response_cache.respond(
+        request, response_cache.make_key("vehicles"), ("vehicles",),
+        response_cache.REGISTRY_TTL_SECONDS, vehicle_service.get_all_vehicles
+    )
 
 @router.get("/{vin}", response_model=VehicleResponse)
-async def get_vehicle(vin: str):
-    vehicle = vehicle_service.get_vehicle(vin)
-    if not vehicle:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vehicle not found")
-    return vehicle
+async def get_vehicle(request: Request, vin: str):
+    def load():
+        vehicle = vehicle_service.get_vehicle(vin)
+        if not vehicle:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vehicle not found")
+        return vehicle
+    return response_cache.respond(
+        request, response_cache.make_key("vehicle", vin=vin), (f"vehicle:{vin}",),
+        response_cache.REGISTRY_TTL_SECONDS, load
+    )
 
 @router.delete("/{vin}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_vehicle(vin: str):
     if not vehicle_service.delete_vehicle(vin):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vehicle not found")
 
+@router.get("/{vin}/purge", dependencies=[Depends(require_sql_storage)])
+async def get_vehicle_purge_progress(vin: str):
+    """Progress of the background removal of a deleted vehicle's telemetry and alerts"""
+    progress = vehicle_purge_service.get_progress(vin)
+    if not progress:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No purge found for vehicle")
+    if ingest_shards.enabled:
+        # Telemetry and alerts live in the owning shard's database
+        progress["shard"] = ingest_shards.call_for_vin(vin, "vehicle_purge_service", "get_progress", vin)
+    return progress
+
 @router.get("/fleet/{fleet_id}", response_model=List[VehicleResponse])
-async def get_vehicles_by_fleet(fleet_id: str):
-    return vehicle_service.get_vehicles_by_fleet(fleet_id)
+async def get_vehicles_by_fleet(request: Request, fleet_id: str):
+    return response_cache.respond(
+        request, response_cache.make_key("fleet_vehicles", fleet_id=fleet_id), (f"fleet:{fleet_id}",),
+        response_cache.REGISTRY_TTL_SECONDS, lambda: vehicle_service.get_vehicles_by_fleet(fleet_id)
+    )
@@ -0,0 +1,103 @@
+"""Compare per-sample decode cost of the JSON and binary telemetry ingest formats,
+then the write and read cost of each storage engine. That the engines behave
+alike is checked by tests/test_storage_conformance.py.
+
+Run from the repository root:  python -m benchmarks.telemetry_ingest_benchmark
+"""
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+from pydantic import TypeAdapter
+from database import connectDB
+from database.storage import STORAGE_ENGINES, StorageBackend, create_storage
+from database.telemetry_partitions import telemetry_partitions
+from models.telemetry import TelemetryCreate
+from models.vehicle import VehicleCreate
+from services.telemetry_codec import encode_telemetry_batch, decode_telemetry_batch, columns_to_samples
+
+BATCH_SIZE = 5000
+ROUNDS = 5
+VEHICLES = 200
+STORAGE_BATCHES = 20
+
+def make_samples(count: int) -> List[TelemetryCreate]:
+    engine_states = ["On", "Off", "Idle"]
+    return [
+        TelemetryCreate(
+            vehicle_vin=f"VIN{i % 200:014d}",
+            latitude=random.uniform(-90, 90),
+            longitude=random.uniform(-180, 180),
+            speed=random.uniform(0, 140),
+            engine_status=random.choice(engine_states),
+            fuel_battery_level=random.uniform(0, 100),
+            odometer_reading=random.uniform(0, 300000),
+        )
+        for i in range(count)
+    ]
+
+def best_of(rounds: int, fn) -> float:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def fresh_storage(engine: str) -> StorageBackend:
+    if engine == "sqlite":
+        # A new database file per run, so every engine starts empty
+        connectDB.DB_FILE = os.path.join(tempfile.mkdtemp(prefix="storage-benchmark-"), "fleet.db")
+        connectDB.create_database_schema()
+        telemetry_partitions.refresh()
+    return create_storage(engine)
+
+def register_vehicles(storage: StorageBackend):
+    for i in range(VEHICLES):
+        storage.insert_vehicle(VehicleCreate(
+            vin=f"VIN{i:014d}", manufacturer="Make", model="Model", fleet_id=f"FLEET{i % 4}", owner_operator="Owner"
+        ))
+
+def run_storage():
+    samples = make_samples(BATCH_SIZE)
+    vins = sorted({sample.vehicle_vin for sample in samples})
+    for engine in STORAGE_ENGINES:
+        storage = fresh_storage(engine)
+        register_vehicles(storage)
+        received_at = datetime.utcnow().replace(microsecond=0)
+        started = time.perf_counter()
+        for batch in range(STORAGE_BATCHES):
+            storage.append_telemetry(samples, received_at + timedelta(seconds=batch))
+        append_seconds = time.perf_counter() - started
+        latest_seconds = best_of(ROUNDS, lambda: [storage.recent_telemetry(vin, 1) for vin in vins]) / len(vins)
+        history_seconds = best_of(ROUNDS, lambda: [storage.recent_telemetry(vin, 100) for vin in vins]) / len(vins)
+        aggregate_seconds = best_of(ROUNDS, lambda: storage.fleet_aggregates(received_at - timedelta(hours=24)))
+        print(f"{engine:>7}: append {STORAGE_BATCHES * BATCH_SIZE / append_seconds:10,.0f} samples/s  "
+              f"latest {latest_seconds * 1e6:8.1f} us  history(100) {history_seconds * 1e6:8.1f} us  "
+              f"fleet aggregates {aggregate_seconds * 1e3:8.1f} ms")
+
+def run():
+    samples = make_samples(BATCH_SIZE)
+    json_payload = json.dumps([s.model_dump(mode="json", exclude_none=True) for s in samples]).encode()
+    binary_payload = encode_telemetry_batch(samples)
+    adapter = TypeAdapter(List[TelemetryCreate])
+
+    def decode_json():
+        adapter.validate_json(json_payload)
+
+    def decode_binary():
+        columns_to_samples(*decode_telemetry_batch(binary_payload))
+
+    results = {"json": best_of(ROUNDS, decode_json), "binary": best_of(ROUNDS, decode_binary)}
+    sizes = {"json": len(json_payload), "binary": len(binary_payload)}
+    for name, seconds in results.items():
+        print(f"{name:>7}: {seconds * 1e6 / BATCH_SIZE:8.2f} us/sample  "
+              f"{BATCH_SIZE / seconds:12,.0f} samples/s  {sizes[name] / BATCH_SIZE:6.1f} bytes/sample")
+    print(f"speedup: {results['json'] / results['binary']:.1f}x")
+
+if __name__ == "__main__":
+    run()
+    run_storage()
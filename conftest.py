@@ -0,0 +1,13 @@
+import pytest
+from database import connectDB
+from database.telemetry_partitions import telemetry_partitions
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """A fresh application database in tmp_path, used by everything that calls get_db_connection()"""
+    monkeypatch.setattr(connectDB, "DB_FILE", str(tmp_path / "fleet_management.db"))
+    connectDB.init_database()
+    telemetry_partitions.refresh()
+    yield connectDB.DB_FILE
+    # The cached partition list belongs to the temporary database
+    telemetry_partitions._days = None
@@ -1,11 +1,16 @@
 import sqlite3
 import os
+import time
 from contextlib import contextmanager
-from typing import Generator
+from contextvars import ContextVar
+from typing import Callable, Generator, Optional
 
 # Database file path
 DB_FILE = "fleet_management.db"
 
+# Matches SQLite's CURRENT_TIMESTAMP so stored and computed timestamps compare as strings
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
 def create_database_schema():
     schema_queries = [
         # Vehicles table
@@ -18,7 +23,8 @@ def create_database_schema():
             fleet_id TEXT NOT NULL,
             owner_operator TEXT NOT NULL,
             registration_status TEXT CHECK(registration_status IN ('Active', 'Maintenance', 'Decommissioned')) DEFAULT 'Active',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            deleted_at TIMESTAMP NULL
         )
         """,
         
@@ -26,7 +32,7 @@ def create_database_schema():
         "CREATE INDEX IF NOT EXISTS idx_vehicles_vin ON vehicles(vin)",
         "CREATE INDEX IF NOT EXISTS idx_vehicles_fleet_id ON vehicles(fleet_id)",
         
-        # Telemetry data table
+        # Legacy telemetry table; new samples go to per-day partitions (see telemetry_partitions)
         """
         CREATE TABLE IF NOT EXISTS telemetry_data (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -46,6 +52,63 @@ def create_database_schema():
         # Indexes for telemetry_data table
         "CREATE INDEX IF NOT EXISTS idx_telemetry_vehicle_vin ON telemetry_data(vehicle_vin)",
         "CREATE INDEX IF NOT EXISTS idx_telemetry_timestamp ON telemetry_data(timestamp)",
+
+        # Per-minute downsampled telemetry kept after raw rows leave the hot table
+        """
+        CREATE TABLE IF NOT EXISTS telemetry_minute_aggregates (
+            vehicle_vin TEXT NOT NULL,
+            bucket_start TIMESTAMP NOT NULL,
+            sample_count INTEGER NOT NULL,
+            avg_speed REAL NOT NULL,
+            max_speed REAL NOT NULL,
+            avg_fuel_battery_level REAL NOT NULL,
+            min_fuel_battery_level REAL NOT NULL,
+            min_odometer_reading REAL NOT NULL,
+            max_odometer_reading REAL NOT NULL,
+            PRIMARY KEY (vehicle_vin, bucket_start),
+            FOREIGN KEY (vehicle_vin) REFERENCES vehicles (vin) ON DELETE CASCADE
+        )
+        """,
+
+        "CREATE INDEX IF NOT EXISTS idx_telemetry_minute_bucket ON telemetry_minute_aggregates(bucket_start)",
+
+        # Raw sources already merged into telemetry_minute_aggregates, so retention re-runs skip them
+        """
+        CREATE TABLE IF NOT EXISTS telemetry_downsampled_days (
+            day TEXT NOT NULL,
+            source_table TEXT NOT NULL,
+            downsampled_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (day, source_table)
+        )
+        """,
+
+        # Additive per-vehicle totals at fixed resolutions for time-series analytics (see telemetry_rollups)
+        """
+        CREATE TABLE IF NOT EXISTS telemetry_rollups (
+            resolution INTEGER NOT NULL,
+            vehicle_vin TEXT NOT NULL,
+            bucket_start INTEGER NOT NULL,
+            sample_count INTEGER NOT NULL DEFAULT 0,
+            fuel_sum REAL NOT NULL DEFAULT 0,
+            min_odometer_reading REAL NULL,
+            max_odometer_reading REAL NULL,
+            alert_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (resolution, vehicle_vin, bucket_start)
+        ) WITHOUT ROWID
+        """,
+
+        "CREATE INDEX IF NOT EXISTS idx_telemetry_rollups_bucket ON telemetry_rollups(resolution, bucket_start)",
+
+        # Idempotency keys of recently ingested samples; the primary key confirms duplicates
+        """
+        CREATE TABLE IF NOT EXISTS telemetry_ingest_keys (
+            ingest_key TEXT PRIMARY KEY,
+            telemetry_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL
+        )
+        """,
+
+        "CREATE INDEX IF NOT EXISTS idx_telemetry_ingest_keys_created ON telemetry_ingest_keys(created_at)",
         
         # Alerts table
         """
@@ -84,6 +147,7 @@ def create_database_schema():
             resolved_at TIMESTAMP NULL,
             resolved_by TEXT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            related_alerts_count INTEGER DEFAULT 0,
             FOREIGN KEY (vehicle_vin) REFERENCES vehicles (vin) ON DELETE CASCADE
         )
         """,
@@ -92,6 +156,16 @@ def create_database_schema():
         "CREATE INDEX IF NOT EXISTS idx_active_alerts_vehicle_vin ON active_alerts(vehicle_vin)",
         "CREATE INDEX IF NOT EXISTS idx_active_alerts_status ON active_alerts(status)",
         "CREATE INDEX IF NOT EXISTS idx_active_alerts_type ON active_alerts(alert_type)",
+        
+        # At most one open alert per (vehicle, type); older duplicates from before the index are closed first
+        """
+        UPDATE active_alerts
+        SET status = 'resolved', resolved_at = CURRENT_TIMESTAMP, resolved_by = 'system:dedup'
+        WHERE status = 'active' AND id NOT IN (
+            SELECT MAX(id) FROM active_alerts WHERE status = 'active' GROUP BY vehicle_vin, alert_type
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_active_alerts_open ON active_alerts(vehicle_vin, alert_type) WHERE status = 'active'",
 
         """
         CREATE TABLE IF NOT EXISTS alert_relationships (
@@ -105,14 +179,104 @@ def create_database_schema():
         )
         """,
         
-        "CREATE INDEX IF NOT EXISTS idx_alert_relationships_active ON alert_relationships(active_alert_id)",
-        "CREATE INDEX IF NOT EXISTS idx_alert_relationships_raw ON alert_relationships(raw_alert_id)"
+        # UNIQUE(active_alert_id, raw_alert_id) already indexes history pages, so a separate active_alert_id index only costs writes
+        "DROP INDEX IF EXISTS idx_alert_relationships_active",
+        "CREATE INDEX IF NOT EXISTS idx_alert_relationships_raw ON alert_relationships(raw_alert_id)",
+        
+        # Deleted vehicles whose rows are still being removed in the background
+        """
+        CREATE TABLE IF NOT EXISTS vehicle_purges (
+            vin TEXT PRIMARY KEY,
+            status TEXT CHECK(status IN ('pending', 'running', 'completed')) DEFAULT 'pending',
+            phase TEXT NULL,
+            rows_deleted INTEGER DEFAULT 0,
+            requested_at TIMESTAMP NOT NULL,
+            started_at TIMESTAMP NULL,
+            completed_at TIMESTAMP NULL
+        )
+        """,
+        
+        # Re-evaluation of alert rules over stored telemetry, resumable per VIN
+        """
+        CREATE TABLE IF NOT EXISTS alert_replays (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            range_start TIMESTAMP NOT NULL,
+            range_end TIMESTAMP NOT NULL,
+            speed_limit REAL NOT NULL,
+            low_fuel_threshold REAL NOT NULL,
+            workers INTEGER NOT NULL,
+            status TEXT CHECK(status IN ('pending', 'running', 'paused', 'completed', 'failed')) DEFAULT 'pending',
+            total_vins INTEGER DEFAULT 0,
+            completed_vins INTEGER DEFAULT 0,
+            samples_processed INTEGER DEFAULT 0,
+            alerts_created INTEGER DEFAULT 0,
+            active_alerts_created INTEGER DEFAULT 0,
+            run_seconds REAL DEFAULT 0,
+            error TEXT NULL,
+            created_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP NULL
+        )
+        """,
+        
+        """
+        CREATE TABLE IF NOT EXISTS alert_replay_vins (
+            replay_id INTEGER NOT NULL,
+            db_file TEXT NOT NULL,
+            vehicle_vin TEXT NOT NULL,
+            samples INTEGER NULL,
+            alerts INTEGER NULL,
+            completed_at TIMESTAMP NULL,
+            PRIMARY KEY (replay_id, db_file, vehicle_vin),
+            FOREIGN KEY (replay_id) REFERENCES alert_replays (id) ON DELETE CASCADE
+        )
+        """,
+        
+        # Outbound alert notifications, one row per (sink, alert) until delivered
+        """
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sink TEXT NOT NULL,
+            alert_sender_id TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT CHECK(status IN ('pending', 'sending', 'delivered', 'dead')) DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL,
+            last_error TEXT NULL,
+            created_at TIMESTAMP NOT NULL,
+            delivered_at TIMESTAMP NULL
+        )
+        """,
+        
+        "CREATE INDEX IF NOT EXISTS idx_notification_outbox_due ON notification_outbox(sink, status, next_attempt_at)",
+        "CREATE INDEX IF NOT EXISTS idx_notification_outbox_alert ON notification_outbox(alert_sender_id)",
+        # Lets a new event for an alert coalesce into its still-queued notification
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_notification_outbox_pending ON notification_outbox(sink, alert_sender_id) WHERE status = 'pending'"
+    ]
+    
+    # Columns added after the table was first created; CREATE TABLE IF NOT EXISTS leaves old tables alone.
+    # The optional query fills the new column for existing rows.
+    added_columns = [
+        ("vehicles", "deleted_at", "TIMESTAMP NULL", None),
+        ("active_alerts", "related_alerts_count", "INTEGER DEFAULT 0", """
+            UPDATE active_alerts SET related_alerts_count = (
+                SELECT COUNT(*) FROM alert_relationships ar WHERE ar.active_alert_id = active_alerts.id
+            )
+        """),
     ]
     
     with sqlite3.connect(DB_FILE) as conn:
+        # Persistent; readers (including online backups) no longer block writers
+        conn.execute("PRAGMA journal_mode = WAL")
         conn.execute("PRAGMA foreign_keys = ON")
         for query in schema_queries:
             conn.execute(query)
+        for table, column, definition, backfill in added_columns:
+            if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                if backfill:
+                    conn.execute(backfill)
         conn.commit()
     
     print(f"Database initialized at: {os.path.abspath(DB_FILE)}")
@@ -123,10 +287,86 @@ def get_db_path() -> str:
 def init_database():
     create_database_schema()
 
+# Set by the request profiler while it captures a request; called with (sql, seconds, executed)
+# for every execute (executed=True) and every fetch of an executed statement's rows
+statement_observer: ContextVar[Optional[Callable[[str, float, bool], None]]] = ContextVar("statement_observer", default=None)
+
+class _TimedCursor(sqlite3.Cursor):
+    """Reports each statement's execute plus fetch time to the connection's observer"""
+
+    def _observe(self, sql: str, started: float, executed: bool = False):
+        self.connection.observer(sql, time.perf_counter() - started, executed)
+
+    def execute(self, sql, parameters=()):
+        self._sql, started = sql, time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._observe(sql, started, True)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql, started = sql, time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._observe(sql, started, True)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._observe(self._sql, started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(size if size is not None else self.arraysize)
+        finally:
+            self._observe(self._sql, started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._observe(self._sql, started)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            self._observe(self._sql, started)
+
+class _TimedConnection(sqlite3.Connection):
+    observer: Callable[[str, float, bool], None]
+
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            self.observer("COMMIT", time.perf_counter() - started, True)
+
 @contextmanager
-def get_db_connection() -> Generator[sqlite3.Connection, None, None]:
-    """Context manager for database connections"""
-    conn = sqlite3.connect(DB_FILE)
+def get_db_connection(db_file: Optional[str] = None) -> Generator[sqlite3.Connection, None, None]:
+    """Context manager for database connections; db_file addresses another database such as a shard's"""
+    observer = statement_observer.get()
+    if observer is None:
+        conn = sqlite3.connect(db_file or DB_FILE)
+    else:
+        conn = sqlite3.connect(db_file or DB_FILE, factory=_TimedConnection)
+        conn.observer = observer
     conn.row_factory = sqlite3.Row  # Enable dict-like access to rows
     conn.execute("PRAGMA foreign_keys = ON")  # Enable foreign key constraints
     try:
@@ -0,0 +1,629 @@
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Any, ContextManager, Dict, Iterable, List, Optional
+from database.connectDB import execute_query, execute_insert, execute_update, get_db_connection, TIMESTAMP_FORMAT
+from database.telemetry_partitions import telemetry_partitions
+from database.telemetry_rollups import telemetry_rollups
+from models.telemetry import TelemetryCreate
+from models.vehicle import VehicleCreate
+
+class StorageBackend(ABC):
+    """The data access the services perform, independent of the engine holding the data.
+
+    Rows are plain dicts shaped like the SQLite tables' rows, so the services
+    map them to models the same way whichever engine produced them.
+    Timestamps are naive UTC strings in TIMESTAMP_FORMAT.
+    """
+    name = "abstract"
+    # Replay, purge, retention, import, export, backups and the alert read
+    # endpoints query the SQLite tables directly; see require_sql_storage
+    sql_backed = False
+
+    # Vehicles
+    @abstractmethod
+    def insert_vehicle(self, vehicle: VehicleCreate) -> dict: ...
+
+    @abstractmethod
+    def get_vehicle(self, vin: str, include_deleted: bool = False) -> Optional[dict]: ...
+
+    @abstractmethod
+    def get_vehicle_by_id(self, vehicle_id: int) -> Optional[dict]: ...
+
+    @abstractmethod
+    def get_vehicles_by_vins(self, vins: Iterable[str]) -> Dict[str, dict]: ...
+
+    @abstractmethod
+    def list_vehicles(self, fleet_id: Optional[str] = None) -> List[dict]:
+        """Registered vehicles, newest first"""
+
+    @abstractmethod
+    def count_vehicles(self) -> int: ...
+
+    @abstractmethod
+    def upsert_vehicles(self, vehicles: List[dict]): ...
+
+    @abstractmethod
+    def mark_vehicle_deleted(self, vin: str, deleted_at: datetime) -> Optional[str]:
+        """Hide a registered vehicle; its fleet id, or None if it was not registered"""
+
+    # Telemetry
+    @abstractmethod
+    def telemetry_writer(self, received_at: datetime) -> ContextManager["TelemetryWriter"]:
+        """One write of samples received at received_at; the rollups are added and it commits when the block exits.
+
+        Callers pass only samples of registered vehicles.
+        """
+
+    def append_telemetry(self, samples: List[TelemetryCreate], received_at: datetime) -> List[dict]:
+        """Store samples of registered vehicles in one write; the stored rows, in input order"""
+        registered = self.get_vehicles_by_vins({sample.vehicle_vin for sample in samples})
+        with self.telemetry_writer(received_at) as writer:
+            return [writer.append(sample) for sample in samples if sample.vehicle_vin in registered]
+
+    @abstractmethod
+    def recent_telemetry(self, vin: str, limit: int) -> List[dict]:
+        """A vehicle's newest samples, newest first"""
+
+    @abstractmethod
+    def get_telemetry(self, telemetry_id: int) -> Optional[dict]:
+        """A stored sample by id; None once retention has dropped it"""
+
+    # Ingest keys
+    @abstractmethod
+    def get_ingest_key(self, ingest_key: str) -> Optional[int]:
+        """Id of the sample that claimed the key, if it is still held"""
+
+    @abstractmethod
+    def ingest_keys_since(self, since: datetime) -> List[str]: ...
+
+    @abstractmethod
+    def prune_ingest_keys(self, before: datetime) -> int:
+        """Release keys claimed before `before`; the number released"""
+
+    # Alerts
+    @abstractmethod
+    def insert_alert(self, vin: str, alert_type: str, severity: str, message: str, timestamp: datetime) -> dict: ...
+
+    @abstractmethod
+    def record_active_alert(self, raw_alert: dict, title: str, description: str) -> dict:
+        """Open an active alert for the raw alert's (vin, type) or bump the open one, and link the raw alert to it.
+
+        Returns the alert's id, alert_sender_id, alert_type and last_occurrence, and whether it was just opened.
+        """
+
+    @abstractmethod
+    def get_active_alert(self, active_alert_id: int) -> Optional[dict]: ...
+
+    # Analytics
+    @abstractmethod
+    def fleet_aggregates(self, since: datetime) -> Dict[str, Any]:
+        """Telemetry totals after `since` and alert counts, in get_fleet_analytics_partials' shape"""
+
+
+class TelemetryWriter(ABC):
+    @abstractmethod
+    def append(self, sample: TelemetryCreate, ingest_key: Optional[str] = None, replace_key: bool = False) -> Optional[dict]:
+        """Store a sample and claim its ingest key; the stored row, or None if the key was already claimed.
+
+        replace_key takes over a claimed key, for one whose sample is no longer stored.
+        """
+
+
+class _SQLiteTelemetryWriter(TelemetryWriter):
+    def __init__(self, conn, received_at: datetime):
+        self.conn = conn
+        self.timestamp_str = received_at.strftime(TIMESTAMP_FORMAT)
+        self.partition, self.partition_day = telemetry_partitions.partition_for_write(received_at)
+        self.query = f"""
+            INSERT INTO {self.partition}
+            (vehicle_vin, latitude, longitude, speed, engine_status, fuel_battery_level,
+            odometer_reading, diagnostic_codes, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        self.stored: List[TelemetryCreate] = []
+
+    def append(self, sample: TelemetryCreate, ingest_key: Optional[str] = None, replace_key: bool = False) -> Optional[dict]:
+        row = _telemetry_row(sample, self.timestamp_str)
+        local_id = self.conn.execute(self.query, tuple(row.values())).lastrowid
+        telemetry_id = telemetry_partitions.to_global_id(self.partition_day, local_id)
+        if ingest_key:
+            cursor = self.conn.execute(
+                f"INSERT OR {'REPLACE' if replace_key else 'IGNORE'} INTO telemetry_ingest_keys (ingest_key, telemetry_id, created_at) VALUES (?, ?, ?)",
+                (ingest_key, telemetry_id, self.timestamp_str)
+            )
+            if cursor.rowcount == 0:
+                self.conn.execute(f"DELETE FROM {self.partition} WHERE id = ?", (local_id,))
+                return None
+        self.stored.append(sample)
+        return {'id': telemetry_id, **row}
+
+
+class SQLiteStorage(StorageBackend):
+    """The application's database: day-partitioned telemetry with rollups written in the same transaction"""
+    name = "sqlite"
+    sql_backed = True
+
+    def insert_vehicle(self, vehicle: VehicleCreate) -> dict:
+        vehicle_id = execute_insert("""
+            INSERT INTO vehicles (vin, manufacturer, model, fleet_id, owner_operator, registration_status)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (vehicle.vin, vehicle.manufacturer, vehicle.model, vehicle.fleet_id,
+              vehicle.owner_operator, vehicle.registration_status.value))
+        return self.get_vehicle_by_id(vehicle_id)
+
+    def get_vehicle(self, vin: str, include_deleted: bool = False) -> Optional[dict]:
+        query = "SELECT * FROM vehicles WHERE vin = ?" + ("" if include_deleted else " AND deleted_at IS NULL")
+        results = execute_query(query, (vin,))
+        return results[0] if results else None
+
+    def get_vehicle_by_id(self, vehicle_id: int) -> Optional[dict]:
+        results = execute_query("SELECT * FROM vehicles WHERE id = ?", (vehicle_id,))
+        return results[0] if results else None
+
+    def get_vehicles_by_vins(self, vins: Iterable[str]) -> Dict[str, dict]:
+        vins = list(vins)
+        vehicles = {}
+        # Chunked to stay under SQLite's bound parameter limit
+        for i in range(0, len(vins), 500):
+            chunk = vins[i:i + 500]
+            query = f"SELECT * FROM vehicles WHERE vin IN ({', '.join('?' for _ in chunk)}) AND deleted_at IS NULL"
+            for row in execute_query(query, tuple(chunk)):
+                vehicles[row['vin']] = row
+        return vehicles
+
+    def list_vehicles(self, fleet_id: Optional[str] = None) -> List[dict]:
+        if fleet_id is not None:
+            return execute_query(
+                "SELECT * FROM vehicles WHERE fleet_id = ? AND deleted_at IS NULL ORDER BY created_at DESC, id DESC",
+                (fleet_id,)
+            )
+        return execute_query("SELECT * FROM vehicles WHERE deleted_at IS NULL ORDER BY created_at DESC, id DESC")
+
+    def count_vehicles(self) -> int:
+        return execute_query("SELECT COUNT(*) as count FROM vehicles WHERE deleted_at IS NULL")[0]['count']
+
+    def upsert_vehicles(self, vehicles: List[dict]):
+        query = """
+            INSERT INTO vehicles (vin, manufacturer, model, fleet_id, owner_operator, registration_status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(vin) DO UPDATE SET
+                manufacturer = excluded.manufacturer, model = excluded.model, fleet_id = excluded.fleet_id,
+                owner_operator = excluded.owner_operator, registration_status = excluded.registration_status
+        """
+        with get_db_connection() as conn:
+            conn.executemany(query, [
+                (v['vin'], v['manufacturer'], v['model'], v['fleet_id'], v['owner_operator'],
+                 v['registration_status'], v['created_at'])
+                for v in vehicles
+            ])
+            conn.commit()
+
+    def mark_vehicle_deleted(self, vin: str, deleted_at: datetime) -> Optional[str]:
+        query = "UPDATE vehicles SET deleted_at = ? WHERE vin = ? AND deleted_at IS NULL RETURNING fleet_id"
+        with get_db_connection() as conn:
+            deleted = conn.execute(query, (deleted_at.strftime(TIMESTAMP_FORMAT), vin)).fetchall()
+            conn.commit()
+        return deleted[0]['fleet_id'] if deleted else None
+
+    @contextmanager
+    def telemetry_writer(self, received_at: datetime):
+        with get_db_connection() as conn:
+            writer = _SQLiteTelemetryWriter(conn, received_at)
+            yield writer
+            telemetry_rollups.record_samples(conn, received_at, writer.stored)
+            conn.commit()
+
+    def recent_telemetry(self, vin: str, limit: int) -> List[dict]:
+        # Walk partitions newest first and stop as soon as the limit is filled
+        results = []
+        for table, id_base in telemetry_partitions.tables_for_range(newest_first=True):
+            query = f"""
+                {telemetry_partitions.select_sql(table, id_base)}
+                WHERE vehicle_vin = ?
+                ORDER BY timestamp DESC
+                LIMIT ?
+            """
+            results.extend(execute_query(query, (vin, limit - len(results))))
+            if len(results) >= limit:
+                break
+        return results
+
+    def get_telemetry(self, telemetry_id: int) -> Optional[dict]:
+        table, id_base, local_id = telemetry_partitions.locate(telemetry_id)
+        # Retention drops whole partitions, and their samples with them
+        if id_base and not telemetry_partitions.has_partition(date.fromordinal(id_base >> telemetry_partitions.ID_SHIFT)):
+            return None
+        results = execute_query(f"{telemetry_partitions.select_sql(table, id_base)} WHERE id = ?", (local_id,))
+        return results[0] if results else None
+
+    def get_ingest_key(self, ingest_key: str) -> Optional[int]:
+        results = execute_query("SELECT telemetry_id FROM telemetry_ingest_keys WHERE ingest_key = ?", (ingest_key,))
+        return results[0]['telemetry_id'] if results else None
+
+    def ingest_keys_since(self, since: datetime) -> List[str]:
+        rows = execute_query("SELECT ingest_key FROM telemetry_ingest_keys WHERE created_at >= ?", (since.strftime(TIMESTAMP_FORMAT),))
+        return [row['ingest_key'] for row in rows]
+
+    def prune_ingest_keys(self, before: datetime) -> int:
+        return execute_update("DELETE FROM telemetry_ingest_keys WHERE created_at < ?", (before.strftime(TIMESTAMP_FORMAT),))
+
+    def insert_alert(self, vin: str, alert_type: str, severity: str, message: str, timestamp: datetime) -> dict:
+        query = """
+            INSERT INTO alerts (alert_id, vehicle_vin, alert_type, severity, message, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+            RETURNING *
+        """
+        with get_db_connection() as conn:
+            row = dict(conn.execute(query, (str(uuid.uuid4()), vin, alert_type, severity, message, timestamp.isoformat())).fetchone())
+            telemetry_rollups.record_alerts(conn, vin, timestamp, 1)
+            conn.commit()
+        return row
+
+    def record_active_alert(self, raw_alert: dict, title: str, description: str) -> dict:
+        # The partial unique index idx_active_alerts_open makes concurrent callers
+        # for the same VIN converge on a single active row instead of racing a
+        # SELECT against the INSERT.
+        query = """
+            INSERT INTO active_alerts
+            (alert_sender_id, vehicle_vin, alert_type, severity, title, description,
+             first_occurrence, last_occurrence, occurrence_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(vehicle_vin, alert_type) WHERE status = 'active' DO UPDATE
+            SET last_occurrence = excluded.last_occurrence,
+                occurrence_count = occurrence_count + 1,
+                severity = CASE
+                    WHEN excluded.severity = 'high' THEN 'high'
+                    WHEN excluded.severity = 'critical' THEN 'critical'
+                    ELSE severity
+                END
+            RETURNING id, alert_sender_id, alert_type, last_occurrence
+        """
+        timestamp = raw_alert['timestamp'].isoformat()
+        alert_sender_id = str(uuid.uuid4())
+        params = (
+            alert_sender_id, raw_alert['vehicle_vin'], raw_alert['alert_type'], raw_alert['severity'],
+            title, description, timestamp, timestamp
+        )
+        with get_db_connection() as conn:
+            row = dict(conn.execute(query, params).fetchone())
+            linked = conn.execute(
+                "INSERT OR IGNORE INTO alert_relationships (active_alert_id, raw_alert_id) VALUES (?, ?)",
+                (row['id'], raw_alert['id'])
+            ).rowcount
+            if linked:
+                # Kept on the row so reads never count relationships
+                conn.execute(
+                    "UPDATE active_alerts SET related_alerts_count = related_alerts_count + 1 WHERE id = ?",
+                    (row['id'],)
+                )
+            conn.commit()
+        row['created'] = row['alert_sender_id'] == alert_sender_id
+        return row
+
+    def get_active_alert(self, active_alert_id: int) -> Optional[dict]:
+        results = execute_query("SELECT * FROM active_alerts WHERE id = ?", (active_alert_id,))
+        return results[0] if results else None
+
+    def fleet_aggregates(self, since: datetime) -> Dict[str, Any]:
+        since_str = since.strftime(TIMESTAMP_FORMAT)
+        # One pass over the window; distance is the sum of each vehicle's highest odometer reading
+        totals = execute_query(f"""
+            SELECT COUNT(*) AS active_vehicles, SUM(samples) AS fuel_samples,
+                   SUM(fuel_sum) AS fuel_sum, SUM(max_odometer) AS total_distance
+            FROM (
+                SELECT vehicle_vin, COUNT(*) AS samples, SUM(fuel_battery_level) AS fuel_sum,
+                       MAX(odometer_reading) AS max_odometer
+                FROM {telemetry_partitions.source_sql(start=since)}
+                WHERE timestamp > ?
+                GROUP BY vehicle_vin
+            )
+        """, (since_str,))[0]
+        type_counts, severity_counts = Counter(), Counter()
+        for row in execute_query("SELECT alert_type, severity, COUNT(*) AS count FROM alerts GROUP BY alert_type, severity"):
+            type_counts[row['alert_type']] += row['count']
+            severity_counts[row['severity']] += row['count']
+        return {
+            "active_vehicles": totals['active_vehicles'],
+            "fuel_sum": totals['fuel_sum'] or 0,
+            "fuel_samples": totals['fuel_samples'] or 0,
+            "total_distance": totals['total_distance'] or 0,
+            "total_alerts": sum(type_counts.values()),
+            "alert_type_counts": dict(type_counts),
+            "alert_severity_counts": dict(severity_counts)
+        }
+
+
+class _TelemetrySeries:
+    """One vehicle's samples as parallel columns in arrival order"""
+    __slots__ = ("ids", "latitude", "longitude", "speed", "engine_status", "fuel_battery_level",
+                 "odometer_reading", "diagnostic_codes", "timestamp")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.latitude = array("d")
+        self.longitude = array("d")
+        self.speed = array("d")
+        self.fuel_battery_level = array("d")
+        self.odometer_reading = array("d")
+        self.engine_status: List[str] = []
+        self.diagnostic_codes: List[str] = []
+        self.timestamp: List[str] = []
+
+    def append(self, row: dict):
+        self.ids.append(row['id'])
+        for name in ("latitude", "longitude", "speed", "fuel_battery_level", "odometer_reading",
+                     "engine_status", "diagnostic_codes", "timestamp"):
+            getattr(self, name).append(row[name])
+
+    def row(self, vin: str, i: int) -> dict:
+        return {
+            'id': self.ids[i], 'vehicle_vin': vin, 'latitude': self.latitude[i], 'longitude': self.longitude[i],
+            'speed': self.speed[i], 'engine_status': self.engine_status[i],
+            'fuel_battery_level': self.fuel_battery_level[i], 'odometer_reading': self.odometer_reading[i],
+            'diagnostic_codes': self.diagnostic_codes[i], 'timestamp': self.timestamp[i]
+        }
+
+
+class _MemoryTelemetryWriter(TelemetryWriter):
+    def __init__(self, storage: "MemoryStorage", timestamp_str: str):
+        self.storage = storage
+        self.timestamp_str = timestamp_str
+
+    def append(self, sample: TelemetryCreate, ingest_key: Optional[str] = None, replace_key: bool = False) -> Optional[dict]:
+        storage = self.storage
+        with storage._lock:
+            if ingest_key and ingest_key in storage._ingest_keys and not replace_key:
+                return None
+            row = {'id': storage._next_telemetry_id, **_telemetry_row(sample, self.timestamp_str)}
+            storage._next_telemetry_id += 1
+            if ingest_key:
+                storage._ingest_keys[ingest_key] = (row['id'], self.timestamp_str)
+            series = storage._telemetry.get(sample.vehicle_vin)
+            if series is None:
+                series = storage._telemetry[sample.vehicle_vin] = _TelemetrySeries()
+            series.append(row)
+            storage._telemetry_vins[row['id']] = sample.vehicle_vin
+        return row
+
+
+class MemoryStorage(StorageBackend):
+    """RAM-only engine on dicts and typed arrays, for tests, benchmarks and hot-tier experiments.
+
+    Vehicles are indexed by VIN, id and fleet; telemetry is one columnar
+    series per vehicle, so a vehicle's recent history is a slice and a
+    time-window aggregate is a bisect per vehicle. Nothing is persisted.
+    """
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vehicles: Dict[str, dict] = {}
+        self._vehicle_ids: Dict[int, str] = {}
+        self._fleets: Dict[str, set] = {}
+        self._telemetry: Dict[str, _TelemetrySeries] = {}
+        self._telemetry_vins: Dict[int, str] = {}
+        # ingest key -> (telemetry id, claimed at)
+        self._ingest_keys: Dict[str, tuple] = {}
+        self._alerts: List[dict] = []
+        self._active_alerts: Dict[int, dict] = {}
+        self._open_alerts: Dict[tuple, int] = {}
+        self._relationships: set = set()
+        self._next_vehicle_id = 1
+        self._next_telemetry_id = 1
+        self._next_active_alert_id = 1
+
+    def insert_vehicle(self, vehicle: VehicleCreate) -> dict:
+        with self._lock:
+            if vehicle.vin in self._vehicles:
+                raise ValueError(f"Vehicle with VIN {vehicle.vin} already exists")
+            row = {
+                'id': self._next_vehicle_id, 'vin': vehicle.vin, 'manufacturer': vehicle.manufacturer,
+                'model': vehicle.model, 'fleet_id': vehicle.fleet_id, 'owner_operator': vehicle.owner_operator,
+                'registration_status': vehicle.registration_status.value,
+                'created_at': datetime.utcnow().strftime(TIMESTAMP_FORMAT), 'deleted_at': None
+            }
+            self._next_vehicle_id += 1
+            self._store_vehicle(row)
+        return dict(row)
+
+    def _store_vehicle(self, row: dict):
+        previous = self._vehicles.get(row['vin'])
+        if previous:
+            self._fleets[previous['fleet_id']].discard(row['vin'])
+        self._vehicles[row['vin']] = row
+        self._vehicle_ids[row['id']] = row['vin']
+        self._fleets.setdefault(row['fleet_id'], set()).add(row['vin'])
+
+    def get_vehicle(self, vin: str, include_deleted: bool = False) -> Optional[dict]:
+        row = self._vehicles.get(vin)
+        if row is None or (row['deleted_at'] and not include_deleted):
+            return None
+        return dict(row)
+
+    def get_vehicle_by_id(self, vehicle_id: int) -> Optional[dict]:
+        vin = self._vehicle_ids.get(vehicle_id)
+        return dict(self._vehicles[vin]) if vin else None
+
+    def get_vehicles_by_vins(self, vins: Iterable[str]) -> Dict[str, dict]:
+        return {vin: dict(row) for vin in vins if (row := self._vehicles.get(vin)) and not row['deleted_at']}
+
+    def list_vehicles(self, fleet_id: Optional[str] = None) -> List[dict]:
+        vins = self._fleets.get(fleet_id, ()) if fleet_id is not None else self._vehicles.keys()
+        rows = [dict(row) for vin in list(vins) if not (row := self._vehicles[vin])['deleted_at']]
+        rows.sort(key=lambda row: (row['created_at'], row['id']), reverse=True)
+        return rows
+
+    def count_vehicles(self) -> int:
+        return sum(1 for row in list(self._vehicles.values()) if not row['deleted_at'])
+
+    def upsert_vehicles(self, vehicles: List[dict]):
+        with self._lock:
+            for vehicle in vehicles:
+                existing = self._vehicles.get(vehicle['vin'])
+                row = dict(existing) if existing else {
+                    'id': self._next_vehicle_id, 'vin': vehicle['vin'],
+                    'created_at': vehicle['created_at'], 'deleted_at': None
+                }
+                if not existing:
+                    self._next_vehicle_id += 1
+                row.update({name: vehicle[name] for name in
+                            ('manufacturer', 'model', 'fleet_id', 'owner_operator', 'registration_status')})
+                self._store_vehicle(row)
+
+    def mark_vehicle_deleted(self, vin: str, deleted_at: datetime) -> Optional[str]:
+        with self._lock:
+            row = self._vehicles.get(vin)
+            if row is None or row['deleted_at']:
+                return None
+            row['deleted_at'] = deleted_at.strftime(TIMESTAMP_FORMAT)
+            # Stands in for the background purge
+            series = self._telemetry.pop(vin, None)
+            if series is not None:
+                for telemetry_id in series.ids:
+                    self._telemetry_vins.pop(telemetry_id, None)
+            return row['fleet_id']
+
+    @contextmanager
+    def telemetry_writer(self, received_at: datetime):
+        yield _MemoryTelemetryWriter(self, received_at.strftime(TIMESTAMP_FORMAT))
+
+    def recent_telemetry(self, vin: str, limit: int) -> List[dict]:
+        series = self._telemetry.get(vin)
+        if series is None:
+            return []
+        count = len(series.ids)
+        return [series.row(vin, i) for i in range(count - 1, max(count - limit, 0) - 1, -1)]
+
+    def get_telemetry(self, telemetry_id: int) -> Optional[dict]:
+        vin = self._telemetry_vins.get(telemetry_id)
+        series = self._telemetry.get(vin) if vin else None
+        if series is None:
+            return None
+        # Ids are handed out in arrival order, so each series is sorted by id
+        i = bisect_right(series.ids, telemetry_id) - 1
+        return series.row(vin, i) if i >= 0 and series.ids[i] == telemetry_id else None
+
+    def get_ingest_key(self, ingest_key: str) -> Optional[int]:
+        claimed = self._ingest_keys.get(ingest_key)
+        return claimed[0] if claimed else None
+
+    def ingest_keys_since(self, since: datetime) -> List[str]:
+        since_str = since.strftime(TIMESTAMP_FORMAT)
+        return [key for key, (_, claimed_at) in list(self._ingest_keys.items()) if claimed_at >= since_str]
+
+    def prune_ingest_keys(self, before: datetime) -> int:
+        before_str = before.strftime(TIMESTAMP_FORMAT)
+        with self._lock:
+            expired = [key for key, (_, claimed_at) in self._ingest_keys.items() if claimed_at < before_str]
+            for key in expired:
+                del self._ingest_keys[key]
+        return len(expired)
+
+    def insert_alert(self, vin: str, alert_type: str, severity: str, message: str, timestamp: datetime) -> dict:
+        with self._lock:
+            row = {
+                'id': len(self._alerts) + 1, 'alert_id': str(uuid.uuid4()), 'vehicle_vin': vin,
+                'alert_type': alert_type, 'severity': severity, 'message': message, 'resolved': 0,
+                'timestamp': timestamp.isoformat()
+            }
+            self._alerts.append(row)
+        return dict(row)
+
+    def record_active_alert(self, raw_alert: dict, title: str, description: str) -> dict:
+        key = (raw_alert['vehicle_vin'], raw_alert['alert_type'])
+        timestamp = raw_alert['timestamp'].isoformat()
+        with self._lock:
+            row = self._active_alerts.get(self._open_alerts.get(key))
+            created = row is None
+            if created:
+                row = {
+                    'id': self._next_active_alert_id, 'alert_sender_id': str(uuid.uuid4()),
+                    'vehicle_vin': raw_alert['vehicle_vin'], 'alert_type': raw_alert['alert_type'],
+                    'severity': raw_alert['severity'], 'title': title, 'description': description,
+                    'status': 'active', 'first_occurrence': timestamp, 'last_occurrence': timestamp,
+                    'occurrence_count': 1, 'resolved_at': None, 'resolved_by': None,
+                    'created_at': datetime.utcnow().strftime(TIMESTAMP_FORMAT), 'related_alerts_count': 0
+                }
+                self._next_active_alert_id += 1
+                self._active_alerts[row['id']] = row
+                self._open_alerts[key] = row['id']
+            else:
+                row['last_occurrence'] = timestamp
+                row['occurrence_count'] += 1
+                if raw_alert['severity'] in ('high', 'critical'):
+                    row['severity'] = raw_alert['severity']
+            if (row['id'], raw_alert['id']) not in self._relationships:
+                self._relationships.add((row['id'], raw_alert['id']))
+                row['related_alerts_count'] += 1
+            return {**{name: row[name] for name in ('id', 'alert_sender_id', 'alert_type', 'last_occurrence')}, 'created': created}
+
+    def get_active_alert(self, active_alert_id: int) -> Optional[dict]:
+        row = self._active_alerts.get(active_alert_id)
+        return dict(row) if row else None
+
+    def fleet_aggregates(self, since: datetime) -> Dict[str, Any]:
+        since_str = since.strftime(TIMESTAMP_FORMAT)
+        active_vehicles, fuel_samples, fuel_sum, total_distance = 0, 0, 0.0, 0.0
+        for series in list(self._telemetry.values()):
+            # Arrival order is timestamp order, so the window is a suffix of each series
+            first = bisect_right(series.timestamp, since_str)
+            if first == len(series.timestamp):
+                continue
+            active_vehicles += 1
+            fuel_samples += len(series.timestamp) - first
+            fuel_sum += sum(series.fuel_battery_level[first:])
+            total_distance += max(series.odometer_reading[first:])
+        alerts = list(self._alerts)
+        return {
+            "active_vehicles": active_vehicles,
+            "fuel_sum": fuel_sum,
+            "fuel_samples": fuel_samples,
+            "total_distance": total_distance,
+            "total_alerts": len(alerts),
+            "alert_type_counts": dict(Counter(alert['alert_type'] for alert in alerts)),
+            "alert_severity_counts": dict(Counter(alert['severity'] for alert in alerts))
+        }
+
+
+def _telemetry_row(sample: TelemetryCreate, timestamp_str: str) -> dict:
+    return {
+        'vehicle_vin': sample.vehicle_vin,
+        'latitude': sample.latitude,
+        'longitude': sample.longitude,
+        'speed': sample.speed,
+        'engine_status': sample.engine_status.value,
+        'fuel_battery_level': sample.fuel_battery_level,
+        'odometer_reading': sample.odometer_reading,
+        'diagnostic_codes': ",".join(sample.diagnostic_codes) if sample.diagnostic_codes else "",
+        'timestamp': timestamp_str
+    }
+
+STORAGE_ENGINES = {SQLiteStorage.name: SQLiteStorage, MemoryStorage.name: MemoryStorage}
+
+def create_storage(engine: str) -> StorageBackend:
+    if engine not in STORAGE_ENGINES:
+        raise ValueError(f"Unknown storage engine {engine!r}; expected one of {', '.join(STORAGE_ENGINES)}")
+    return STORAGE_ENGINES[engine]()
+
+class StorageFeatureUnavailable(Exception):
+    """A feature that queries the SQLite tables directly was used with another engine; served as 501"""
+
+
+def require_sql_storage():
+    """Route dependency for features built on the SQLite tables rather than on StorageBackend"""
+    if not storage.sql_backed:
+        raise StorageFeatureUnavailable(f"Not available with the {storage.name} storage engine; run with FLEET_STORAGE_ENGINE=sqlite")
+
+# SQLite unless FLEET_STORAGE_ENGINE names another engine. Other engines serve
+# vehicles, ingest, latest/history, alert raising, the alert stream and the
+# fleet summary; require_sql_storage rejects the rest, and the SQL-only
+# background services (retention, purge, auto-resolve, replay, backups) and
+# ingest shards do not start.
+storage: StorageBackend = create_storage(os.environ.get("FLEET_STORAGE_ENGINE", SQLiteStorage.name))
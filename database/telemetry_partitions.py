@@ -0,0 +1,156 @@
+import sqlite3
+import threading
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+from database.connectDB import execute_query, execute_update, get_db_connection, TIMESTAMP_FORMAT
+
+TELEMETRY_COLUMNS = [
+    "vehicle_vin", "latitude", "longitude", "speed", "engine_status",
+    "fuel_battery_level", "odometer_reading", "diagnostic_codes", "timestamp"
+]
+
+class TelemetryPartitionRouter:
+    """Routes telemetry to one table per UTC day (telemetry_data_pYYYYMMDD).
+
+    Row ids returned to callers are global: the partition day's ordinal in the
+    high bits and the partition-local rowid in the low 32 bits, so a lookup by id
+    goes straight to its partition. The original telemetry_data table is kept as
+    a read-only legacy partition with id base 0 until retention drains it.
+    """
+    LEGACY_TABLE = "telemetry_data"
+    PARTITION_PREFIX = "telemetry_data_p"
+    ID_SHIFT = 32
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days: Optional[List[date]] = None
+        self._legacy_has_rows = True
+
+    def refresh(self):
+        query = "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'telemetry_data_p[0-9]*'"
+        days = sorted(
+            datetime.strptime(row['name'][len(self.PARTITION_PREFIX):], "%Y%m%d").date()
+            for row in execute_query(query)
+        )
+        legacy_has_rows = bool(execute_query(f"SELECT 1 FROM {self.LEGACY_TABLE} LIMIT 1"))
+        with self._lock:
+            self._days = days
+            self._legacy_has_rows = legacy_has_rows
+
+    def oldest_day(self, conn: Optional[sqlite3.Connection] = None) -> Optional[date]:
+        """First day that still has raw telemetry; conn addresses another database such as a shard's"""
+        if conn is None:
+            with get_db_connection() as conn:
+                return self.oldest_day(conn)
+        days = [
+            datetime.strptime(row[0][len(self.PARTITION_PREFIX):], "%Y%m%d").date()
+            for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'telemetry_data_p[0-9]*'")
+        ]
+        legacy_oldest = conn.execute(f"SELECT MIN(timestamp) FROM {self.LEGACY_TABLE}").fetchone()[0]
+        if legacy_oldest:
+            days.append(datetime.fromisoformat(legacy_oldest).date())
+        return min(days) if days else None
+
+    def partition_days(self) -> List[date]:
+        if self._days is None:
+            self.refresh()
+        return list(self._days)
+
+    @property
+    def legacy_has_rows(self) -> bool:
+        if self._days is None:
+            self.refresh()
+        return self._legacy_has_rows
+
+    def mark_legacy_empty(self):
+        self._legacy_has_rows = False
+
+    def table_name(self, day: date) -> str:
+        return f"{self.PARTITION_PREFIX}{day.strftime('%Y%m%d')}"
+
+    def id_base(self, day: date) -> int:
+        return day.toordinal() << self.ID_SHIFT
+
+    def to_global_id(self, day: date, local_id: int) -> int:
+        return self.id_base(day) + local_id
+
+    def locate(self, global_id: int) -> Tuple[str, int, int]:
+        """Partition table, id base and local rowid for a global telemetry id"""
+        ordinal = global_id >> self.ID_SHIFT
+        if ordinal == 0:
+            return self.LEGACY_TABLE, 0, global_id
+        day = date.fromordinal(ordinal)
+        return self.table_name(day), self.id_base(day), global_id - self.id_base(day)
+
+    def has_partition(self, day: date) -> bool:
+        return day in self.partition_days()
+
+    def partition_for_write(self, timestamp: datetime) -> Tuple[str, date]:
+        day = timestamp.date()
+        if not self.has_partition(day):
+            self.create_partition(day)
+        return self.table_name(day), day
+
+    def create_partition(self, day: date):
+        table = self.table_name(day)
+        with self._lock:
+            with get_db_connection() as conn:
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        vehicle_vin TEXT NOT NULL,
+                        latitude REAL NOT NULL,
+                        longitude REAL NOT NULL,
+                        speed REAL NOT NULL,
+                        engine_status TEXT CHECK(engine_status IN ('On', 'Off', 'Idle')) NOT NULL,
+                        fuel_battery_level REAL CHECK(fuel_battery_level >= 0 AND fuel_battery_level <= 100) NOT NULL,
+                        odometer_reading REAL NOT NULL,
+                        diagnostic_codes TEXT DEFAULT '',
+                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (vehicle_vin) REFERENCES vehicles (vin) ON DELETE CASCADE
+                    )
+                """)
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_vin_timestamp ON {table}(vehicle_vin, timestamp)")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table}(timestamp)")
+                conn.commit()
+            if self._days is not None and day not in self._days:
+                self._days = sorted(self._days + [day])
+
+    def drop_partition(self, day: date) -> bool:
+        """Expire a whole day of telemetry without per-row deletes"""
+        if not self.has_partition(day):
+            return False
+        with self._lock:
+            execute_update(f"DROP TABLE IF EXISTS {self.table_name(day)}")
+            self._days = [d for d in self._days if d != day]
+        return True
+
+    def tables_for_range(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                         newest_first: bool = False) -> List[Tuple[str, int]]:
+        """(table, id base) pairs for every partition that can hold rows in [start, end)"""
+        tables = []
+        if self.legacy_has_rows:
+            tables.append((self.LEGACY_TABLE, 0))
+        for day in self.partition_days():
+            if start and day < start.date():
+                continue
+            if end and day > end.date():
+                continue
+            tables.append((self.table_name(day), self.id_base(day)))
+        if newest_first:
+            tables.reverse()
+        return tables
+
+    def select_sql(self, table: str, id_base: int) -> str:
+        return f"SELECT id + {id_base} AS id, {', '.join(TELEMETRY_COLUMNS)} FROM {table}"
+
+    def source_sql(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> str:
+        """A FROM-able subquery unioning only the partitions overlapping [start, end)"""
+        tables = self.tables_for_range(start, end) or [(self.LEGACY_TABLE, 0)]
+        return "(" + " UNION ALL ".join(self.select_sql(table, base) for table, base in tables) + ")"
+
+    @staticmethod
+    def format_timestamp(value: datetime) -> str:
+        return value.strftime(TIMESTAMP_FORMAT)
+
+telemetry_partitions = TelemetryPartitionRouter()
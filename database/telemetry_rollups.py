@@ -0,0 +1,126 @@
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from database.connectDB import get_db_connection, execute_update
+from database.telemetry_partitions import telemetry_partitions
+
+EPOCH = datetime(1970, 1, 1)
+
+def to_epoch(value: datetime) -> int:
+    return int((value - EPOCH).total_seconds())
+
+class TelemetryRollups:
+    """Per-vehicle telemetry and alert totals in fixed 5m, 1h and 1d buckets.
+
+    Ingest and alerting add to the buckets in the same transaction as the raw
+    write, so time-series analytics never scan raw telemetry. Rows hold sums,
+    not averages, so buckets of one resolution merge into any coarser interval
+    by addition. Bucket starts are unix seconds aligned to the resolution.
+    """
+    RESOLUTIONS = {"5m": 300, "1h": 3600, "1d": 86400}
+    # Fine buckets are dropped once coarser ones cover the same span; None keeps them forever
+    RETENTION = {300: timedelta(days=35), 3600: timedelta(days=400), 86400: None}
+
+    UPSERT_SAMPLES = """
+        INSERT INTO telemetry_rollups
+        (resolution, vehicle_vin, bucket_start, sample_count, fuel_sum, min_odometer_reading, max_odometer_reading)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(resolution, vehicle_vin, bucket_start) DO UPDATE SET
+            sample_count = sample_count + excluded.sample_count,
+            fuel_sum = fuel_sum + excluded.fuel_sum,
+            min_odometer_reading = MIN(COALESCE(min_odometer_reading, excluded.min_odometer_reading), excluded.min_odometer_reading),
+            max_odometer_reading = MAX(COALESCE(max_odometer_reading, excluded.max_odometer_reading), excluded.max_odometer_reading)
+    """
+    UPSERT_ALERTS = """
+        INSERT INTO telemetry_rollups (resolution, vehicle_vin, bucket_start, alert_count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(resolution, vehicle_vin, bucket_start) DO UPDATE SET
+            alert_count = alert_count + excluded.alert_count
+    """
+
+    def record_samples(self, conn: sqlite3.Connection, timestamp: datetime, samples: Iterable):
+        """Add stored samples to their buckets on the caller's connection, inside its transaction"""
+        totals: Dict[str, list] = {}
+        for sample in samples:
+            total = totals.get(sample.vehicle_vin)
+            if total is None:
+                totals[sample.vehicle_vin] = [1, sample.fuel_battery_level, sample.odometer_reading, sample.odometer_reading]
+            else:
+                total[0] += 1
+                total[1] += sample.fuel_battery_level
+                total[2] = min(total[2], sample.odometer_reading)
+                total[3] = max(total[3], sample.odometer_reading)
+        if not totals:
+            return
+        epoch = to_epoch(timestamp)
+        conn.executemany(self.UPSERT_SAMPLES, [
+            (resolution, vin, epoch - epoch % resolution, *total)
+            for resolution in self.RESOLUTIONS.values()
+            for vin, total in totals.items()
+        ])
+
+    def record_alerts(self, conn: sqlite3.Connection, vin: str, timestamp: datetime, count: int):
+        """Add stored alerts to their buckets on the caller's connection, inside its transaction"""
+        epoch = to_epoch(timestamp)
+        conn.executemany(self.UPSERT_ALERTS, [
+            (resolution, vin, epoch - epoch % resolution, count) for resolution in self.RESOLUTIONS.values()
+        ])
+
+    def rebuild(self, start: datetime, end: Optional[datetime] = None) -> int:
+        """Recompute whole days of buckets from raw telemetry and alerts, e.g. for data ingested before rollups existed.
+
+        Days whose raw telemetry retention has already removed are left alone;
+        their buckets, the 1d ones in particular, are all that is left of them.
+        """
+        oldest_day = telemetry_partitions.oldest_day()
+        if oldest_day is None:
+            return 0
+        start = datetime.combine(max(start.date(), oldest_day), datetime.min.time())
+        end = end or datetime.utcnow()
+        start_epoch, end_epoch = to_epoch(start), to_epoch(end)
+        source = telemetry_partitions.source_sql(start=start, end=end)
+        rows = 0
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM telemetry_rollups WHERE bucket_start >= ? AND bucket_start < ?", (start_epoch, end_epoch))
+            for resolution in self.RESOLUTIONS.values():
+                bucket = f"(CAST(strftime('%s', timestamp) AS INTEGER) / {resolution}) * {resolution}"
+                rows += conn.execute(f"""
+                    INSERT INTO telemetry_rollups
+                    (resolution, vehicle_vin, bucket_start, sample_count, fuel_sum, min_odometer_reading, max_odometer_reading)
+                    SELECT {resolution}, vehicle_vin, {bucket} AS bucket, COUNT(*), SUM(fuel_battery_level),
+                           MIN(odometer_reading), MAX(odometer_reading)
+                    FROM {source}
+                    WHERE {bucket} >= ? AND {bucket} < ?
+                    GROUP BY vehicle_vin, bucket
+                """, (start_epoch, end_epoch)).rowcount
+                conn.execute(f"""
+                    INSERT INTO telemetry_rollups (resolution, vehicle_vin, bucket_start, alert_count)
+                    SELECT {resolution}, vehicle_vin, {bucket} AS bucket, COUNT(*)
+                    FROM alerts
+                    WHERE timestamp >= ? AND {bucket} < ?
+                    GROUP BY vehicle_vin, bucket
+                    ON CONFLICT(resolution, vehicle_vin, bucket_start) DO UPDATE SET alert_count = excluded.alert_count
+                """, (start.isoformat(), end_epoch))
+            conn.commit()
+        return rows
+
+    def resolutions_retained_since(self, start: datetime, now: Optional[datetime] = None) -> List[int]:
+        """Resolutions, finest first, whose buckets from start on have not been pruned"""
+        now = now or datetime.utcnow()
+        return sorted(
+            resolution for resolution, keep in self.RETENTION.items()
+            if keep is None or start >= now - keep
+        )
+
+    def prune(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.utcnow()
+        deleted = 0
+        for resolution, keep in self.RETENTION.items():
+            if keep is not None:
+                deleted += execute_update(
+                    "DELETE FROM telemetry_rollups WHERE resolution = ? AND bucket_start < ?",
+                    (resolution, to_epoch(now - keep))
+                )
+        return deleted
+
+telemetry_rollups = TelemetryRollups()
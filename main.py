@@ -1,24 +1,74 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Query, Depends, status
+from fastapi.responses import JSONResponse
+from typing import Optional
+from datetime import datetime
 from database.connectDB import init_database
-from api import vehicles, telemetry, alerts, alert_sender  
+from database.telemetry_partitions import telemetry_partitions
+from database.storage import storage, require_sql_storage, StorageFeatureUnavailable
+from api import vehicles, telemetry, alerts, alert_sender, admin
 from services.analytics_service import analytics_service
+from services.retention_service import retention_service
+from services.idempotency_service import idempotency_service
+from services.alert_pipeline import alert_pipeline
+from services.ingest_shards import ingest_shards
+from services.alert_auto_resolver import alert_auto_resolver
+from services.notification_service import notification_dispatcher
+from services.vehicle_purge_service import vehicle_purge_service
+from services.response_cache import response_cache
+from services.alert_replay_service import alert_replay_service
+from services.backup_service import backup_service
+from services.memory_accounting import memory_accounting
+from services.request_profiler import ProfiledRoute, RequestProfilingMiddleware
 
 app = FastAPI(
     title="Connected Car Fleet Management System",
     description="A system for managing vehicle fleets and processing real-time telemetry data with Alert Sender",
     version="1.0.0"
 )
+# Requests carrying the profiling header, or picked by the sample rate, are profiled; see /admin/profiles
+app.router.route_class = ProfiledRoute
+app.add_middleware(RequestProfilingMiddleware)
+
+@app.exception_handler(StorageFeatureUnavailable)
+async def storage_feature_unavailable(request: Request, exc: StorageFeatureUnavailable):
+    return JSONResponse(status_code=status.HTTP_501_NOT_IMPLEMENTED, content={"detail": str(exc)})
 
 @app.on_event("startup")
 def startup_event():
     """Initialize database on startup"""
     init_database()
+    telemetry_partitions.refresh()
+    idempotency_service.load_recent_keys()
+    alert_pipeline.start()
+    notification_dispatcher.start()
+    memory_accounting.start()
+    # These work on the SQLite tables directly
+    if storage.sql_backed:
+        retention_service.start()
+        alert_auto_resolver.start()
+        vehicle_purge_service.start()
+        ingest_shards.start()
+        alert_replay_service.start()
+        backup_service.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    alert_replay_service.stop()
+    backup_service.stop()
+    memory_accounting.stop()
+    ingest_shards.stop()
+    retention_service.stop()
+    alert_pipeline.stop()
+    alert_auto_resolver.stop()
+    notification_dispatcher.stop()
+    vehicle_purge_service.stop()
 
 # Include routers
 app.include_router(vehicles.router)
 app.include_router(telemetry.router)
 app.include_router(alerts.router)
 app.include_router(alert_sender.router)  
+app.include_router(admin.router)
 
 @app.get("/")
 async def root():
@@ -26,9 +76,28 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "database": "SQLite3 connected", "features": ["Alert Sender", "Deduplication"]}
+    return {"status": "healthy", "database": "SQLite3 connected" if storage.sql_backed else f"{storage.name} engine", "features": ["Alert Sender", "Deduplication"]}
 
 @app.get("/analytics")
-async def get_analytics():
+async def get_analytics(request: Request):
     """Get fleet analytics"""
-    return analytics_service.get_fleet_analytics()
+    return response_cache.respond(
+        request, response_cache.make_key("analytics"), ("analytics", "vehicles"),
+        response_cache.ANALYTICS_TTL_SECONDS, analytics_service.get_fleet_analytics
+    )
+
+@app.get("/analytics/series", dependencies=[Depends(require_sql_storage)])
+async def get_analytics_series(
+    request: Request,
+    start: Optional[datetime] = Query(default=None, description="UTC; defaults to 24 hours before end"),
+    end: Optional[datetime] = Query(default=None, description="UTC; defaults to now"),
+    interval: Optional[str] = Query(default=None, description="Bucket width such as 5m, 1h or 1d; picked from the window when omitted"),
+    fleet_id: Optional[str] = None,
+    vin: Optional[str] = None
+):
+    """Bucketed fleet or vehicle time series served from pre-aggregated rollups"""
+    return response_cache.respond(
+        request, response_cache.make_key("analytics_series", start=start, end=end, interval=interval, fleet_id=fleet_id, vin=vin),
+        ("analytics",), response_cache.ANALYTICS_TTL_SECONDS,
+        lambda: analytics_service.get_time_series(start, end, interval, fleet_id, vin)
+    )
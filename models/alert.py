@@ -30,3 +30,10 @@ class AlertResponse(Alert):
 
     class Config:
         from_attributes = True
+
+class AlertReplayCreate(BaseModel):
+    start: datetime = Field(..., description="Start of the telemetry range to re-evaluate (UTC)")
+    end: Optional[datetime] = Field(default=None, description="End of the range (UTC); defaults to now")
+    speed_limit: Optional[float] = Field(default=None, gt=0, description="Defaults to the current rule")
+    low_fuel_threshold: Optional[float] = Field(default=None, ge=0, le=100, description="Defaults to the current rule")
+    workers: Optional[int] = Field(default=None, ge=1, le=64, description="Worker processes; defaults to the CPU count")
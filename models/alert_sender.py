@@ -55,6 +55,7 @@ class ActiveAlertResponse(ActiveAlert):
 class AlertHistoryResponse(BaseModel):
     active_alert: ActiveAlertResponse
     raw_alerts: List[dict]  
+    next_before_id: Optional[int] = None  # raw alert id to pass as before_id for the next, older page
 
     class Config:
         from_attributes = True
@@ -19,7 +19,9 @@ class TelemetryBase(BaseModel):
     diagnostic_codes: Optional[List[str]] = Field(default=[], description="Error diagnostic codes")
 
 class TelemetryCreate(TelemetryBase):
-    pass
+    idempotency_key: Optional[str] = Field(default=None, max_length=128, description="Client key identifying retries of the same sample")
+    device_timestamp: Optional[datetime] = Field(default=None, description="Sample time reported by the device")
+    seq: Optional[int] = Field(default=None, ge=0, description="Device sequence number")
 
 class TelemetryResponse(BaseModel):
     id: int
@@ -35,3 +37,22 @@ class TelemetryResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class DeadbandConfig(BaseModel):
+    position_tolerance: float = Field(default=0.0001, ge=0, description="Latitude/longitude change in degrees that forces a write")
+    speed_tolerance: float = Field(default=1.0, ge=0, description="Speed change in km/h that forces a write")
+    fuel_battery_tolerance: float = Field(default=0.5, ge=0, description="Fuel/battery change in percentage points that forces a write")
+    odometer_tolerance: float = Field(default=0.1, ge=0, description="Odometer change in km that forces a write")
+    heartbeat_seconds: float = Field(default=300, gt=0, description="Maximum time between stored samples")
+
+class AdmissionMode(str, Enum):
+    REJECT = "reject"
+    SAMPLE = "sample"
+
+class RateLimitConfig(BaseModel):
+    vin_rate: float = Field(default=20.0, gt=0, description="Sustained samples per second per vehicle")
+    vin_burst: int = Field(default=1000, ge=1, description="Samples a vehicle may send at once, e.g. after reconnecting")
+    fleet_rate: float = Field(default=5000.0, gt=0, description="Sustained samples per second per fleet")
+    fleet_burst: int = Field(default=50000, ge=1, description="Samples a fleet may send at once")
+    mode: AdmissionMode = Field(default=AdmissionMode.REJECT, description="reject: answer 429; sample: still admit every sample_every-th sample over the limit")
+    sample_every: int = Field(default=10, ge=1, description="In sample mode, 1 of this many over-limit samples is admitted")
@@ -0,0 +1,160 @@
+from typing import Dict, List, Optional, Any
+from collections import Counter, OrderedDict
+import threading
+import time
+from database.storage import storage
+from models.telemetry import RateLimitConfig, AdmissionMode
+from services.memory_accounting import memory_accounting, estimate_bytes
+
+class AdmissionController:
+    """Per-VIN and per-fleet token buckets for telemetry ingest.
+
+    Each bucket is stored as a single float, its theoretical arrival time
+    (the GCRA form of a token bucket), so a check is O(1) and an idle bucket
+    is indistinguishable from a missing one and can be swept away.
+    Fleets without an override use DEFAULT_CONFIG.
+    """
+    DEFAULT_CONFIG = RateLimitConfig()
+    SWEEP_EVERY = 10_000  # checks between removals of refilled buckets
+    FLEET_CACHE_SIZE = 100_000
+    MAX_TRACKED_VINS = 10_000  # throttle counters kept for the noisiest vehicles only
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configs: Dict[str, RateLimitConfig] = {}
+        self._vin_tat: Dict[str, float] = {}
+        self._fleet_tat: Dict[str, float] = {}
+        self._over_limit_seen: Dict[str, int] = {}
+        self._fleet_by_vin: "OrderedDict[str, str]" = OrderedDict()
+        self._checks_since_sweep = 0
+        self.admitted = 0
+        self.sampled = 0
+        self.throttled = 0
+        self.throttled_by_vin: Counter = Counter()
+        self.throttled_by_fleet: Counter = Counter()
+
+    def configure_fleet(self, fleet_id: str, config: RateLimitConfig):
+        with self._lock:
+            self._configs[fleet_id] = config
+
+    def remove_fleet(self, fleet_id: str) -> bool:
+        with self._lock:
+            return self._configs.pop(fleet_id, None) is not None
+
+    def forget_vehicle(self, vin: str):
+        with self._lock:
+            self._fleet_by_vin.pop(vin, None)
+            self._vin_tat.pop(vin, None)
+            self._over_limit_seen.pop(vin, None)
+
+    def _fleets_for(self, vins) -> Dict[str, str]:
+        fleets, missing = {}, []
+        with self._lock:
+            for vin in vins:
+                fleet_id = self._fleet_by_vin.get(vin)
+                if fleet_id is None:
+                    missing.append(vin)
+                else:
+                    fleets[vin] = fleet_id
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            rows = storage.get_vehicles_by_vins(chunk)
+            with self._lock:
+                for vin, row in rows.items():
+                    fleets[vin] = self._fleet_by_vin[vin] = row['fleet_id']
+                while len(self._fleet_by_vin) > self.FLEET_CACHE_SIZE:
+                    self._fleet_by_vin.popitem(last=False)
+        return fleets
+
+    @staticmethod
+    def _excess(buckets: Dict[str, float], key: str, rate: float, burst: int, now: float) -> tuple[float, float]:
+        """(seconds over the limit, new arrival time) for taking one token; admitted when excess <= 0"""
+        interval = 1.0 / rate
+        new_tat = max(buckets.get(key, now), now) + interval
+        return new_tat - now - burst * interval, new_tat
+
+    def admit(self, vins: List[str]) -> List[Optional[float]]:
+        """Charge one sample per entry; None means admitted, otherwise the seconds to wait before retrying.
+
+        Unknown VINs are admitted here and rejected by ingest as before.
+        """
+        fleets = self._fleets_for(set(vins))
+        now = time.monotonic()
+        decisions: List[Optional[float]] = []
+        with self._lock:
+            for vin in vins:
+                fleet_id = fleets.get(vin)
+                if fleet_id is None:
+                    decisions.append(None)
+                    continue
+                config = self._configs.get(fleet_id, self.DEFAULT_CONFIG)
+                vin_excess, vin_tat = self._excess(self._vin_tat, vin, config.vin_rate, config.vin_burst, now)
+                fleet_excess, fleet_tat = self._excess(self._fleet_tat, fleet_id, config.fleet_rate, config.fleet_burst, now)
+                if vin_excess <= 0 and fleet_excess <= 0:
+                    self._vin_tat[vin] = vin_tat
+                    self._fleet_tat[fleet_id] = fleet_tat
+                    self.admitted += 1
+                    decisions.append(None)
+                    continue
+
+                if config.mode == AdmissionMode.SAMPLE:
+                    # Keep a thinned stream flowing; sampled samples do not draw tokens
+                    seen = self._over_limit_seen.get(vin, 0) + 1
+                    self._over_limit_seen[vin] = seen
+                    if seen % config.sample_every == 0:
+                        self.sampled += 1
+                        decisions.append(None)
+                        continue
+
+                self.throttled += 1
+                self.throttled_by_vin[vin] += 1
+                self.throttled_by_fleet[fleet_id] += 1
+                decisions.append(max(vin_excess, fleet_excess))
+
+            self._checks_since_sweep += len(vins)
+            if self._checks_since_sweep >= self.SWEEP_EVERY:
+                self._sweep(now)
+        return decisions
+
+    def _sweep(self, now: float):
+        # A bucket whose arrival time has passed is full again, exactly like a missing one
+        self._checks_since_sweep = 0
+        self._vin_tat = {vin: tat for vin, tat in self._vin_tat.items() if tat > now}
+        self._fleet_tat = {fleet_id: tat for fleet_id, tat in self._fleet_tat.items() if tat > now}
+        self._over_limit_seen = {vin: seen for vin, seen in self._over_limit_seen.items() if vin in self._vin_tat}
+        if len(self.throttled_by_vin) > self.MAX_TRACKED_VINS:
+            self.throttled_by_vin = Counter(dict(self.throttled_by_vin.most_common(self.MAX_TRACKED_VINS // 2)))
+
+    def memory_usage(self) -> Dict[str, int]:
+        with self._lock:
+            # Live buckets are rate-limit state and are never evicted; only the VIN -> fleet cache is
+            fixed = sum(estimate_bytes(state) for state in (
+                self._configs, self._vin_tat, self._fleet_tat, self._over_limit_seen,
+                self.throttled_by_vin, self.throttled_by_fleet
+            ))
+            return {"bytes": fixed + estimate_bytes(self._fleet_by_vin), "entries": len(self._fleet_by_vin), "fixed_bytes": fixed}
+
+    def trim(self, max_entries: int) -> int:
+        with self._lock:
+            evicted = 0
+            while len(self._fleet_by_vin) > max_entries:
+                self._fleet_by_vin.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def get_stats(self, top: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "default_config": self.DEFAULT_CONFIG,
+                "fleet_configs": dict(self._configs),
+                "admitted": self.admitted,
+                "sampled": self.sampled,
+                "throttled": self.throttled,
+                "active_vin_buckets": len(self._vin_tat),
+                "active_fleet_buckets": len(self._fleet_tat),
+                "top_throttled_vins": [{"vehicle_vin": vin, "throttled": count} for vin, count in self.throttled_by_vin.most_common(top)],
+                "throttled_by_fleet": dict(self.throttled_by_fleet)
+            }
+
+admission_controller = AdmissionController()
+memory_accounting.register("admission", admission_controller.memory_usage, admission_controller.trim, budget_bytes=32 * 1024 * 1024)
@@ -0,0 +1,167 @@
+from typing import Dict, Any, List, Optional, Tuple
+from collections import deque
+from datetime import datetime, timedelta
+import heapq
+import threading
+from database.connectDB import execute_query, get_db_connection
+from models.alert_sender import ActiveAlertType
+from services.alert_event_bus import alert_event_bus
+from services.memory_accounting import memory_accounting, estimate_bytes
+from services.response_cache import response_cache
+
+class AlertAutoResolver:
+    """Resolves active alerts that have been quiet for their type's quiet period.
+
+    Open alerts are kept in a min-heap keyed by the time they become stale
+    (last_occurrence + quiet period), so a tick only pops what is due instead
+    of scanning active_alerts. Updates push a fresh heap entry and the old one
+    is discarded lazily when popped.
+    """
+    QUIET_PERIODS = {
+        ActiveAlertType.SPEED_VIOLATION.value: timedelta(minutes=30),
+        ActiveAlertType.LOW_FUEL_BATTERY.value: timedelta(hours=2),
+    }
+    TICK_SECONDS = 30
+    BATCH_SIZE = 500  # alerts resolved per UPDATE
+    RESOLVED_BY = "system:auto-resolve"
+    RECENT_RESOLVED_SIZE = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[datetime, int]] = []
+        self._deadlines: Dict[int, datetime] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.recently_resolved: deque = deque(maxlen=self.RECENT_RESOLVED_SIZE)
+        self.resolved_total = 0
+        self.last_tick: Optional[Dict[str, Any]] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.load_open_alerts()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="alert-auto-resolve", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run_loop(self):
+        while not self._stop_event.wait(self.TICK_SECONDS):
+            try:
+                self.resolve_due()
+            except Exception as e:
+                print(f"Alert auto-resolve tick failed: {e}")
+
+    def load_open_alerts(self) -> int:
+        """Seed the heap from the database once at startup"""
+        rows = execute_query("SELECT id, alert_type, last_occurrence FROM active_alerts WHERE status = 'active'")
+        for row in rows:
+            self.track(row['id'], row['alert_type'], datetime.fromisoformat(row['last_occurrence']))
+        return len(rows)
+
+    def track(self, active_alert_id: int, alert_type: str, last_occurrence: datetime):
+        """(Re)schedule an open alert after it was created or received a new occurrence"""
+        quiet_period = self.QUIET_PERIODS.get(alert_type)
+        if quiet_period is None:
+            return
+        deadline = last_occurrence + quiet_period
+        with self._lock:
+            if self._deadlines.get(active_alert_id) == deadline:
+                return
+            self._deadlines[active_alert_id] = deadline
+            heapq.heappush(self._heap, (deadline, active_alert_id))
+            # Superseded entries pile up for busy alerts; rebuild before they dominate the heap
+            if len(self._heap) > 2 * len(self._deadlines) + 1024:
+                self._heap = [(deadline, alert_id) for alert_id, deadline in self._deadlines.items()]
+                heapq.heapify(self._heap)
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < self.BATCH_SIZE:
+                deadline, alert_id = heapq.heappop(self._heap)
+                if self._deadlines.get(alert_id) == deadline:
+                    del self._deadlines[alert_id]
+                    due.append(alert_id)
+        return due
+
+    def resolve_due(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        now = now or datetime.utcnow()
+        resolved = []
+        while True:
+            due = self._pop_due(now)
+            if not due:
+                break
+            resolved.extend(self._resolve_batch(due, now))
+
+        with self._lock:
+            self.resolved_total += len(resolved)
+            self.recently_resolved.extend(resolved)
+        self.last_tick = {"ran_at": now.isoformat(), "resolved": len(resolved)}
+        return {**self.last_tick, "alerts": resolved}
+
+    def _resolve_batch(self, alert_ids: List[int], now: datetime) -> List[Dict[str, Any]]:
+        # The quiet-period check is repeated in SQL so an occurrence that raced the heap keeps the alert open
+        cutoff_cases = " ".join("WHEN ? THEN ?" for _ in self.QUIET_PERIODS)
+        cutoff_params = [
+            value for alert_type, quiet_period in self.QUIET_PERIODS.items()
+            for value in (alert_type, (now - quiet_period).isoformat())
+        ]
+        query = f"""
+            UPDATE active_alerts
+            SET status = 'resolved', resolved_at = ?, resolved_by = ?
+            WHERE status = 'active'
+              AND id IN ({', '.join('?' for _ in alert_ids)})
+              AND last_occurrence <= CASE alert_type {cutoff_cases} END
+            RETURNING id, alert_sender_id, vehicle_vin, alert_type, last_occurrence
+        """
+        with get_db_connection() as conn:
+            rows = [dict(row) for row in conn.execute(query, (now.isoformat(), self.RESOLVED_BY, *alert_ids, *cutoff_params))]
+            conn.commit()
+
+        if rows:
+            response_cache.invalidate(*{f"alerts:{row['vehicle_vin']}" for row in rows})
+        resolved_ids = {row['id'] for row in rows}
+        still_open = [alert_id for alert_id in alert_ids if alert_id not in resolved_ids]
+        if still_open:
+            # Newer occurrences, or manual status changes; re-track whatever is still active
+            for row in execute_query(
+                f"SELECT id, alert_type, last_occurrence FROM active_alerts WHERE status = 'active' AND id IN ({', '.join('?' for _ in still_open)})",
+                tuple(still_open)
+            ):
+                self.track(row['id'], row['alert_type'], datetime.fromisoformat(row['last_occurrence']))
+
+        if rows and alert_event_bus.wants_events:
+            from services.alert_sender_service import alert_sender_service
+            for row in rows:
+                alert_event_bus.publish("resolved", alert_sender_service.get_active_alert_by_id(row['id']))
+
+        resolved_at = now.isoformat()
+        return [{**row, "resolved_at": resolved_at} for row in rows]
+
+    def memory_usage(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "bytes": estimate_bytes(self._heap) + estimate_bytes(self._deadlines) + estimate_bytes(self.recently_resolved),
+                "entries": len(self._deadlines)
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            next_due = self._heap[0][0].isoformat() if self._heap else None
+            return {
+                "running": bool(self._thread and self._thread.is_alive()),
+                "quiet_periods_seconds": {t: p.total_seconds() for t, p in self.QUIET_PERIODS.items()},
+                "tracked_alerts": len(self._deadlines),
+                "heap_entries": len(self._heap),
+                "next_due": next_due,
+                "resolved_total": self.resolved_total,
+                "last_tick": self.last_tick,
+                "recently_resolved": list(self.recently_resolved)[-50:]
+            }
+
+alert_auto_resolver = AlertAutoResolver()
+# Every open alert must stay scheduled, so this is reported but never trimmed
+memory_accounting.register("alert_auto_resolver", alert_auto_resolver.memory_usage)
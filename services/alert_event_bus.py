@@ -0,0 +1,162 @@
+from typing import Dict, Optional, Any, List
+from collections import deque
+from itertools import islice
+import asyncio
+import itertools
+import threading
+from database.storage import storage
+from services.memory_accounting import memory_accounting, estimate_bytes
+
+class AlertSubscription:
+    """Bounded per-subscriber buffer; a full buffer coalesces updates to the same alert, otherwise drops the oldest event"""
+
+    def __init__(self, bus: "AlertEventBus", filters: Dict[str, Optional[str]], loop: asyncio.AbstractEventLoop, max_buffer: int):
+        self._bus = bus
+        self.filters = {key: value for key, value in filters.items() if value}
+        self._loop = loop
+        self._max_buffer = max_buffer
+        self._events: deque = deque()
+        self._wakeup = asyncio.Event()
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        alert = event["alert"]
+        for key, value in self.filters.items():
+            actual = event.get("fleet_id") if key == "fleet_id" else alert.get(key)
+            if actual != value:
+                return False
+        return True
+
+    def offer(self, event: Dict[str, Any]):
+        # Called with the bus lock held, from any thread
+        if len(self._events) >= self._max_buffer:
+            alert_id = event["alert"]["alert_sender_id"]
+            stale = [pending for pending in self._events if pending["alert"]["alert_sender_id"] == alert_id]
+            if stale:
+                # The newer event carries the full alert state; keep it in arrival order
+                for pending in stale:
+                    self._events.remove(pending)
+                if stale[0]["event"] == "created":
+                    event = {**event, "event": "created"}
+                self.coalesced += len(stale)
+            else:
+                self._events.popleft()
+                self.dropped += 1
+        self._events.append(event)
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def next_events(self, timeout: float) -> List[Dict[str, Any]]:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        with self._bus._lock:
+            self._wakeup.clear()
+            events = list(self._events)
+            self._events.clear()
+            self.delivered += len(events)
+        return events
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+class AlertEventBus:
+    """In-process publish/subscribe for active alert lifecycle events"""
+    SUBSCRIBER_BUFFER_SIZE = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: List[AlertSubscription] = []
+        self._sequence = itertools.count(1)
+        self._fleet_by_vin: Dict[str, str] = {}
+        self._forwarder = None
+        self.published = 0
+
+    def set_forwarder(self, forwarder):
+        """Hand events to another process instead of local subscribers (used by ingest shards)"""
+        self._forwarder = forwarder
+
+    @property
+    def wants_events(self) -> bool:
+        """Whether publishing would reach anyone; lets callers skip building alert payloads"""
+        return self._forwarder is not None or bool(self._subscribers)
+
+    def subscribe(self, fleet_id: Optional[str] = None, vehicle_vin: Optional[str] = None,
+                  alert_type: Optional[str] = None, severity: Optional[str] = None) -> AlertSubscription:
+        subscription = AlertSubscription(
+            self,
+            {"fleet_id": fleet_id, "vehicle_vin": vehicle_vin, "alert_type": alert_type, "severity": severity},
+            asyncio.get_running_loop(),
+            self.SUBSCRIBER_BUFFER_SIZE
+        )
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: AlertSubscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, event_type: str, alert):
+        """Fan an alert event out to matching subscribers; free when nobody is listening"""
+        if self._forwarder is not None and alert is not None:
+            self._forwarder(event_type, alert)
+            return
+        if not self._subscribers or alert is None:
+            return
+        alert_data = alert.model_dump(mode="json")
+        event = {
+            "id": next(self._sequence),
+            "event": event_type,
+            "fleet_id": self._fleet_for(alert_data["vehicle_vin"]),
+            "alert": alert_data
+        }
+        with self._lock:
+            self.published += 1
+            for subscription in self._subscribers:
+                if subscription.matches(event):
+                    subscription.offer(event)
+
+    def _fleet_for(self, vin: str) -> Optional[str]:
+        fleet_id = self._fleet_by_vin.get(vin)
+        if fleet_id is None:
+            vehicle = storage.get_vehicle(vin, include_deleted=True)
+            if vehicle:
+                fleet_id = self._fleet_by_vin[vin] = vehicle['fleet_id']
+        return fleet_id
+
+    def forget_vehicle(self, vin: str):
+        self._fleet_by_vin.pop(vin, None)
+
+    def memory_usage(self) -> Dict[str, int]:
+        with self._lock:
+            fixed = sum(estimate_bytes(s._events) for s in self._subscribers)
+            return {"bytes": fixed + estimate_bytes(self._fleet_by_vin), "entries": len(self._fleet_by_vin), "fixed_bytes": fixed}
+
+    def trim(self, max_entries: int) -> int:
+        """Forget cached VIN -> fleet lookups; they are read again from vehicles when needed"""
+        with self._lock:
+            excess = max(0, len(self._fleet_by_vin) - max_entries)
+            for vin in list(islice(self._fleet_by_vin, excess)):
+                del self._fleet_by_vin[vin]
+            return excess
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "delivered": sum(s.delivered for s in self._subscribers),
+                "dropped": sum(s.dropped for s in self._subscribers),
+                "coalesced": sum(s.coalesced for s in self._subscribers),
+                "subscriptions": [
+                    {"filters": s.filters, "buffered": len(s._events), "dropped": s.dropped, "coalesced": s.coalesced}
+                    for s in self._subscribers
+                ]
+            }
+
+alert_event_bus = AlertEventBus()
+memory_accounting.register("alert_event_bus", alert_event_bus.memory_usage, alert_event_bus.trim, budget_bytes=16 * 1024 * 1024)
@@ -0,0 +1,119 @@
+from typing import Dict, Any, List
+from collections import deque
+import threading
+import time
+import zlib
+from services.alert_service import alert_service
+
+class AlertPipeline:
+    """Evaluates alerts for stored telemetry off the ingest request path.
+
+    Samples are sharded by VIN onto a fixed set of worker threads, so every
+    VIN is handled by exactly one worker and its samples are processed in
+    arrival order. Until start() is called samples are processed inline.
+    """
+    NUM_WORKERS = 4
+    MAX_QUEUE_PER_WORKER = 50_000  # ingest blocks once a shard is this far behind
+
+    def __init__(self):
+        self._queues: List[deque] = []
+        self._conditions: List[threading.Condition] = []
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self._stats_lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        if self._running:
+            return
+        self._queues = [deque() for _ in range(self.NUM_WORKERS)]
+        self._conditions = [threading.Condition() for _ in range(self.NUM_WORKERS)]
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._worker, args=(shard,), name=f"alert-worker-{shard}", daemon=True)
+            for shard in range(self.NUM_WORKERS)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Drain queued samples, then stop the workers"""
+        self.wait_until_idle(timeout)
+        self._running = False
+        for condition in self._conditions:
+            with condition:
+                condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def shard_for(self, vin: str) -> int:
+        return zlib.crc32(vin.encode()) % self.NUM_WORKERS
+
+    def submit(self, telemetry_dict: Dict[str, Any]):
+        if not self._running:
+            self._process(telemetry_dict)
+            return
+        shard = self.shard_for(telemetry_dict['vehicle_vin'])
+        queue, condition = self._queues[shard], self._conditions[shard]
+        with condition:
+            while len(queue) >= self.MAX_QUEUE_PER_WORKER and self._running:
+                condition.wait(0.1)
+            queue.append((time.monotonic(), telemetry_dict))
+            condition.notify_all()
+
+    def _worker(self, shard: int):
+        queue, condition = self._queues[shard], self._conditions[shard]
+        while True:
+            with condition:
+                while not queue and self._running:
+                    condition.wait()
+                if not queue:
+                    return
+                # The sample stays at the head until processed so lag and idle checks see it
+                _, telemetry_dict = queue[0]
+            self._process(telemetry_dict)
+            with condition:
+                queue.popleft()
+                condition.notify_all()
+
+    def _process(self, telemetry_dict: Dict[str, Any]):
+        try:
+            alert_service.process_telemetry_alerts(telemetry_dict)
+            with self._stats_lock:
+                self.processed += 1
+        except Exception as e:
+            with self._stats_lock:
+                self.failed += 1
+            print(f"Alert processing failed for VIN {telemetry_dict.get('vehicle_vin')}: {e}")
+
+    def wait_until_idle(self, timeout: float = 10.0) -> bool:
+        deadline = time.monotonic() + timeout
+        for queue, condition in zip(self._queues, self._conditions):
+            with condition:
+                while queue:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    condition.wait(remaining)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        heads = []
+        for queue, condition in zip(self._queues, self._conditions):
+            with condition:
+                if queue:
+                    heads.append(queue[0][0])
+        return {
+            "running": self._running,
+            "workers": self.NUM_WORKERS,
+            "queued": sum(len(queue) for queue in self._queues),
+            "queued_per_worker": [len(queue) for queue in self._queues],
+            "oldest_unprocessed_age_seconds": round(now - min(heads), 3) if heads else 0.0,
+            "processed": self.processed,
+            "failed": self.failed
+        }
+
+alert_pipeline = AlertPipeline()
@@ -0,0 +1,413 @@
+from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta, timezone
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from fastapi import HTTPException, status
+from database.connectDB import execute_query, execute_update, get_db_connection, get_db_path, TIMESTAMP_FORMAT
+from database.telemetry_partitions import telemetry_partitions
+from database.telemetry_rollups import telemetry_rollups
+from models.alert import AlertReplayCreate
+from services.alert_service import AlertService
+from services.alert_sender_service import AlertSenderService
+from services.alert_auto_resolver import AlertAutoResolver, alert_auto_resolver
+from services.ingest_shards import ingest_shards
+from services.response_cache import response_cache
+from services.retention_service import RetentionService
+
+READ_CHUNK_SIZE = 5000  # telemetry rows per read, so no read lock is held for long
+REPLAY_RESOLVED_BY = "system:replay"
+
+def _telemetry_tables(conn, start: datetime, end: datetime) -> List[str]:
+    tables = ["telemetry_data"]
+    for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'telemetry_data_p[0-9]*' ORDER BY name"):
+        day = datetime.strptime(row['name'][len("telemetry_data_p"):], "%Y%m%d").date()
+        if start.date() <= day <= end.date():
+            tables.append(row['name'])
+    return tables
+
+def _evaluate_vin(conn, vin: str, tables: List[str], start: datetime, end: datetime,
+                  speed_limit: float, low_fuel_threshold: float) -> Tuple[int, List[tuple]]:
+    """(samples read, raw alerts in sample order) for one vehicle over [start, end)"""
+    start_str, end_str = start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT)
+    samples, raw_alerts = 0, []
+    for table in tables:
+        last = ("", 0)
+        while True:
+            rows = conn.execute(f"""
+                SELECT id, speed, fuel_battery_level, timestamp FROM {table}
+                WHERE vehicle_vin = ? AND timestamp >= ? AND timestamp < ? AND (timestamp, id) > (?, ?)
+                ORDER BY timestamp, id LIMIT ?
+            """, (vin, start_str, end_str, *last, READ_CHUNK_SIZE)).fetchall()
+            for row in rows:
+                timestamp = None
+                for alert_type, severity, message in AlertService.evaluate_rules(
+                        row['speed'], row['fuel_battery_level'], speed_limit, low_fuel_threshold):
+                    timestamp = timestamp or datetime.fromisoformat(row['timestamp'])
+                    raw_alerts.append((alert_type.value, severity.value, message, timestamp))
+            samples += len(rows)
+            if len(rows) < READ_CHUNK_SIZE:
+                break
+            last = (rows[-1]['timestamp'], rows[-1]['id'])
+    return samples, raw_alerts
+
+def _rebuild_vin(conn, vin: str, raw_alerts: List[tuple], start: datetime, end: datetime, now: datetime) -> Tuple[int, int]:
+    """Replace the vehicle's alerts in [start, end) with raw_alerts and regroup them like the live dedup would"""
+    start_iso, end_iso = start.isoformat(), end.isoformat()
+    automatic = (AlertAutoResolver.RESOLVED_BY, REPLAY_RESOLVED_BY)
+    # Alerts still open at the end have occurrences after it; those are detached here and relinked
+    # after the range, and a status someone set by hand passes to the group that ends where it ended
+    straddling = {row['id']: row for row in conn.execute("""
+        SELECT id, status, resolved_at, resolved_by FROM active_alerts
+        WHERE vehicle_vin = ? AND first_occurrence < ? AND last_occurrence >= ?
+    """, (vin, end_iso, end_iso))}
+    carried = [tuple(row) for row in conn.execute(f"""
+        SELECT a.alert_type, a.severity, a.message, a.timestamp, a.id, ar.active_alert_id
+        FROM alert_relationships ar JOIN alerts a ON a.id = ar.raw_alert_id
+        WHERE ar.active_alert_id IN ({', '.join('?' for _ in straddling)}) AND a.timestamp >= ?
+        ORDER BY a.timestamp, a.id
+    """, (*straddling, end_iso))] if straddling else []
+    conn.executemany("DELETE FROM alert_relationships WHERE raw_alert_id = ?", [(row[4],) for row in carried])
+
+    # Raw alerts and the active alerts opened in range go; their relationships cascade
+    conn.execute("DELETE FROM alerts WHERE vehicle_vin = ? AND timestamp >= ? AND timestamp < ?", (vin, start_iso, end_iso))
+    conn.execute("DELETE FROM active_alerts WHERE vehicle_vin = ? AND first_occurrence >= ? AND first_occurrence < ?", (vin, start_iso, end_iso))
+    # Alerts opened before the range keep only their earlier occurrences; automatic closes are re-decided below
+    conn.execute("""
+        UPDATE OR IGNORE active_alerts
+        SET occurrence_count = (SELECT COUNT(*) FROM alert_relationships ar WHERE ar.active_alert_id = active_alerts.id),
+            related_alerts_count = (SELECT COUNT(*) FROM alert_relationships ar WHERE ar.active_alert_id = active_alerts.id),
+            last_occurrence = COALESCE((
+                SELECT MAX(a.timestamp) FROM alert_relationships ar JOIN alerts a ON a.id = ar.raw_alert_id
+                WHERE ar.active_alert_id = active_alerts.id
+            ), first_occurrence),
+            status = CASE WHEN resolved_by IN (?, ?) AND resolved_at >= ? THEN 'active' ELSE status END,
+            resolved_at = CASE WHEN resolved_by IN (?, ?) AND resolved_at >= ? THEN NULL ELSE resolved_at END,
+            resolved_by = CASE WHEN resolved_by IN (?, ?) AND resolved_at >= ? THEN NULL ELSE resolved_by END
+        WHERE vehicle_vin = ? AND first_occurrence < ? AND (last_occurrence >= ? OR resolved_at >= ?)
+    """, (*(*automatic, start_iso) * 3, vin, start_iso, start_iso, start_iso))
+
+    # Open group per alert type: [id, severity, last_occurrence, occurrence_count]
+    groups: Dict[str, list] = {}
+    for row in conn.execute("""
+        SELECT id, alert_type, severity, status, last_occurrence, occurrence_count FROM active_alerts
+        WHERE vehicle_vin = ? AND first_occurrence < ?
+    """, (vin, start_iso)):
+        # One that straddles the whole range was open throughout it, whatever its status now
+        if row['status'] == 'active' or row['id'] in straddling:
+            groups[row['alert_type']] = [row['id'], row['severity'], datetime.fromisoformat(row['last_occurrence']), row['occurrence_count']]
+    touched = {group[0]: group for group in groups.values()}
+    closed: List[tuple] = []
+    last_raw_alert: Dict[int, int] = {}
+    opened = 0
+
+    def link(alert_type: str, severity: str, message: str, timestamp: datetime, raw_alert_id: Optional[int]) -> list:
+        nonlocal opened
+        quiet_period = AlertAutoResolver.QUIET_PERIODS[alert_type]
+        group = groups.get(alert_type)
+        if group and timestamp - group[2] > quiet_period:
+            # The auto-resolver would have closed it during the gap
+            closed.append((group, group[2] + quiet_period))
+            group = None
+        if raw_alert_id is None:
+            raw_alert_id = conn.execute(
+                "INSERT INTO alerts (alert_id, vehicle_vin, alert_type, severity, message, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(uuid.uuid4()), vin, alert_type, severity, message, timestamp.isoformat())
+            ).lastrowid
+        if group is None:
+            title, description = AlertSenderService._generate_alert_content(
+                {'alert_type': alert_type, 'vehicle_vin': vin, 'message': message}
+            )
+            # Stored closed until the end, so it cannot collide with an alert that is open outside the range
+            cursor = conn.execute("""
+                INSERT INTO active_alerts
+                (alert_sender_id, vehicle_vin, alert_type, severity, title, description,
+                 status, first_occurrence, last_occurrence, occurrence_count)
+                VALUES (?, ?, ?, ?, ?, ?, 'resolved', ?, ?, 0)
+            """, (str(uuid.uuid4()), vin, alert_type, severity, title, description, timestamp.isoformat(), timestamp.isoformat()))
+            group = groups[alert_type] = [cursor.lastrowid, severity, timestamp, 0]
+            touched[cursor.lastrowid] = group
+            opened += 1
+        if severity == 'high':
+            group[1] = 'high'
+        group[2] = timestamp
+        group[3] += 1
+        conn.execute("INSERT INTO alert_relationships (active_alert_id, raw_alert_id) VALUES (?, ?)", (group[0], raw_alert_id))
+        last_raw_alert[group[0]] = raw_alert_id
+        return group
+
+    for alert_type, severity, message, timestamp in raw_alerts:
+        link(alert_type, severity, message, timestamp, None)
+    ends: Dict[int, tuple] = {}
+    for alert_type, severity, message, timestamp, raw_alert_id, previous_id in carried:
+        group = link(alert_type, severity, message, datetime.fromisoformat(timestamp), raw_alert_id)
+        ends[previous_id] = (group[0], raw_alert_id)
+    # Group id -> (status, resolved_at, resolved_by) set by hand on the alert whose last occurrence it now ends on
+    kept_status: Dict[int, tuple] = {}
+    for previous_id, (group_id, raw_alert_id) in ends.items():
+        previous = straddling[previous_id]
+        if last_raw_alert[group_id] == raw_alert_id and previous['status'] != 'active' and previous['resolved_by'] not in automatic:
+            kept_status[group_id] = (previous['status'], previous['resolved_at'], previous['resolved_by'])
+
+    for alert_type, group in groups.items():
+        resolve_at = group[2] + AlertAutoResolver.QUIET_PERIODS[alert_type]
+        if resolve_at <= now and group[0] not in kept_status:
+            closed.append((group, resolve_at))
+    closed_ids = {group[0] for group, _ in closed}
+    related_count = "(SELECT COUNT(*) FROM alert_relationships ar WHERE ar.active_alert_id = active_alerts.id)"
+    for group, resolve_at in closed:
+        if group[0] in kept_status:
+            continue
+        conn.execute(f"""
+            UPDATE active_alerts SET status = 'resolved', resolved_at = ?, resolved_by = ?,
+                severity = ?, last_occurrence = ?, occurrence_count = ?, related_alerts_count = {related_count}
+            WHERE id = ?
+        """, (resolve_at.isoformat(), REPLAY_RESOLVED_BY, group[1], group[2].isoformat(), group[3], group[0]))
+    for group in touched.values():
+        if group[0] in closed_ids and group[0] not in kept_status:
+            continue
+        conn.execute(f"""
+            UPDATE active_alerts SET severity = ?, last_occurrence = ?, occurrence_count = ?, related_alerts_count = {related_count}
+            WHERE id = ?
+        """, (group[1], group[2].isoformat(), group[3], group[0]))
+        if group[0] in kept_status:
+            conn.execute("UPDATE active_alerts SET status = ?, resolved_at = ?, resolved_by = ? WHERE id = ?", (*kept_status[group[0]], group[0]))
+            continue
+        # Still open; stays closed only if the vehicle already has an open alert of this type after the range
+        conn.execute(
+            "UPDATE OR IGNORE active_alerts SET status = 'active', resolved_at = NULL, resolved_by = NULL WHERE id = ?",
+            (group[0],)
+        )
+    return len(raw_alerts), opened
+
+def replay_vins(db_file: str, vins: List[str], start_iso: str, end_iso: str, now_iso: str,
+                speed_limit: float, low_fuel_threshold: float) -> List[Dict[str, Any]]:
+    """Worker-process entry point: re-evaluate each vehicle in order, one write transaction per vehicle"""
+    start, end, now = datetime.fromisoformat(start_iso), datetime.fromisoformat(end_iso), datetime.fromisoformat(now_iso)
+    results = []
+    with get_db_connection(db_file) as conn:
+        # Other workers and live ingest share the write lock
+        conn.execute("PRAGMA busy_timeout = 60000")
+        tables = _telemetry_tables(conn, start, end)
+        for vin in vins:
+            samples, raw_alerts = _evaluate_vin(conn, vin, tables, start, end, speed_limit, low_fuel_threshold)
+            alerts, active_alerts = _rebuild_vin(conn, vin, raw_alerts, start, end, now)
+            conn.commit()
+            results.append({"vin": vin, "samples": samples, "alerts": alerts, "active_alerts": active_alerts})
+    return results
+
+class AlertReplayService:
+    """Re-evaluates alert rules over stored telemetry and rebuilds the alerts they produce.
+
+    A job covers a time range and is split by VIN across a pool of worker
+    processes; each VIN is handled start to finish by one worker, in sample
+    order, so active-alert grouping matches live dedup. Every VIN is rebuilt
+    in its own transaction and recorded in alert_replay_vins, so a paused or
+    interrupted job resumes with the VINs it has not finished. Replay does not
+    send notifications or alert events.
+    """
+    VINS_PER_TASK = 16
+    MAX_WORKERS = max(1, min(os.cpu_count() or 1, 8))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.current_job_id: Optional[int] = None
+
+    def start(self):
+        """Resume a job that was running when the process stopped"""
+        rows = execute_query("SELECT id FROM alert_replays WHERE status = 'running' ORDER BY id LIMIT 1")
+        if rows:
+            self._launch(rows[0]['id'])
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _db_files(self) -> List[str]:
+        if ingest_shards.enabled:
+            return [ingest_shards.shard_db_path(shard) for shard in range(ingest_shards.num_shards)]
+        return [get_db_path()]
+
+    def earliest_start(self) -> datetime:
+        """Oldest start a replay may use: alerts before it could be deleted but not rebuilt from raw telemetry"""
+        cutoff_day = (datetime.utcnow() - timedelta(days=RetentionService.RAW_RETENTION_DAYS)).date()
+        oldest_days = [cutoff_day]
+        for db_file in self._db_files():
+            with get_db_connection(db_file) as conn:
+                oldest_day = telemetry_partitions.oldest_day(conn)
+            if oldest_day is not None:
+                oldest_days.append(oldest_day)
+        return datetime.combine(max(oldest_days), datetime.min.time())
+
+    def create_job(self, request: AlertReplayCreate) -> Dict[str, Any]:
+        # Stored timestamps are naive UTC
+        start, end = (value.astimezone(timezone.utc).replace(tzinfo=None) if value and value.tzinfo else value
+                      for value in (request.start, request.end))
+        end = end or datetime.utcnow()
+        if start >= end:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end")
+        earliest_start = self.earliest_start()
+        if start < earliest_start:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Raw telemetry before {earliest_start.isoformat()} is no longer stored, so alerts before it "
+                       f"cannot be rebuilt; use a start of {earliest_start.isoformat()} or later"
+            )
+        with get_db_connection() as conn:
+            job_id = conn.execute("""
+                INSERT INTO alert_replays (range_start, range_end, speed_limit, low_fuel_threshold, workers, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                start.replace(microsecond=0).isoformat(), end.replace(microsecond=0).isoformat(),
+                AlertService.SPEED_LIMIT if request.speed_limit is None else request.speed_limit,
+                AlertService.LOW_FUEL_THRESHOLD if request.low_fuel_threshold is None else request.low_fuel_threshold,
+                request.workers or self.MAX_WORKERS, datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+            )).lastrowid
+            total = 0
+            for db_file in self._db_files():
+                with get_db_connection(db_file) as source:
+                    vins = [row['vin'] for row in source.execute("SELECT vin FROM vehicles WHERE deleted_at IS NULL")]
+                conn.executemany(
+                    "INSERT INTO alert_replay_vins (replay_id, db_file, vehicle_vin) VALUES (?, ?, ?)",
+                    [(job_id, db_file, vin) for vin in vins]
+                )
+                total += len(vins)
+            conn.execute("UPDATE alert_replays SET total_vins = ? WHERE id = ?", (total, job_id))
+            conn.commit()
+        self._launch(job_id)
+        return self.get_job(job_id)
+
+    def _launch(self, job_id: int):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Replay {self.current_job_id} is still running; pause it or wait for it to finish"
+                )
+            execute_update("UPDATE alert_replays SET status = 'running', error = NULL WHERE id = ?", (job_id,))
+            self._stop_event.clear()
+            self.current_job_id = job_id
+            self._thread = threading.Thread(target=self._run, args=(job_id,), name="alert-replay", daemon=True)
+            self._thread.start()
+
+    def resume(self, job_id: int) -> Dict[str, Any]:
+        job = self.get_job(job_id)
+        if job['status'] not in ('paused', 'failed'):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Replay {job_id} is {job['status']}")
+        self._launch(job_id)
+        return self.get_job(job_id)
+
+    def pause(self, job_id: int) -> Dict[str, Any]:
+        """Stop handing out VINs; batches already in a worker finish first"""
+        if self.current_job_id != job_id or not (self._thread and self._thread.is_alive()):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Replay {job_id} is not running")
+        self._stop_event.set()
+        self._thread.join()
+        return self.get_job(job_id)
+
+    def _run(self, job_id: int):
+        job = execute_query("SELECT * FROM alert_replays WHERE id = ?", (job_id,))[0]
+        pending = execute_query(
+            "SELECT db_file, vehicle_vin FROM alert_replay_vins WHERE replay_id = ? AND completed_at IS NULL ORDER BY db_file, vehicle_vin",
+            (job_id,)
+        )
+        tasks = []
+        for row in pending:
+            if not tasks or tasks[-1][0] != row['db_file'] or len(tasks[-1][1]) >= self.VINS_PER_TASK:
+                tasks.append((row['db_file'], []))
+            tasks[-1][1].append(row['vehicle_vin'])
+
+        started = time.monotonic()
+        now_iso = datetime.utcnow().isoformat()
+        try:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=job['workers'], mp_context=context) as pool:
+                in_flight = set()
+                task_iter = iter(tasks)
+                while True:
+                    while not self._stop_event.is_set() and len(in_flight) < job['workers'] * 2:
+                        task = next(task_iter, None)
+                        if task is None:
+                            break
+                        db_file, vins = task
+                        in_flight.add(pool.submit(
+                            replay_vins, db_file, vins, job['range_start'], job['range_end'], now_iso,
+                            job['speed_limit'], job['low_fuel_threshold']
+                        ))
+                    if not in_flight:
+                        break
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._record_results(job_id, future.result(), time.monotonic() - started)
+                        started = time.monotonic()
+
+            if self._stop_event.is_set() and execute_query(
+                "SELECT 1 FROM alert_replay_vins WHERE replay_id = ? AND completed_at IS NULL LIMIT 1", (job_id,)
+            ):
+                execute_update("UPDATE alert_replays SET status = 'paused' WHERE id = ?", (job_id,))
+                return
+            self._finish(job)
+            execute_update(
+                "UPDATE alert_replays SET status = 'completed', finished_at = ? WHERE id = ?",
+                (datetime.utcnow().strftime(TIMESTAMP_FORMAT), job_id)
+            )
+        except Exception as e:
+            print(f"Alert replay {job_id} failed: {e}")
+            execute_update("UPDATE alert_replays SET status = 'failed', error = ? WHERE id = ?", (f"{type(e).__name__}: {e}", job_id))
+
+    def _record_results(self, job_id: int, results: List[Dict[str, Any]], elapsed: float):
+        completed_at = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+        with get_db_connection() as conn:
+            conn.executemany(
+                "UPDATE alert_replay_vins SET samples = ?, alerts = ?, completed_at = ? WHERE replay_id = ? AND vehicle_vin = ?",
+                [(r['samples'], r['alerts'], completed_at, job_id, r['vin']) for r in results]
+            )
+            conn.execute("""
+                UPDATE alert_replays SET completed_vins = completed_vins + ?, samples_processed = samples_processed + ?,
+                    alerts_created = alerts_created + ?, active_alerts_created = active_alerts_created + ?,
+                    run_seconds = run_seconds + ?
+                WHERE id = ?
+            """, (
+                len(results), sum(r['samples'] for r in results), sum(r['alerts'] for r in results),
+                sum(r['active_alerts'] for r in results), elapsed, job_id
+            ))
+            conn.commit()
+        response_cache.invalidate(*(f"alerts:{r['vin']}" for r in results))
+
+    def _finish(self, job: Dict[str, Any]):
+        """Bring the derived state that the workers bypassed back in line with the rebuilt alerts"""
+        start, end = datetime.fromisoformat(job['range_start']), datetime.fromisoformat(job['range_end'])
+        if ingest_shards.enabled:
+            ingest_shards.fan_out("alert_replay_service", "refresh_derived_state", start, end)
+        else:
+            self.refresh_derived_state(start, end)
+        response_cache.invalidate("analytics")
+
+    @staticmethod
+    def refresh_derived_state(start: datetime, end: datetime):
+        telemetry_rollups.rebuild(start, end)
+        alert_auto_resolver.load_open_alerts()
+
+    def get_job(self, job_id: int) -> Dict[str, Any]:
+        rows = execute_query("SELECT * FROM alert_replays WHERE id = ?", (job_id,))
+        if not rows:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Replay not found")
+        job = rows[0]
+        run_seconds = job['run_seconds'] or 0
+        remaining = job['total_vins'] - job['completed_vins']
+        vins_per_second = job['completed_vins'] / run_seconds if run_seconds else 0
+        job['progress'] = round(job['completed_vins'] / job['total_vins'], 4) if job['total_vins'] else 1.0
+        job['samples_per_second'] = round(job['samples_processed'] / run_seconds, 1) if run_seconds else 0
+        job['vins_per_second'] = round(vins_per_second, 2)
+        job['eta_seconds'] = round(remaining / vins_per_second, 1) if vins_per_second and job['status'] == 'running' else None
+        return job
+
+    def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = execute_query("SELECT id FROM alert_replays ORDER BY id DESC LIMIT ?", (limit,))
+        return [self.get_job(row['id']) for row in rows]
+
+alert_replay_service = AlertReplayService()
@@ -1,96 +1,37 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-import uuid
+import sqlite3
+from fastapi import HTTPException, status
 from models.alert_sender import (
     ActiveAlert, ActiveAlertCreate, ActiveAlertUpdate, 
     ActiveAlertResponse, AlertHistoryResponse, ActiveAlertStatus,
     ActiveAlertType, ActiveAlertSeverity
 )
-from database.connectDB import execute_query, execute_insert, execute_update
+from database.connectDB import execute_query, execute_update
+from database.storage import storage
+from services.alert_event_bus import alert_event_bus
+from services.ingest_shards import ingest_shards
+from services.alert_auto_resolver import alert_auto_resolver
+from services.notification_service import notification_dispatcher
+from services.response_cache import response_cache
 
 class AlertSenderService:
     
     @staticmethod
     def process_raw_alert(raw_alert: dict) -> Optional[ActiveAlertResponse]:
-        existing_active_alert = AlertSenderService._get_active_alert_by_vehicle_and_type(
-            raw_alert['vehicle_vin'], raw_alert['alert_type']
-        )
-        
-        if existing_active_alert:
-            return AlertSenderService._update_existing_active_alert(existing_active_alert, raw_alert)
-        else:
-            return AlertSenderService._create_new_active_alert(raw_alert)
-    
-    @staticmethod
-    def _get_active_alert_by_vehicle_and_type(vehicle_vin: str, alert_type: str) -> Optional[dict]:
-        query = """
-            SELECT * FROM active_alerts 
-            WHERE vehicle_vin = ? AND alert_type = ? AND status = 'active'
-            ORDER BY created_at DESC LIMIT 1
-        """
-        results = execute_query(query, (vehicle_vin, alert_type))
-        return results[0] if results else None
-    
-    @staticmethod
-    def _create_new_active_alert(raw_alert: dict) -> ActiveAlertResponse:
-        alert_sender_id = str(uuid.uuid4())
-        
-        # Generate title and description based on alert type
+        """Create or bump the open alert for (vin, type) and link the raw alert to it in one atomic write"""
         title, description = AlertSenderService._generate_alert_content(raw_alert)
-        
-        query = """
-            INSERT INTO active_alerts 
-            (alert_sender_id, vehicle_vin, alert_type, severity, title, description, 
-             first_occurrence, last_occurrence, occurrence_count)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        
-        timestamp = datetime.fromisoformat(raw_alert['timestamp']) if isinstance(raw_alert['timestamp'], str) else raw_alert['timestamp']
-        
-        params = (
-            alert_sender_id,
-            raw_alert['vehicle_vin'],
-            raw_alert['alert_type'],
-            raw_alert['severity'],
-            title,
-            description,
-            timestamp.isoformat(),
-            timestamp.isoformat(),
-            1
-        )
-        
-        active_alert_id = execute_insert(query, params)
-        AlertSenderService._link_raw_alert_to_active(active_alert_id, raw_alert['id'])
-        return AlertSenderService.get_active_alert_by_id(active_alert_id)
-    
-    @staticmethod
-    def _update_existing_active_alert(existing_alert: dict, raw_alert: dict) -> ActiveAlertResponse:
         timestamp = datetime.fromisoformat(raw_alert['timestamp']) if isinstance(raw_alert['timestamp'], str) else raw_alert['timestamp']
-        
-        # Update the active alert
-        query = """
-            UPDATE active_alerts 
-            SET last_occurrence = ?, occurrence_count = occurrence_count + 1,
-                severity = CASE 
-                    WHEN ? = 'high' THEN 'high'
-                    WHEN ? = 'critical' THEN 'critical'
-                    ELSE severity 
-                END
-            WHERE id = ?
-        """
-        
-        execute_update(query, (timestamp.isoformat(), raw_alert['severity'], raw_alert['severity'], existing_alert['id']))
-        AlertSenderService._link_raw_alert_to_active(existing_alert['id'], raw_alert['id'])
-        
-        return AlertSenderService.get_active_alert_by_id(existing_alert['id'])
-    
-    @staticmethod
-    def _link_raw_alert_to_active(active_alert_id: int, raw_alert_id: int):
-        query = """
-            INSERT OR IGNORE INTO alert_relationships (active_alert_id, raw_alert_id)
-            VALUES (?, ?)
-        """
-        execute_insert(query, (active_alert_id, raw_alert_id))
+        row = storage.record_active_alert({**raw_alert, 'timestamp': timestamp}, title, description)
+        # Covers the raw alert inserted just before, too
+        response_cache.invalidate(f"alerts:{raw_alert['vehicle_vin']}")
+        alert_auto_resolver.track(row['id'], row['alert_type'], datetime.fromisoformat(row['last_occurrence']))
+        
+        active_alert = AlertSenderService.get_active_alert_by_id(row['id'])
+        event_type = "created" if row['created'] else "updated"
+        alert_event_bus.publish(event_type, active_alert)
+        notification_dispatcher.enqueue(event_type, active_alert)
+        return active_alert
     
     @staticmethod
     def _generate_alert_content(raw_alert: dict) -> tuple[str, str]:
@@ -112,17 +53,9 @@ class AlertSenderService:
 
     @staticmethod
     def get_active_alert_by_id(active_alert_id: int) -> Optional[ActiveAlertResponse]:
-        query = """
-            SELECT aa.*, COUNT(ar.raw_alert_id) as related_alerts_count
-            FROM active_alerts aa
-            LEFT JOIN alert_relationships ar ON aa.id = ar.active_alert_id
-            WHERE aa.id = ?
-            GROUP BY aa.id
-        """
-        results = execute_query(query, (active_alert_id,))
+        row = storage.get_active_alert(active_alert_id)
         
-        if results:
-            row = results[0]
+        if row:
             return ActiveAlertResponse(
                 id=row['id'],
                 alert_sender_id=row['alert_sender_id'],
@@ -144,24 +77,19 @@ class AlertSenderService:
     
     @staticmethod
     def get_all_active_alerts(status: Optional[str] = None) -> List[ActiveAlertResponse]:
+        if ingest_shards.enabled:
+            merged = [alert for shard_alerts in ingest_shards.fan_out("alert_sender_service", "get_all_active_alerts", status)
+                      for alert in shard_alerts]
+            return sorted(merged, key=lambda alert: alert.last_occurrence, reverse=True)
         if status:
             query = """
-                SELECT aa.*, COUNT(ar.raw_alert_id) as related_alerts_count
-                FROM active_alerts aa
-                LEFT JOIN alert_relationships ar ON aa.id = ar.active_alert_id
-                WHERE aa.status = ?
-                GROUP BY aa.id
-                ORDER BY aa.last_occurrence DESC
+                SELECT * FROM active_alerts
+                WHERE status = ?
+                ORDER BY last_occurrence DESC
             """
             results = execute_query(query, (status,))
         else:
-            query = """
-                SELECT aa.*, COUNT(ar.raw_alert_id) as related_alerts_count
-                FROM active_alerts aa
-                LEFT JOIN alert_relationships ar ON aa.id = ar.active_alert_id
-                GROUP BY aa.id
-                ORDER BY aa.last_occurrence DESC
-            """
+            query = "SELECT * FROM active_alerts ORDER BY last_occurrence DESC"
             results = execute_query(query)
         
         active_alerts = []
@@ -188,13 +116,12 @@ class AlertSenderService:
     
     @staticmethod
     def get_active_alerts_by_vehicle(vehicle_vin: str) -> List[ActiveAlertResponse]:
+        if ingest_shards.enabled:
+            return ingest_shards.call_for_vin(vehicle_vin, "alert_sender_service", "get_active_alerts_by_vehicle", vehicle_vin)
         query = """
-            SELECT aa.*, COUNT(ar.raw_alert_id) as related_alerts_count
-            FROM active_alerts aa
-            LEFT JOIN alert_relationships ar ON aa.id = ar.active_alert_id
-            WHERE aa.vehicle_vin = ?
-            GROUP BY aa.id
-            ORDER BY aa.last_occurrence DESC
+            SELECT * FROM active_alerts
+            WHERE vehicle_vin = ?
+            ORDER BY last_occurrence DESC
         """
         results = execute_query(query, (vehicle_vin,))
         
@@ -222,6 +149,8 @@ class AlertSenderService:
     
     @staticmethod
     def update_alert_status(alert_sender_id: str, update_data: ActiveAlertUpdate) -> Optional[ActiveAlertResponse]:
+        if ingest_shards.enabled:
+            return ingest_shards.first_result("alert_sender_service", "update_alert_status", alert_sender_id, update_data)
         set_clauses = []
         params = []
         
@@ -248,18 +177,35 @@ class AlertSenderService:
             WHERE alert_sender_id = ?
         """
         
-        affected_rows = execute_update(query, tuple(params))
+        try:
+            affected_rows = execute_update(query, tuple(params))
+        except sqlite3.IntegrityError:
+            # Reopening would give the vehicle two open alerts of the same type
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Another active alert already exists for this vehicle and alert type"
+            )
         
         if affected_rows > 0:
             get_query = "SELECT id FROM active_alerts WHERE alert_sender_id = ?"
             result = execute_query(get_query, (alert_sender_id,))
             if result:
-                return AlertSenderService.get_active_alert_by_id(result[0]['id'])
+                active_alert = AlertSenderService.get_active_alert_by_id(result[0]['id'])
+                response_cache.invalidate(f"alerts:{active_alert.vehicle_vin}")
+                if update_data.status == ActiveAlertStatus.ACTIVE:
+                    # A reopened alert gets a full quiet period from now
+                    alert_auto_resolver.track(active_alert.id, active_alert.alert_type.value, datetime.utcnow())
+                event_type = update_data.status.value if update_data.status else "updated"
+                alert_event_bus.publish(event_type, active_alert)
+                return active_alert
         
         return None
     
     @staticmethod
-    def get_alert_history(alert_sender_id: str) -> Optional[AlertHistoryResponse]:
+    def get_alert_history(alert_sender_id: str, limit: int = 100, before_id: Optional[int] = None) -> Optional[AlertHistoryResponse]:
+        """One page of the linked raw alerts, newest first; pass next_before_id back as before_id for the next page"""
+        if ingest_shards.enabled:
+            return ingest_shards.first_result("alert_sender_service", "get_alert_history", alert_sender_id, limit, before_id)
         get_active_query = "SELECT id FROM active_alerts WHERE alert_sender_id = ?"
         active_result = execute_query(get_active_query, (alert_sender_id,))
         
@@ -268,17 +214,24 @@ class AlertSenderService:
         
         active_alert = AlertSenderService.get_active_alert_by_id(active_result[0]['id'])
         
+        # Keyset on raw_alert_id walks the (active_alert_id, raw_alert_id) index backwards, so every page costs the same
         get_raw_alerts_query = """
-            SELECT a.* FROM alerts a
-            INNER JOIN alert_relationships ar ON a.id = ar.raw_alert_id
-            WHERE ar.active_alert_id = ?
-            ORDER BY a.timestamp DESC
+            SELECT a.* FROM alert_relationships ar
+            INNER JOIN alerts a ON a.id = ar.raw_alert_id
+            WHERE ar.active_alert_id = ? AND ar.raw_alert_id < ?
+            ORDER BY ar.raw_alert_id DESC
+            LIMIT ?
         """
-        raw_alerts = execute_query(get_raw_alerts_query, (active_result[0]['id'],))
+        raw_alerts = execute_query(
+            get_raw_alerts_query,
+            (active_result[0]['id'], before_id if before_id is not None else 2 ** 63 - 1, limit + 1)
+        )
+        next_before_id = raw_alerts[limit - 1]['id'] if len(raw_alerts) > limit else None
         
         return AlertHistoryResponse(
             active_alert=active_alert,
-            raw_alerts=raw_alerts
+            raw_alerts=raw_alerts[:limit],
+            next_before_id=next_before_id
         )
 
 alert_sender_service = AlertSenderService()
@@ -1,66 +1,48 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
-import uuid
 from models.alert import Alert, AlertType, AlertSeverity, AlertResponse
-from database.connectDB import execute_query, execute_insert
+from database.connectDB import execute_query
 from services.alert_sender_service import alert_sender_service
+from services.ingest_shards import ingest_shards
+from database.storage import storage
 
 class AlertService:
     SPEED_LIMIT = 80.0  # km/h , taken as default speed limit
     LOW_FUEL_THRESHOLD = 15.0  # taken as default low fuel/battery threshold percentage
 
     @staticmethod
-    def process_telemetry_alerts(telemetry_data) -> List[Alert]:
-        alerts = []
+    def evaluate_rules(speed: float, fuel_battery_level: float, speed_limit: Optional[float] = None,
+                       low_fuel_threshold: Optional[float] = None) -> List[Tuple[AlertType, AlertSeverity, str]]:
+        """(type, severity, message) for every rule a sample breaks; shared by live alerting and replay"""
+        speed_limit = AlertService.SPEED_LIMIT if speed_limit is None else speed_limit
+        low_fuel_threshold = AlertService.LOW_FUEL_THRESHOLD if low_fuel_threshold is None else low_fuel_threshold
+        violations = []
         
         # Speed violation check
-        if telemetry_data['speed'] > AlertService.SPEED_LIMIT:
-            alert_id = str(uuid.uuid4())
-            query = """
-                INSERT INTO alerts (alert_id, vehicle_vin, alert_type, severity, message, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """
-            params = (
-                alert_id,
-                telemetry_data['vehicle_vin'],
-                AlertType.SPEED_VIOLATION.value,
-                AlertSeverity.HIGH.value,
-                f"Speed violation: {telemetry_data['speed']} km/h (limit: {AlertService.SPEED_LIMIT} km/h)",
-                telemetry_data['timestamp'].isoformat()
-            )
-            execute_insert(query, params)
-            alert = AlertService.get_alert(alert_id)
-            if alert:
-                alerts.append(alert)
-                # Process through Alert Sender
-                raw_alert_dict = {
-                    'id': alert.id,
-                    'vehicle_vin': alert.vehicle_vin,
-                    'alert_type': alert.alert_type,
-                    'severity': alert.severity,
-                    'message': alert.message,
-                    'timestamp': alert.timestamp
-                }
-                alert_sender_service.process_raw_alert(raw_alert_dict)
+        if speed > speed_limit:
+            violations.append((
+                AlertType.SPEED_VIOLATION, AlertSeverity.HIGH,
+                f"Speed violation: {speed} km/h (limit: {speed_limit} km/h)"
+            ))
         
         # Low fuel/battery check
-        if telemetry_data['fuel_battery_level'] < AlertService.LOW_FUEL_THRESHOLD:
-            severity = AlertSeverity.HIGH if telemetry_data['fuel_battery_level'] < 5 else AlertSeverity.MEDIUM
-            alert_id = str(uuid.uuid4())
-            query = """
-                INSERT INTO alerts (alert_id, vehicle_vin, alert_type, severity, message, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """
-            params = (
-                alert_id,
-                telemetry_data['vehicle_vin'],
-                AlertType.LOW_FUEL_BATTERY.value,
-                severity.value,
-                f"Low fuel/battery level: {telemetry_data['fuel_battery_level']}%",
-                telemetry_data['timestamp'].isoformat()
+        if fuel_battery_level < low_fuel_threshold:
+            severity = AlertSeverity.HIGH if fuel_battery_level < 5 else AlertSeverity.MEDIUM
+            violations.append((
+                AlertType.LOW_FUEL_BATTERY, severity,
+                f"Low fuel/battery level: {fuel_battery_level}%"
+            ))
+        return violations
+    
+    @staticmethod
+    def process_telemetry_alerts(telemetry_data) -> List[Alert]:
+        alerts = []
+        violations = AlertService.evaluate_rules(telemetry_data['speed'], telemetry_data['fuel_battery_level'])
+        for alert_type, severity, message in violations:
+            row = storage.insert_alert(
+                telemetry_data['vehicle_vin'], alert_type.value, severity.value, message, telemetry_data['timestamp']
             )
-            execute_insert(query, params)
-            alert = AlertService.get_alert(alert_id)
+            alert = AlertService._row_to_alert(row)
             if alert:
                 alerts.append(alert)
                 # Process through Alert Sender
@@ -73,29 +55,36 @@ class AlertService:
                     'timestamp': alert.timestamp
                 }
                 alert_sender_service.process_raw_alert(raw_alert_dict)
-        
         return alerts
     
+    @staticmethod
+    def _row_to_alert(row: dict) -> Alert:
+        return Alert(
+            id=row['id'],
+            alert_id=row['alert_id'],
+            vehicle_vin=row['vehicle_vin'],
+            alert_type=row['alert_type'],
+            severity=row['severity'],
+            message=row['message'],
+            resolved=bool(row['resolved']),
+            timestamp=datetime.fromisoformat(row['timestamp'])
+        )
+    
     @staticmethod
     def get_alert(alert_id: str) -> Optional[Alert]:
+        if ingest_shards.enabled:
+            return ingest_shards.first_result("alert_service", "get_alert", alert_id)
         query = "SELECT * FROM alerts WHERE alert_id = ?"
         results = execute_query(query, (alert_id,))
         if results:
-            row = results[0]
-            return Alert(
-                id=row['id'],
-                alert_id=row['alert_id'],
-                vehicle_vin=row['vehicle_vin'],
-                alert_type=row['alert_type'],
-                severity=row['severity'],
-                message=row['message'],
-                resolved=bool(row['resolved']),
-                timestamp=datetime.fromisoformat(row['timestamp'])
-            )
+            return AlertService._row_to_alert(results[0])
         return None
     
     @staticmethod
     def get_all_alerts() -> List[AlertResponse]:
+        if ingest_shards.enabled:
+            merged = [alert for shard_alerts in ingest_shards.fan_out("alert_service", "get_all_alerts") for alert in shard_alerts]
+            return sorted(merged, key=lambda alert: alert.timestamp, reverse=True)
         query = "SELECT * FROM alerts ORDER BY timestamp DESC"
         results = execute_query(query)
         alerts = []
@@ -114,6 +103,8 @@ class AlertService:
     
     @staticmethod
     def get_alerts_by_vin(vin: str) -> List[AlertResponse]:
+        if ingest_shards.enabled:
+            return ingest_shards.call_for_vin(vin, "alert_service", "get_alerts_by_vin", vin)
         query = "SELECT * FROM alerts WHERE vehicle_vin = ? ORDER BY timestamp DESC"
         results = execute_query(query, (vin,))
         alerts = []
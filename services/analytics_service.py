@@ -1,49 +1,45 @@
-from typing import Dict, Any
-from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta, timezone
 from collections import Counter
+import re
+from fastapi import HTTPException, status
 from database.connectDB import execute_query
+from database.telemetry_rollups import telemetry_rollups, to_epoch, EPOCH
+from database.storage import storage
+from services.ingest_shards import ingest_shards
+
+INTERVAL_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+def parse_interval(value: str) -> int:
+    match = re.fullmatch(r"(\d+)([mhd])", value.strip())
+    if not match or int(match.group(1)) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="interval must look like 5m, 1h or 1d"
+        )
+    return int(match.group(1)) * INTERVAL_UNITS[match.group(2)]
 
 class AnalyticsService:
+    MAX_POINTS = 2000
+    DEFAULT_WINDOW = timedelta(hours=24)
+
     @staticmethod
     def get_fleet_analytics() -> Dict[str, Any]:
-        cutoff_time = datetime.now() - timedelta(hours=24)
-        cutoff_iso = cutoff_time.isoformat()
-        total_vehicles_query = "SELECT COUNT(*) as count FROM vehicles"
-        total_vehicles = execute_query(total_vehicles_query)[0]['count']
-        active_vehicles_query = """
-            SELECT COUNT(DISTINCT vehicle_vin) as count 
-            FROM telemetry_data 
-            WHERE timestamp > ?
-        """
-        active_vehicles = execute_query(active_vehicles_query, (cutoff_iso,))[0]['count']
-        inactive_vehicles = total_vehicles - active_vehicles
+        total_vehicles = storage.count_vehicles()
         
-        avg_fuel_query = """
-            SELECT AVG(fuel_battery_level) as avg_fuel 
-            FROM telemetry_data 
-            WHERE timestamp > ?
-        """
-        avg_fuel_result = execute_query(avg_fuel_query, (cutoff_iso,))
-        avg_fuel_battery = round(avg_fuel_result[0]['avg_fuel'] or 0, 2)
+        # Shards own disjoint VINs, so their partial aggregates add up
+        if ingest_shards.enabled:
+            partials = ingest_shards.fan_out("analytics_service", "get_fleet_analytics_partials")
+        else:
+            partials = [AnalyticsService.get_fleet_analytics_partials()]
         
-        total_distance_query = """
-            SELECT SUM(latest_odometer.odometer_reading) as total_distance
-            FROM (
-                SELECT DISTINCT vehicle_vin, 
-                MAX(odometer_reading) as odometer_reading
-                FROM telemetry_data 
-                WHERE timestamp > ?
-                GROUP BY vehicle_vin
-            ) as latest_odometer
-        """
-        total_distance_result = execute_query(total_distance_query, (cutoff_iso,))
-        total_distance = round(total_distance_result[0]['total_distance'] or 0, 2)
-
-        all_alerts_query = "SELECT alert_type, severity FROM alerts"
-        all_alerts = execute_query(all_alerts_query)
-        
-        alert_type_counts = Counter(alert['alert_type'] for alert in all_alerts)
-        alert_severity_counts = Counter(alert['severity'] for alert in all_alerts)
+        active_vehicles = sum(p['active_vehicles'] for p in partials)
+        inactive_vehicles = total_vehicles - active_vehicles
+        fuel_samples = sum(p['fuel_samples'] for p in partials)
+        avg_fuel_battery = round(sum(p['fuel_sum'] for p in partials) / fuel_samples, 2) if fuel_samples else 0
+        total_distance = round(sum(p['total_distance'] for p in partials), 2)
+        alert_type_counts = sum((Counter(p['alert_type_counts']) for p in partials), Counter())
+        alert_severity_counts = sum((Counter(p['alert_severity_counts']) for p in partials), Counter())
         
         return {
             "vehicle_status": {
@@ -58,10 +54,153 @@ class AnalyticsService:
                 "total_distance_24h": total_distance
             },
             "alert_summary": {
-                "total_alerts": len(all_alerts),
+                "total_alerts": sum(p['total_alerts'] for p in partials),
                 "by_type": dict(alert_type_counts),
                 "by_severity": dict(alert_severity_counts)
             }
         }
 
+    @staticmethod
+    def get_fleet_analytics_partials() -> Dict[str, Any]:
+        # Stored timestamps are UTC
+        return storage.fleet_aggregates(datetime.utcnow() - timedelta(hours=24))
+
+    @staticmethod
+    def get_time_series(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        interval: Optional[str] = None, fleet_id: Optional[str] = None,
+                        vin: Optional[str] = None) -> Dict[str, Any]:
+        """Bucketed fuel, active-vehicle, distance and alert series over [start, end), one list per metric"""
+        # Rollups are keyed by naive UTC like every stored timestamp
+        start, end = (value.astimezone(timezone.utc).replace(tzinfo=None) if value and value.tzinfo else value for value in (start, end))
+        end = end or datetime.utcnow()
+        start = start or end - AnalyticsService.DEFAULT_WINDOW
+        if start >= end:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end")
+        span = to_epoch(end) - to_epoch(start)
+        # Fine rollups are pruned after a while, so only resolutions still kept at start can answer
+        retained = telemetry_rollups.resolutions_retained_since(start)
+        if interval:
+            interval_seconds = parse_interval(interval)
+        else:
+            # The finest retained resolution within MAX_POINTS; buckets then map one-to-one onto rollup rows
+            interval_seconds = next((r for r in retained if span / r <= AnalyticsService.MAX_POINTS), retained[-1])
+        if all(interval_seconds % r for r in telemetry_rollups.RESOLUTIONS.values()):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"interval must be a multiple of {min(telemetry_rollups.RESOLUTIONS.values())} seconds"
+            )
+        # Of the retained resolutions that tile the interval, the coarsest reads the fewest rows
+        resolution = max((r for r in retained if interval_seconds % r == 0), default=None)
+        if resolution is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Rollups fine enough for a {interval_seconds}-second interval are not kept back to {start.isoformat()}; "
+                       f"use an interval that is a multiple of {retained[0]} seconds"
+            )
+        first_bucket = to_epoch(start) // interval_seconds * interval_seconds
+        end_epoch = -(-to_epoch(end) // interval_seconds) * interval_seconds
+        points = (end_epoch - first_bucket) // interval_seconds
+        if points > AnalyticsService.MAX_POINTS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Request spans {points} buckets; use a coarser interval (limit {AnalyticsService.MAX_POINTS})"
+            )
+
+        args = (first_bucket, end_epoch, interval_seconds, resolution, fleet_id, vin)
+        if ingest_shards.enabled and vin:
+            partials = [ingest_shards.call_for_vin(vin, "analytics_service", "get_time_series_partials", *args)]
+        elif ingest_shards.enabled:
+            partials = ingest_shards.fan_out("analytics_service", "get_time_series_partials", *args)
+        else:
+            partials = [AnalyticsService.get_time_series_partials(*args)]
+
+        # Dense columns: bucket i covers [first_bucket + i * interval, first_bucket + (i + 1) * interval)
+        active = [0] * points
+        samples = [0] * points
+        fuel_sum = [0.0] * points
+        distance = [0.0] * points
+        alerts = [0] * points
+        for partial in partials:
+            for bucket, bucket_active, bucket_samples, bucket_fuel, bucket_distance, bucket_alerts in partial:
+                i = (bucket - first_bucket) // interval_seconds
+                active[i] += bucket_active
+                samples[i] += bucket_samples
+                fuel_sum[i] += bucket_fuel
+                distance[i] += bucket_distance
+                alerts[i] += bucket_alerts
+
+        return {
+            "start": (EPOCH + timedelta(seconds=first_bucket)).isoformat(),
+            "end": (EPOCH + timedelta(seconds=end_epoch)).isoformat(),
+            "interval_seconds": interval_seconds,
+            "resolution_seconds": resolution,
+            "fleet_id": fleet_id,
+            "vehicle_vin": vin,
+            "buckets": [(EPOCH + timedelta(seconds=first_bucket + i * interval_seconds)).isoformat() for i in range(points)],
+            "series": {
+                "average_fuel_battery_level": [round(f / n, 2) if n else None for f, n in zip(fuel_sum, samples)],
+                "active_vehicles": active,
+                "sample_count": samples,
+                "distance": [round(d, 2) for d in distance],
+                "alert_count": alerts
+            }
+        }
+
+    @staticmethod
+    def rebuild_rollups(days: int) -> int:
+        return telemetry_rollups.rebuild(datetime.utcnow() - timedelta(days=days))
+
+    @staticmethod
+    def get_time_series_partials(first_bucket: int, end_epoch: int, interval_seconds: int, resolution: int,
+                                 fleet_id: Optional[str] = None, vin: Optional[str] = None) -> List[tuple]:
+        """(bucket, active vehicles, samples, fuel sum, distance, alerts) rows from this database's rollups"""
+        source, filters, params = "telemetry_rollups", "", [interval_seconds, interval_seconds, resolution, first_bucket, end_epoch]
+        if vin:
+            filters += " AND vehicle_vin = ?"
+            params.append(vin)
+        if fleet_id:
+            # CROSS JOIN pins the fleet's vehicles as the outer loop, so each one is a primary-key range scan
+            source = "vehicles CROSS JOIN telemetry_rollups ON telemetry_rollups.vehicle_vin = vehicles.vin"
+            filters += " AND vehicles.fleet_id = ? AND vehicles.deleted_at IS NULL"
+            params.append(fleet_id)
+        # Distance is each vehicle's travel since its previous reading, so the stretch between
+        # two buckets counts in the later one. The previous reading is the highest odometer of
+        # the vehicle's earlier buckets; for its first bucket in range it is looked up by key.
+        query = f"""
+            WITH per_vehicle AS (
+                SELECT (bucket_start / ?) * ? AS bucket, vehicle_vin,
+                       SUM(sample_count) AS samples, SUM(fuel_sum) AS fuel_sum,
+                       MIN(min_odometer_reading) AS min_odometer, MAX(max_odometer_reading) AS max_odometer,
+                       SUM(alert_count) AS alerts
+                FROM {source}
+                WHERE resolution = ? AND bucket_start >= ? AND bucket_start < ?{filters}
+                GROUP BY bucket, vehicle_vin
+            ), with_previous AS (
+                SELECT *, MAX(max_odometer) OVER (
+                    PARTITION BY vehicle_vin ORDER BY bucket ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                ) AS previous_odometer
+                FROM per_vehicle
+            )
+            SELECT bucket,
+                   COUNT(CASE WHEN samples > 0 THEN 1 END) AS active_vehicles,
+                   SUM(samples) AS samples,
+                   SUM(fuel_sum) AS fuel_sum,
+                   COALESCE(SUM(MAX(0, max_odometer - COALESCE(
+                       previous_odometer,
+                       (SELECT earlier.max_odometer_reading FROM telemetry_rollups earlier
+                        WHERE earlier.resolution = ? AND earlier.vehicle_vin = with_previous.vehicle_vin
+                          AND earlier.bucket_start < ? AND earlier.max_odometer_reading IS NOT NULL
+                        ORDER BY earlier.bucket_start DESC LIMIT 1),
+                       min_odometer
+                   ))), 0) AS distance,
+                   SUM(alerts) AS alerts
+            FROM with_previous
+            GROUP BY bucket
+        """
+        params += [resolution, first_bucket]
+        return [
+            (row['bucket'], row['active_vehicles'], row['samples'], row['fuel_sum'], row['distance'], row['alerts'])
+            for row in execute_query(query, tuple(params))
+        ]
+
 analytics_service = AnalyticsService()
@@ -0,0 +1,190 @@
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+import os
+import sqlite3
+import threading
+import time
+from database import connectDB
+from services.ingest_shards import ingest_shards
+
+class BackupService:
+    """Online backups of the SQLite databases with the backup API.
+
+    The source connection holds one read transaction for the whole copy, so
+    in WAL mode the backup is a consistent snapshot that writers never wait
+    for, and commits made meanwhile do not restart it. Pages are copied
+    PAGES_PER_STEP at a time with a pause in between to cap the I/O it takes
+    from ingest. The WAL cannot be checkpointed past the snapshot until the
+    copy ends, so it grows for the duration of a backup.
+
+    Each copy is written as a .partial file, checked with PRAGMA quick_check
+    and only then renamed into place; the newest KEEP_BACKUPS sets are kept.
+    """
+    BACKUP_DIR = os.environ.get("FLEET_BACKUP_DIR", "backups")
+    INTERVAL_SECONDS = int(os.environ.get("FLEET_BACKUP_INTERVAL_SECONDS", str(6 * 3600)))  # 0 disables the schedule
+    KEEP_BACKUPS = int(os.environ.get("FLEET_BACKUP_KEEP", "7"))
+    PAGES_PER_STEP = 1024
+    STEP_PAUSE_SECONDS = 0.01
+    STAMP_FORMAT = "%Y%m%dT%H%M%SZ"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        self.next_run_at: Optional[datetime] = None
+        self.current: Optional[Dict[str, Any]] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="database-backup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+
+    def request_backup(self):
+        """Run a backup now on the background thread"""
+        self._wakeup.set()
+
+    def _run_loop(self):
+        while not self._stop_event.is_set():
+            timeout = None
+            if self.INTERVAL_SECONDS > 0:
+                self.next_run_at = datetime.utcnow() + timedelta(seconds=self.INTERVAL_SECONDS)
+                timeout = self.INTERVAL_SECONDS
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            if self._stop_event.is_set():
+                break
+            try:
+                self.run_backup()
+            except Exception as e:
+                print(f"Database backup failed: {e}")
+
+    def _sources(self) -> List[str]:
+        sources = [connectDB.get_db_path()]
+        if ingest_shards.enabled:
+            sources += [os.path.abspath(ingest_shards.shard_db_path(shard)) for shard in range(ingest_shards.num_shards)]
+        return sources
+
+    def run_backup(self) -> Dict[str, Any]:
+        """Back up the main database and every shard database as one stamped set"""
+        with self._lock:
+            started = time.monotonic()
+            stamp = datetime.utcnow().strftime(self.STAMP_FORMAT)
+            summary: Dict[str, Any] = {"stamp": stamp, "started_at": datetime.utcnow().isoformat(), "files": [], "error": None}
+            os.makedirs(self.BACKUP_DIR, exist_ok=True)
+            try:
+                for source in self._sources():
+                    summary["files"].append(self._backup_file(source, stamp))
+                summary["removed"] = self._rotate()
+            except Exception as e:
+                summary["error"] = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                self.current = None
+                summary["duration_seconds"] = round(time.monotonic() - started, 3)
+                summary["finished_at"] = datetime.utcnow().isoformat()
+                self.last_run = summary
+            return summary
+
+    def _target_path(self, source: str, stamp: str) -> str:
+        name, ext = os.path.splitext(os.path.basename(source))
+        return os.path.join(self.BACKUP_DIR, f"{name}-{stamp}{ext or '.db'}")
+
+    def _backup_file(self, source: str, stamp: str) -> Dict[str, Any]:
+        target = self._target_path(source, stamp)
+        partial = target + ".partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+        started = time.monotonic()
+        self.current = {"source": source, "target": target, "pages_total": None, "pages_remaining": None, "steps": 0}
+
+        def progress(status, remaining, total):
+            self.current.update(pages_total=total, pages_remaining=remaining, steps=self.current["steps"] + 1)
+
+        src = sqlite3.connect(source, isolation_level=None)
+        dst = sqlite3.connect(partial)
+        try:
+            # Pin one snapshot for every step; commits from other connections then neither block nor restart the copy
+            src.execute("BEGIN")
+            src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            src.backup(dst, pages=self.PAGES_PER_STEP, progress=progress, sleep=self.STEP_PAUSE_SECONDS)
+            src.execute("COMMIT")
+            check = dst.execute("PRAGMA quick_check").fetchone()[0]
+            pages = dst.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            dst.close()
+            src.close()
+        if check != "ok":
+            os.remove(partial)
+            raise RuntimeError(f"Backup of {source} failed verification: {check}")
+        os.replace(partial, target)
+        return {
+            "source": source,
+            "target": os.path.abspath(target),
+            "bytes": os.path.getsize(target),
+            "pages": pages,
+            "verified": True,
+            "duration_seconds": round(time.monotonic() - started, 3)
+        }
+
+    def _is_stamp(self, value: str) -> bool:
+        try:
+            datetime.strptime(value, self.STAMP_FORMAT)
+            return True
+        except ValueError:
+            return False
+
+    def _rotate(self) -> List[str]:
+        """Delete all but the newest KEEP_BACKUPS copies of each source"""
+        removed = []
+        for source in self._sources():
+            name, ext = os.path.splitext(os.path.basename(source))
+            prefix, suffix = f"{name}-", ext or ".db"
+            copies = sorted(
+                entry for entry in os.listdir(self.BACKUP_DIR)
+                if entry.startswith(prefix) and entry.endswith(suffix) and self._is_stamp(entry[len(prefix):-len(suffix)])
+            )
+            for entry in copies[:-self.KEEP_BACKUPS] if self.KEEP_BACKUPS > 0 else []:
+                os.remove(os.path.join(self.BACKUP_DIR, entry))
+                removed.append(entry)
+        return removed
+
+    def list_backups(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.BACKUP_DIR):
+            return []
+        backups = []
+        for entry in sorted(os.listdir(self.BACKUP_DIR), reverse=True):
+            if entry.endswith(".partial"):
+                continue
+            path = os.path.join(self.BACKUP_DIR, entry)
+            backups.append({
+                "name": entry,
+                "bytes": os.path.getsize(path),
+                "modified_at": datetime.utcfromtimestamp(os.path.getmtime(path)).isoformat()
+            })
+        return backups
+
+    def get_status(self) -> Dict[str, Any]:
+        current = dict(self.current) if self.current else None
+        if current and current["pages_total"]:
+            current["progress"] = round(1 - current["pages_remaining"] / current["pages_total"], 4)
+        return {
+            "backup_dir": os.path.abspath(self.BACKUP_DIR),
+            "interval_seconds": self.INTERVAL_SECONDS,
+            "keep_backups": self.KEEP_BACKUPS,
+            "pages_per_step": self.PAGES_PER_STEP,
+            "running": self._lock.locked(),
+            "current": current,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at and self.INTERVAL_SECONDS > 0 else None,
+            "last_run": self.last_run,
+            "backups": self.list_backups()
+        }
+
+backup_service = BackupService()
@@ -0,0 +1,110 @@
+from typing import Dict, Optional, Any
+import threading
+import time
+from models.telemetry import TelemetryCreate, TelemetryResponse, DeadbandConfig
+from services.memory_accounting import memory_accounting, estimate_bytes
+
+class DeadbandService:
+    """Suppresses telemetry samples that did not move beyond a fleet's tolerances.
+
+    Only fleets with a configured deadband are filtered. The last stored sample
+    per VIN is kept in memory and returned in place of a suppressed sample.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fleet_configs: Dict[str, DeadbandConfig] = {}
+        self._last_stored: Dict[str, tuple[float, TelemetryResponse]] = {}
+        self._stored_counts: Dict[str, int] = {}
+        self._suppressed_counts: Dict[str, int] = {}
+
+    def configure_fleet(self, fleet_id: str, config: DeadbandConfig):
+        with self._lock:
+            self._fleet_configs[fleet_id] = config
+
+    def remove_fleet(self, fleet_id: str) -> bool:
+        with self._lock:
+            return self._fleet_configs.pop(fleet_id, None) is not None
+
+    def get_fleet_configs(self) -> Dict[str, DeadbandConfig]:
+        with self._lock:
+            return dict(self._fleet_configs)
+
+    def get_suppressing_sample(self, fleet_id: str, telemetry_data: TelemetryCreate) -> Optional[TelemetryResponse]:
+        """The stored sample that already represents this one, or None if it must be persisted"""
+        config = self._fleet_configs.get(fleet_id)
+        if config is None:
+            return None
+
+        with self._lock:
+            previous = self._last_stored.get(telemetry_data.vehicle_vin)
+            if previous is None:
+                return None
+            stored_at, last = previous
+            if time.monotonic() - stored_at >= config.heartbeat_seconds:
+                return None
+            if self._has_moved(config, last, telemetry_data):
+                return None
+            self._suppressed_counts[fleet_id] = self._suppressed_counts.get(fleet_id, 0) + 1
+            return last
+
+    @staticmethod
+    def _has_moved(config: DeadbandConfig, last: TelemetryResponse, sample: TelemetryCreate) -> bool:
+        if sample.engine_status != last.engine_status:
+            return True
+        if sorted(sample.diagnostic_codes or []) != sorted(last.diagnostic_codes):
+            return True
+        return (
+            abs(sample.latitude - last.latitude) > config.position_tolerance
+            or abs(sample.longitude - last.longitude) > config.position_tolerance
+            or abs(sample.speed - last.speed) > config.speed_tolerance
+            or abs(sample.fuel_battery_level - last.fuel_battery_level) > config.fuel_battery_tolerance
+            or abs(sample.odometer_reading - last.odometer_reading) > config.odometer_tolerance
+        )
+
+    def record_stored(self, fleet_id: str, stored: TelemetryResponse):
+        if fleet_id not in self._fleet_configs:
+            return
+        with self._lock:
+            self._last_stored[stored.vehicle_vin] = (time.monotonic(), stored)
+            self._stored_counts[fleet_id] = self._stored_counts.get(fleet_id, 0) + 1
+
+    def forget_vehicle(self, vin: str):
+        with self._lock:
+            self._last_stored.pop(vin, None)
+
+    def memory_usage(self) -> Dict[str, int]:
+        with self._lock:
+            fixed = estimate_bytes(self._fleet_configs) + estimate_bytes(self._stored_counts) + estimate_bytes(self._suppressed_counts)
+            return {"bytes": fixed + estimate_bytes(self._last_stored), "entries": len(self._last_stored), "fixed_bytes": fixed}
+
+    def trim(self, max_entries: int) -> int:
+        """Forget the least recently stored vehicles; their next sample is simply stored"""
+        with self._lock:
+            excess = len(self._last_stored) - max_entries
+            if excess <= 0:
+                return 0
+            for vin, _ in sorted(self._last_stored.items(), key=lambda item: item[1][0])[:excess]:
+                del self._last_stored[vin]
+            return excess
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            fleets = {}
+            for fleet_id, config in self._fleet_configs.items():
+                stored = self._stored_counts.get(fleet_id, 0)
+                suppressed = self._suppressed_counts.get(fleet_id, 0)
+                fleets[fleet_id] = {
+                    "config": config.model_dump(),
+                    "stored_samples": stored,
+                    "suppressed_samples": suppressed,
+                    "suppression_ratio": round(suppressed / (stored + suppressed), 4) if stored + suppressed else 0.0
+                }
+            return {
+                "fleets": fleets,
+                "tracked_vehicles": len(self._last_stored),
+                "total_suppressed_samples": sum(self._suppressed_counts.values())
+            }
+
+deadband_service = DeadbandService()
+memory_accounting.register("deadband", deadband_service.memory_usage, deadband_service.trim, budget_bytes=64 * 1024 * 1024)
@@ -0,0 +1,146 @@
+from typing import Dict, Optional, Any
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import math
+import threading
+import time
+from models.telemetry import TelemetryCreate
+from services.memory_accounting import memory_accounting, estimate_bytes
+from database.storage import storage
+
+class BloomFilter:
+    def __init__(self, capacity: int, false_positive_rate: float):
+        self.num_bits = max(8, int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self.created_at = time.monotonic()
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+class IdempotencyService:
+    """Detects retried telemetry samples without a database round trip per sample.
+
+    Keys live in two rotating Bloom filter generations covering the dedup window
+    plus a bounded LRU map of key -> telemetry id. A Bloom miss proves a key is
+    new; only Bloom hits that miss the LRU are confirmed against the
+    telemetry_ingest_keys primary key.
+    """
+    WINDOW_SECONDS = 24 * 3600
+    FILTER_CAPACITY = 1_000_000  # keys per Bloom generation
+    FALSE_POSITIVE_RATE = 0.001
+    LRU_SIZE = 100_000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = BloomFilter(self.FILTER_CAPACITY, self.FALSE_POSITIVE_RATE)
+        self._previous: Optional[BloomFilter] = None
+        self._recent: OrderedDict[str, int] = OrderedDict()
+        self._stats = {"checks": 0, "duplicates": 0, "bloom_negatives": 0, "db_confirmations": 0, "false_positives": 0}
+
+    @staticmethod
+    def key_for(telemetry_data: TelemetryCreate) -> Optional[str]:
+        if telemetry_data.idempotency_key:
+            return f"{telemetry_data.vehicle_vin}|k|{telemetry_data.idempotency_key}"
+        if telemetry_data.device_timestamp is None and telemetry_data.seq is None:
+            return None
+        device_ts = telemetry_data.device_timestamp.isoformat() if telemetry_data.device_timestamp else ""
+        seq = "" if telemetry_data.seq is None else telemetry_data.seq
+        return f"{telemetry_data.vehicle_vin}|s|{device_ts}|{seq}"
+
+    def find_duplicate(self, key: str) -> Optional[int]:
+        """Telemetry id already stored under this key, if any"""
+        with self._lock:
+            self._stats["checks"] += 1
+            self._maybe_rotate()
+            if key not in self._current and (self._previous is None or key not in self._previous):
+                self._stats["bloom_negatives"] += 1
+                return None
+            telemetry_id = self._recent.get(key)
+            if telemetry_id is not None:
+                self._recent.move_to_end(key)
+                self._stats["duplicates"] += 1
+                return telemetry_id
+
+        telemetry_id = self.lookup_stored_key(key)
+        with self._lock:
+            self._stats["db_confirmations"] += 1
+            if telemetry_id is None:
+                self._stats["false_positives"] += 1
+            else:
+                self._stats["duplicates"] += 1
+        return telemetry_id
+
+    @staticmethod
+    def lookup_stored_key(key: str) -> Optional[int]:
+        return storage.get_ingest_key(key)
+
+    def remember(self, key: str, telemetry_id: int):
+        with self._lock:
+            self._current.add(key)
+            self._recent[key] = telemetry_id
+            self._recent.move_to_end(key)
+            if len(self._recent) > self.LRU_SIZE:
+                self._recent.popitem(last=False)
+
+    def _maybe_rotate(self):
+        # A generation rotates after a full window, so the retired one still holds every key of the
+        # last window; a generation that fills up first rotates early and shortens that coverage
+        age = time.monotonic() - self._current.created_at
+        if age < self.WINDOW_SECONDS and self._current.count < self.FILTER_CAPACITY:
+            return
+        self._previous = self._current
+        self._current = BloomFilter(self.FILTER_CAPACITY, self.FALSE_POSITIVE_RATE)
+        threading.Thread(target=self.prune_expired_keys, daemon=True).start()
+
+    def prune_expired_keys(self) -> int:
+        return storage.prune_ingest_keys(datetime.utcnow() - timedelta(seconds=self.WINDOW_SECONDS))
+
+    def load_recent_keys(self):
+        """Warm the filters from the keys table after a restart"""
+        keys = storage.ingest_keys_since(datetime.utcnow() - timedelta(seconds=self.WINDOW_SECONDS))
+        with self._lock:
+            for key in keys:
+                self._current.add(key)
+
+    def memory_usage(self) -> Dict[str, int]:
+        with self._lock:
+            # The Bloom filters are preallocated, so only the LRU can shrink
+            fixed = len(self._current.bits) + (len(self._previous.bits) if self._previous else 0)
+            return {"bytes": fixed + estimate_bytes(self._recent), "entries": len(self._recent), "fixed_bytes": fixed}
+
+    def trim(self, max_entries: int) -> int:
+        """Drop least recently used keys; their retries are confirmed against telemetry_ingest_keys instead"""
+        with self._lock:
+            evicted = 0
+            while len(self._recent) > max_entries:
+                self._recent.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            filter_bytes = len(self._current.bits) + (len(self._previous.bits) if self._previous else 0)
+            return {
+                **self._stats,
+                "window_seconds": self.WINDOW_SECONDS,
+                "lru_entries": len(self._recent),
+                "bloom_keys": self._current.count + (self._previous.count if self._previous else 0),
+                "bloom_bytes": filter_bytes
+            }
+
+idempotency_service = IdempotencyService()
+memory_accounting.register("idempotency", idempotency_service.memory_usage, idempotency_service.trim, budget_bytes=64 * 1024 * 1024)
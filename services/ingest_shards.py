@@ -0,0 +1,208 @@
+from typing import Any, Dict, List, Optional
+from concurrent.futures import Future
+import itertools
+import multiprocessing
+import os
+import threading
+import zlib
+from fastapi import HTTPException
+
+def _shard_main(shard: int, db_file: str, requests, responses, deadband_configs: Dict[str, Any]):
+    """Entry point of a shard process: owns one SQLite file and its own service pipeline"""
+    from database import connectDB
+    connectDB.DB_FILE = db_file
+    connectDB.init_database()
+
+    from database.telemetry_partitions import telemetry_partitions
+    from services.telemetry_service import telemetry_service
+    from services.alert_service import alert_service
+    from services.alert_sender_service import alert_sender_service
+    from services.analytics_service import analytics_service
+    from services.vehicle_service import vehicle_service
+    from services.alert_pipeline import alert_pipeline
+    from services.retention_service import retention_service
+    from services.idempotency_service import idempotency_service
+    from services.alert_event_bus import alert_event_bus
+    from services.alert_auto_resolver import alert_auto_resolver
+    from services.notification_service import notification_dispatcher
+    from services.vehicle_purge_service import vehicle_purge_service
+    from services.response_cache import response_cache
+    from services.alert_replay_service import alert_replay_service
+    from services.memory_accounting import memory_accounting
+    from services.telemetry_ring_buffer import telemetry_ring_buffer
+    from services.deadband_service import deadband_service
+
+    # Alert events are published by the API process, where the SSE subscribers live
+    alert_event_bus.set_forwarder(lambda event_type, alert: responses.put((0, "event", (event_type, alert))))
+    # Likewise the response cache, so shard-side alert writes invalidate it there
+    response_cache.set_forwarder(lambda tags: responses.put((0, "invalidate", tags)))
+    telemetry_partitions.refresh()
+    # Deadband is applied where samples are stored; later changes are fanned out by the API process
+    for fleet_id, config in deadband_configs.items():
+        deadband_service.configure_fleet(fleet_id, config)
+    idempotency_service.load_recent_keys()
+    alert_pipeline.start()
+    retention_service.start()
+    alert_auto_resolver.start()
+    notification_dispatcher.start()
+    vehicle_purge_service.start()
+    memory_accounting.start()
+
+    services = {
+        "telemetry_service": telemetry_service,
+        "alert_service": alert_service,
+        "alert_sender_service": alert_sender_service,
+        "analytics_service": analytics_service,
+        "vehicle_service": vehicle_service,
+        "alert_pipeline": alert_pipeline,
+        "alert_auto_resolver": alert_auto_resolver,
+        "notification_dispatcher": notification_dispatcher,
+        "vehicle_purge_service": vehicle_purge_service,
+        "alert_replay_service": alert_replay_service,
+        "memory_accounting": memory_accounting,
+        "telemetry_ring_buffer": telemetry_ring_buffer,
+        "deadband_service": deadband_service,
+        "idempotency_service": idempotency_service,
+        "retention_service": retention_service,
+    }
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        request_id, service, method, args = item
+        try:
+            responses.put((request_id, "ok", getattr(services[service], method)(*args)))
+        except HTTPException as e:
+            responses.put((request_id, "http", (e.status_code, e.detail)))
+        except Exception as e:
+            responses.put((request_id, "error", f"{type(e).__name__}: {e}"))
+
+    alert_pipeline.stop()
+    retention_service.stop()
+    alert_auto_resolver.stop()
+    notification_dispatcher.stop()
+    vehicle_purge_service.stop()
+    memory_accounting.stop()
+
+class IngestShardPool:
+    """Runs N shard processes, each owning the telemetry and alerts of the VINs hashed to it.
+
+    The API process keeps the vehicle registry and routes per-VIN calls to the
+    owning shard; fleet-wide reads are fanned out and merged by the caller.
+    Disabled (NUM_SHARDS = 0) unless FLEET_INGEST_SHARDS is set.
+    """
+    NUM_SHARDS = int(os.environ.get("FLEET_INGEST_SHARDS", "0"))
+    CALL_TIMEOUT_SECONDS = 60
+
+    def __init__(self):
+        self._processes = []
+        self._requests = []
+        self._collectors = []
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self.enabled = False
+
+    def shard_db_path(self, shard: int) -> str:
+        from database import connectDB
+        root, ext = os.path.splitext(connectDB.DB_FILE)
+        return f"{root}.shard{shard}{ext or '.db'}"
+
+    def start(self, num_shards: Optional[int] = None):
+        num_shards = self.NUM_SHARDS if num_shards is None else num_shards
+        if self.enabled or num_shards <= 0:
+            return
+        from services.deadband_service import deadband_service
+        deadband_configs = deadband_service.get_fleet_configs()
+        context = multiprocessing.get_context("spawn")
+        for shard in range(num_shards):
+            requests, responses = context.Queue(), context.Queue()
+            process = context.Process(
+                target=_shard_main, args=(shard, self.shard_db_path(shard), requests, responses, deadband_configs),
+                name=f"ingest-shard-{shard}", daemon=True
+            )
+            process.start()
+            collector = threading.Thread(target=self._collect, args=(responses,), name=f"ingest-shard-{shard}-results", daemon=True)
+            collector.start()
+            self._processes.append(process)
+            self._requests.append(requests)
+            self._collectors.append((collector, responses))
+        self.enabled = True
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for requests in self._requests:
+            requests.put(None)
+        for process in self._processes:
+            process.join(30)
+        for _, responses in self._collectors:
+            responses.put(None)
+        self._processes, self._requests, self._collectors = [], [], []
+
+    def _collect(self, responses):
+        while True:
+            item = responses.get()
+            if item is None:
+                return
+            request_id, kind, payload = item
+            if kind == "event":
+                from services.alert_event_bus import alert_event_bus
+                alert_event_bus.publish(*payload)
+                continue
+            if kind == "invalidate":
+                from services.response_cache import response_cache
+                response_cache.invalidate(*payload)
+                continue
+            with self._pending_lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if kind == "ok":
+                future.set_result(payload)
+            elif kind == "http":
+                future.set_exception(HTTPException(status_code=payload[0], detail=payload[1]))
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    @property
+    def num_shards(self) -> int:
+        return len(self._processes)
+
+    def shard_for(self, vin: str) -> int:
+        return zlib.crc32(vin.encode()) % self.num_shards
+
+    def submit(self, shard: int, service: str, method: str, *args) -> Future:
+        future = Future()
+        request_id = next(self._request_ids)
+        with self._pending_lock:
+            self._pending[request_id] = future
+        self._requests[shard].put((request_id, service, method, args))
+        return future
+
+    def call(self, shard: int, service: str, method: str, *args) -> Any:
+        return self.submit(shard, service, method, *args).result(self.CALL_TIMEOUT_SECONDS)
+
+    def call_for_vin(self, vin: str, service: str, method: str, *args) -> Any:
+        return self.call(self.shard_for(vin), service, method, *args)
+
+    def fan_out(self, service: str, method: str, *args) -> List[Any]:
+        futures = [self.submit(shard, service, method, *args) for shard in range(self.num_shards)]
+        return [future.result(self.CALL_TIMEOUT_SECONDS) for future in futures]
+
+    def first_result(self, service: str, method: str, *args) -> Any:
+        """Fan out a lookup by a globally unique key and return the owning shard's answer"""
+        return next((result for result in self.fan_out(service, method, *args) if result is not None), None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "shards": [
+                {"shard": shard, "pid": process.pid, "alive": process.is_alive(), "db_file": self.shard_db_path(shard)}
+                for shard, process in enumerate(self._processes)
+            ],
+            "pending_calls": len(self._pending)
+        }
+
+ingest_shards = IngestShardPool()
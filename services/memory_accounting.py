@@ -0,0 +1,236 @@
+from typing import Any, Callable, Dict, Optional
+from datetime import datetime
+from itertools import islice
+import os
+import re
+import sys
+import threading
+import tracemalloc
+import types
+from fastapi import HTTPException, status
+
+SIZE_UNITS = {"": 1, "b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}
+
+def parse_size(value: str) -> int:
+    """Bytes for sizes like 512KB, 64MB or 1048576"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmg]?b?)\s*", value.lower())
+    if not match:
+        raise ValueError(f"Invalid size {value!r}; use e.g. 512KB, 64MB or a byte count")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+def deep_sizeof(value: Any, _seen: Optional[set] = None) -> int:
+    """Approximate bytes held by a value and everything it references, counting shared objects once"""
+    seen = set() if _seen is None else _seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in value)
+    elif isinstance(value, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+        pass
+    elif hasattr(value, "__dict__"):
+        size += deep_sizeof(vars(value), seen)
+    elif hasattr(value, "__slots__"):
+        size += sum(deep_sizeof(getattr(value, name), seen) for name in value.__slots__ if hasattr(value, name))
+    return size
+
+def estimate_bytes(container, sample_size: int = 64) -> int:
+    """Container overhead plus its length times the mean deep size of the first sample_size items"""
+    size = sys.getsizeof(container)
+    count = len(container)
+    if not count:
+        return size
+    items = container.items() if isinstance(container, dict) else container
+    sample = list(islice(iter(items), sample_size))
+    return size + count * sum(deep_sizeof(item) for item in sample) // len(sample)
+
+class MemoryComponent:
+    def __init__(self, name: str, usage: Callable[[], Dict[str, int]], trim: Optional[Callable[[int], int]],
+                 budget_bytes: Optional[int]):
+        self.name = name
+        self.usage = usage
+        self.trim = trim
+        self.budget_bytes = budget_bytes
+        self.trims = 0
+        self.evicted_entries = 0
+        self.last_usage: Dict[str, int] = {"bytes": 0, "entries": 0}
+
+class MemoryAccounting:
+    """Registry of in-process state with approximate sizes and per-component budgets.
+
+    A component reports {"bytes", "entries", "fixed_bytes"}, where fixed_bytes
+    is the part that trimming cannot free (preallocated filters, counters).
+    Trimmable components pass trim(max_entries), which drops their least useful
+    entries; each must stay correct without them, e.g. by falling back to the
+    database. A component over budget is trimmed to LOW_WATERMARK of it so it
+    is not trimmed again on the next check. Budgets come from the registering
+    code, FLEET_MEMORY_BUDGETS ("deadband=32MB,idempotency=16MB") or the admin API.
+    """
+    CHECK_INTERVAL_SECONDS = float(os.environ.get("FLEET_MEMORY_CHECK_SECONDS", "10"))
+    LOW_WATERMARK = 0.8
+    TRACEMALLOC_FRAMES = 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._components: Dict[str, MemoryComponent] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._baseline_at: Optional[datetime] = None
+        self._configured_budgets = {
+            name.strip(): parse_size(size)
+            for name, _, size in (item.partition("=") for item in os.environ.get("FLEET_MEMORY_BUDGETS", "").split(",") if item.strip())
+        }
+        self.last_check: Optional[Dict[str, Any]] = None
+
+    def register(self, name: str, usage: Callable[[], Dict[str, int]], trim: Optional[Callable[[int], int]] = None,
+                 budget_bytes: Optional[int] = None):
+        budget_bytes = self._configured_budgets.get(name, budget_bytes)
+        with self._lock:
+            self._components[name] = MemoryComponent(name, usage, trim, budget_bytes if trim else None)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="memory-accounting", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run_loop(self):
+        while not self._stop_event.wait(self.CHECK_INTERVAL_SECONDS):
+            try:
+                self.enforce()
+            except Exception as e:
+                print(f"Memory budget check failed: {e}")
+
+    def _component(self, name: str) -> MemoryComponent:
+        component = self._components.get(name)
+        if component is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No memory component named {name}")
+        return component
+
+    def set_budget(self, name: str, budget_bytes: Optional[int]) -> Dict[str, Any]:
+        component = self._component(name)
+        if budget_bytes is not None and component.trim is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{name} cannot evict entries, so it cannot be given a budget"
+            )
+        component.budget_bytes = budget_bytes
+        self.enforce()
+        return self._describe(component)
+
+    def _measure(self, component: MemoryComponent) -> Dict[str, int]:
+        usage = component.usage()
+        component.last_usage = {"bytes": usage["bytes"], "entries": usage.get("entries", 0), "fixed_bytes": usage.get("fixed_bytes", 0)}
+        return component.last_usage
+
+    def enforce(self) -> Dict[str, Any]:
+        """Measure every component and trim the ones over budget"""
+        trimmed = {}
+        for component in list(self._components.values()):
+            usage = self._measure(component)
+            if component.budget_bytes is None or usage["bytes"] <= component.budget_bytes or not usage["entries"]:
+                continue
+            per_entry = max(1, (usage["bytes"] - usage["fixed_bytes"]) / usage["entries"])
+            keep = max(0, int((component.budget_bytes * self.LOW_WATERMARK - usage["fixed_bytes"]) / per_entry))
+            evicted = component.trim(keep)
+            component.trims += 1
+            component.evicted_entries += evicted
+            trimmed[component.name] = {"bytes_before": usage["bytes"], "evicted_entries": evicted}
+            self._measure(component)
+        self.last_check = {"checked_at": datetime.utcnow().isoformat(), "trimmed": trimmed}
+        return self.last_check
+
+    def _describe(self, component: MemoryComponent) -> Dict[str, Any]:
+        return {
+            **component.last_usage,
+            "budget_bytes": component.budget_bytes,
+            "trimmable": component.trim is not None,
+            "trims": component.trims,
+            "evicted_entries": component.evicted_entries
+        }
+
+    @staticmethod
+    def process_rss_bytes() -> Optional[int]:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return None
+
+    def get_usage(self) -> Dict[str, Any]:
+        components = {}
+        for component in list(self._components.values()):
+            self._measure(component)
+            components[component.name] = self._describe(component)
+        return {
+            "process_rss_bytes": self.process_rss_bytes(),
+            "accounted_bytes": sum(c["bytes"] for c in components.values()),
+            "components": components,
+            "check_interval_seconds": self.CHECK_INTERVAL_SECONDS,
+            "last_check": self.last_check,
+            "tracemalloc": {
+                "tracing": tracemalloc.is_tracing(),
+                "baseline_at": self._baseline_at.isoformat() if self._baseline_at else None
+            }
+        }
+
+    def start_tracemalloc(self, frames: int = TRACEMALLOC_FRAMES) -> Dict[str, Any]:
+        """Start tracing allocations (if needed) and take the baseline later diffs compare against"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._baseline = self._snapshot()
+        self._baseline_at = datetime.utcnow()
+        current, peak = tracemalloc.get_traced_memory()
+        return {"tracing": True, "baseline_at": self._baseline_at.isoformat(), "traced_bytes": current, "peak_bytes": peak}
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        # tracemalloc's own bookkeeping and imports would otherwise top every diff
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def tracemalloc_diff(self, top: int = 20, reset: bool = False) -> Dict[str, Any]:
+        """Largest allocation changes by source line since the baseline"""
+        if not tracemalloc.is_tracing() or self._baseline is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="tracemalloc is not running; start it with POST /admin/memory/tracemalloc"
+            )
+        snapshot = self._snapshot()
+        stats = snapshot.compare_to(self._baseline, "lineno")
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            "baseline_at": self._baseline_at.isoformat(),
+            "taken_at": datetime.utcnow().isoformat(),
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_bytes": stat.size,
+                    "size_diff_bytes": stat.size_diff,
+                    "count": stat.count,
+                    "count_diff": stat.count_diff
+                }
+                for stat in stats[:top]
+            ]
+        }
+        if reset:
+            self._baseline, self._baseline_at = snapshot, datetime.utcnow()
+        return result
+
+    def stop_tracemalloc(self):
+        tracemalloc.stop()
+        self._baseline = self._baseline_at = None
+
+memory_accounting = MemoryAccounting()
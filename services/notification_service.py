@@ -0,0 +1,320 @@
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import asyncio
+import json
+import random
+import threading
+import time
+from database.connectDB import execute_query, execute_update, get_db_connection
+from services.notification_sinks import NotificationSink, sinks_from_environment
+
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+class NotificationDispatcher:
+    """Delivers new and escalated active alerts to the registered sinks.
+
+    Every notification is written to notification_outbox before anything is
+    sent, so a restart resumes where delivery stopped. Each sink has its own
+    asyncio task on a background event loop; it waits for queued work,
+    lingers briefly to build a batch, and hands the batch to the sink's
+    dedicated I/O thread, so a slow sink never holds up the others or ingest.
+    Failed batches are retried with exponential backoff until MAX_ATTEMPTS.
+    """
+    BATCH_SIZE = 100
+    LINGER_SECONDS = 1.0  # wait for more alerts before sending a batch
+    MIN_BATCH_INTERVAL_SECONDS = 0.2  # per-sink rate limit
+    POLL_SECONDS = 5.0  # picks up retries whose backoff has elapsed
+    RETRY_BASE_SECONDS = 2.0
+    RETRY_MAX_SECONDS = 600.0
+    MAX_ATTEMPTS = 10
+    DELIVERED_RETENTION_DAYS = 7
+    PRUNE_INTERVAL_SECONDS = 3600
+    SEVERITY_CACHE_SIZE = 100_000
+
+    def __init__(self):
+        self._sinks: Dict[str, NotificationSink] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._notified_severity: "OrderedDict[str, str]" = OrderedDict()
+        self._last_prune = 0.0
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self.enqueued = 0
+
+    def register_sink(self, sink: NotificationSink):
+        """Add a sink; takes effect on the next start()"""
+        self._sinks[sink.name] = sink
+        self._stats[sink.name] = {
+            "batches": 0, "delivered": 0, "failed_batches": 0, "dead": 0,
+            "last_error": None, "last_delivery_at": None
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self):
+        if self.running:
+            return
+        if not self._sinks:
+            for sink in sinks_from_environment():
+                self.register_sink(sink)
+        if not self._sinks:
+            return
+        self._requeue_in_flight()
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="notification-dispatcher", daemon=True)
+        self._thread.start()
+        ready.wait(5)
+
+    @staticmethod
+    def _requeue_in_flight():
+        """Send batches that were in flight when the process died again"""
+        with get_db_connection() as conn:
+            conn.execute("UPDATE OR IGNORE notification_outbox SET status = 'pending' WHERE status = 'sending'")
+            # Rows left behind already have a newer event queued; fold them into it as _mark_failed does
+            leftovers = conn.execute(
+                "SELECT id, sink, alert_sender_id, event_type FROM notification_outbox WHERE status = 'sending'"
+            ).fetchall()
+            for row in leftovers:
+                conn.execute(
+                    """UPDATE notification_outbox
+                       SET event_type = CASE WHEN ? = 'created' THEN 'created' ELSE event_type END
+                       WHERE sink = ? AND alert_sender_id = ? AND status = 'pending'""",
+                    (row['event_type'], row['sink'], row['alert_sender_id'])
+                )
+                conn.execute("DELETE FROM notification_outbox WHERE id = ?", (row['id'],))
+            conn.commit()
+
+    def stop(self, timeout: float = 10.0):
+        if not self.running:
+            return
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(timeout)
+
+    def _run(self, ready: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._stopping = asyncio.Event()
+        self._wakeups = {name: asyncio.Event() for name in self._sinks}
+        ready.set()
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+
+    async def _main(self):
+        await asyncio.gather(*(self._sink_loop(sink) for sink in self._sinks.values()))
+
+    # Enqueueing (called from alert processing threads)
+
+    def enqueue(self, event_type: str, alert) -> bool:
+        """Queue a notification if the alert is new or its severity went up; a no-op without sinks"""
+        if not self._sinks or alert is None:
+            return False
+        event_type = self._notification_event(event_type, alert)
+        if event_type is None:
+            return False
+
+        now = datetime.utcnow().isoformat()
+        payload = json.dumps(alert.model_dump(mode="json"))
+        severity = alert.severity.value
+        # A notification still waiting in the outbox is refreshed instead of sending a second one
+        query = """
+            INSERT INTO notification_outbox
+            (sink, alert_sender_id, event_type, severity, payload, next_attempt_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(sink, alert_sender_id) WHERE status = 'pending' DO UPDATE
+            SET event_type = CASE WHEN event_type = 'created' THEN 'created' ELSE excluded.event_type END,
+                severity = excluded.severity,
+                payload = excluded.payload
+        """
+        with get_db_connection() as conn:
+            conn.executemany(query, [
+                (name, alert.alert_sender_id, event_type, severity, payload, now, now) for name in self._sinks
+            ])
+            conn.commit()
+        with self._lock:
+            self.enqueued += 1
+
+        if self.running:
+            for wakeup in self._wakeups.values():
+                self._loop.call_soon_threadsafe(wakeup.set)
+        return True
+
+    def _notification_event(self, event_type: str, alert) -> Optional[str]:
+        severity = alert.severity.value
+        with self._lock:
+            previous = self._notified_severity.pop(alert.alert_sender_id, None)
+        if previous is None and event_type != "created":
+            rows = execute_query(
+                "SELECT severity FROM notification_outbox WHERE alert_sender_id = ? ORDER BY id DESC LIMIT 1",
+                (alert.alert_sender_id,)
+            )
+            previous = rows[0]['severity'] if rows else severity
+
+        if event_type == "created":
+            notify_as = "created"
+        elif SEVERITY_RANK[severity] > SEVERITY_RANK[previous]:
+            notify_as = "escalated"
+        else:
+            notify_as, severity = None, previous
+
+        with self._lock:
+            self._notified_severity[alert.alert_sender_id] = severity
+            if len(self._notified_severity) > self.SEVERITY_CACHE_SIZE:
+                self._notified_severity.popitem(last=False)
+        return notify_as
+
+    # Delivery (runs on the dispatcher event loop)
+
+    async def _sink_loop(self, sink: NotificationSink):
+        loop = asyncio.get_running_loop()
+        io = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"notify-{sink.name}")
+        wakeup = self._wakeups[sink.name]
+        last_sent = 0.0
+        try:
+            while not self._stopping.is_set():
+                rows = await loop.run_in_executor(io, self._claim_batch, sink.name)
+                if not rows:
+                    wakeup.clear()
+                    await self._wait(wakeup, self.POLL_SECONDS)
+                    if wakeup.is_set():
+                        await self._wait(self._stopping, self.LINGER_SECONDS)
+                    continue
+
+                delay = last_sent + self.MIN_BATCH_INTERVAL_SECONDS - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                notifications = [
+                    {"event": row['event_type'], "alert": json.loads(row['payload'])} for row in rows
+                ]
+                try:
+                    await loop.run_in_executor(io, sink.deliver, notifications)
+                except Exception as e:
+                    await loop.run_in_executor(io, self._mark_failed, sink.name, rows, f"{type(e).__name__}: {e}")
+                else:
+                    await loop.run_in_executor(io, self._mark_delivered, sink.name, rows)
+                last_sent = time.monotonic()
+
+                if time.monotonic() - self._last_prune > self.PRUNE_INTERVAL_SECONDS:
+                    self._last_prune = time.monotonic()
+                    await loop.run_in_executor(io, self.prune_delivered)
+        finally:
+            await loop.run_in_executor(io, sink.close)
+            io.shutdown(wait=True)
+
+    async def _wait(self, event: asyncio.Event, timeout: float):
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _claim_batch(self, sink_name: str) -> List[Dict[str, Any]]:
+        query = """
+            UPDATE notification_outbox SET status = 'sending'
+            WHERE id IN (
+                SELECT id FROM notification_outbox
+                WHERE sink = ? AND status = 'pending' AND next_attempt_at <= ?
+                ORDER BY id LIMIT ?
+            )
+            RETURNING id, alert_sender_id, event_type, payload, attempts
+        """
+        with get_db_connection() as conn:
+            rows = [dict(row) for row in conn.execute(query, (sink_name, datetime.utcnow().isoformat(), self.BATCH_SIZE))]
+            conn.commit()
+        return sorted(rows, key=lambda row: row['id'])
+
+    def _mark_delivered(self, sink_name: str, rows: List[Dict[str, Any]]):
+        ids = [row['id'] for row in rows]
+        now = datetime.utcnow().isoformat()
+        execute_update(
+            f"""UPDATE notification_outbox SET status = 'delivered', delivered_at = ?, attempts = attempts + 1, last_error = NULL
+                WHERE id IN ({', '.join('?' for _ in ids)})""",
+            (now, *ids)
+        )
+        with self._lock:
+            stats = self._stats[sink_name]
+            stats["batches"] += 1
+            stats["delivered"] += len(rows)
+            stats["last_delivery_at"] = now
+
+    def _mark_failed(self, sink_name: str, rows: List[Dict[str, Any]], error: str):
+        now = datetime.utcnow()
+        dead = 0
+        with get_db_connection() as conn:
+            for row in rows:
+                attempts = row['attempts'] + 1
+                if attempts >= self.MAX_ATTEMPTS:
+                    conn.execute(
+                        "UPDATE notification_outbox SET status = 'dead', attempts = ?, last_error = ? WHERE id = ?",
+                        (attempts, error, row['id'])
+                    )
+                    dead += 1
+                    continue
+                backoff = min(self.RETRY_MAX_SECONDS, self.RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+                next_attempt = now + timedelta(seconds=backoff * random.uniform(0.5, 1.0))
+                requeued = conn.execute(
+                    """UPDATE OR IGNORE notification_outbox
+                       SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?""",
+                    (attempts, next_attempt.isoformat(), error, row['id'])
+                ).rowcount
+                if not requeued:
+                    # A newer event for this alert is already queued; fold this one into it
+                    conn.execute(
+                        """UPDATE notification_outbox
+                           SET event_type = CASE WHEN ? = 'created' THEN 'created' ELSE event_type END
+                           WHERE sink = ? AND alert_sender_id = ? AND status = 'pending'""",
+                        (row['event_type'], sink_name, row['alert_sender_id'])
+                    )
+                    conn.execute("DELETE FROM notification_outbox WHERE id = ?", (row['id'],))
+            conn.commit()
+        with self._lock:
+            stats = self._stats[sink_name]
+            stats["failed_batches"] += 1
+            stats["dead"] += dead
+            stats["last_error"] = error
+        print(f"Notification delivery to {sink_name} failed: {error}")
+
+    def prune_delivered(self) -> int:
+        cutoff = (datetime.utcnow() - timedelta(days=self.DELIVERED_RETENTION_DAYS)).isoformat()
+        return execute_update(
+            "DELETE FROM notification_outbox WHERE status = 'delivered' AND delivered_at < ?", (cutoff,)
+        )
+
+    def retry_dead(self, sink_name: Optional[str] = None) -> int:
+        """Give dead notifications a fresh set of attempts"""
+        query = """
+            UPDATE OR IGNORE notification_outbox
+            SET status = 'pending', attempts = 0, next_attempt_at = ?
+            WHERE status = 'dead'
+        """
+        params = [datetime.utcnow().isoformat()]
+        if sink_name:
+            query += " AND sink = ?"
+            params.append(sink_name)
+        requeued = execute_update(query, tuple(params))
+        if requeued and self.running:
+            for wakeup in self._wakeups.values():
+                self._loop.call_soon_threadsafe(wakeup.set)
+        return requeued
+
+    def get_stats(self) -> Dict[str, Any]:
+        outbox: Dict[str, Dict[str, int]] = {}
+        for row in execute_query("SELECT sink, status, COUNT(*) as count FROM notification_outbox GROUP BY sink, status"):
+            outbox.setdefault(row['sink'], {})[row['status']] = row['count']
+        with self._lock:
+            return {
+                "running": self.running,
+                "enqueued": self.enqueued,
+                "sinks": [
+                    {"name": name, "type": type(sink).__name__, **self._stats[name], "outbox": outbox.get(name, {})}
+                    for name, sink in self._sinks.items()
+                ]
+            }
+
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,160 @@
+from typing import List, Dict, Any, Optional
+from abc import ABC, abstractmethod
+from email.message import EmailMessage
+from urllib.parse import urlsplit
+import http.client
+import json
+import os
+import smtplib
+import threading
+
+class NotificationSink(ABC):
+    """Delivers one batch of alert notifications; raising marks the whole batch for retry.
+
+    deliver() is called from a single dedicated thread per sink, so sinks can
+    keep a connection open between batches without locking.
+    """
+    name = "sink"
+
+    @abstractmethod
+    def deliver(self, notifications: List[Dict[str, Any]]):
+        """Send the batch; return only once every notification in it was accepted"""
+
+    def close(self):
+        pass
+
+class WebhookSink(NotificationSink):
+    """POSTs {"notifications": [...]} as JSON over a kept-alive HTTP(S) connection"""
+    TIMEOUT_SECONDS = 10
+
+    def __init__(self, url: str, name: str = "webhook", headers: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.url = url
+        parts = urlsplit(url)
+        self._scheme = parts.scheme
+        self._netloc = parts.netloc
+        self._path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self._headers = {"Content-Type": "application/json", **(headers or {})}
+        self._connection: Optional[http.client.HTTPConnection] = None
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self._connection is None:
+            connection_class = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+            self._connection = connection_class(self._netloc, timeout=self.TIMEOUT_SECONDS)
+        return self._connection
+
+    def deliver(self, notifications: List[Dict[str, Any]]):
+        body = json.dumps({"notifications": notifications}).encode()
+        try:
+            connection = self._connect()
+            connection.request("POST", self._path, body=body, headers=self._headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            # Drop the broken connection; the retry opens a fresh one
+            self.close()
+            raise
+        if response.status >= 300:
+            raise RuntimeError(f"Webhook {self.url} answered {response.status}")
+        if response.will_close:
+            self.close()
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+class SmtpSink(NotificationSink):
+    """Sends one digest e-mail per batch over a reused SMTP session"""
+    TIMEOUT_SECONDS = 10
+
+    def __init__(self, host: str, port: int, sender: str, recipients: List[str], name: str = "smtp",
+                 username: Optional[str] = None, password: Optional[str] = None, starttls: bool = False):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self._username = username
+        self._password = password
+        self._starttls = starttls
+        self._smtp: Optional[smtplib.SMTP] = None
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._smtp is None:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.TIMEOUT_SECONDS)
+            if self._starttls:
+                smtp.starttls()
+            if self._username:
+                smtp.login(self._username, self._password or "")
+            self._smtp = smtp
+        return self._smtp
+
+    @staticmethod
+    def _format(notifications: List[Dict[str, Any]]) -> str:
+        lines = []
+        for notification in notifications:
+            alert = notification["alert"]
+            lines.append(f"[{alert['severity'].upper()}] {alert['title']} ({notification['event']})")
+            lines.append(f"    {alert['description']}")
+            lines.append(f"    occurrences: {alert['occurrence_count']}, last seen: {alert['last_occurrence']}")
+        return "\n".join(lines)
+
+    def deliver(self, notifications: List[Dict[str, Any]]):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        first = notifications[0]["alert"]
+        message["Subject"] = first["title"] if len(notifications) == 1 else f"{len(notifications)} fleet alerts"
+        message.set_content(self._format(notifications))
+        try:
+            self._connect().send_message(message)
+        except (OSError, smtplib.SMTPException):
+            self.close()
+            raise
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (OSError, smtplib.SMTPException):
+                pass
+            self._smtp = None
+
+class FileSink(NotificationSink):
+    """Appends notifications as JSON lines"""
+
+    def __init__(self, path: str, name: str = "file"):
+        self.name = name
+        self.path = path
+        self._lock = threading.Lock()
+
+    def deliver(self, notifications: List[Dict[str, Any]]):
+        lines = "".join(json.dumps(notification) + "\n" for notification in notifications)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+def sinks_from_environment() -> List[NotificationSink]:
+    """Sinks configured through FLEET_NOTIFY_* environment variables"""
+    sinks: List[NotificationSink] = []
+    if os.environ.get("FLEET_NOTIFY_WEBHOOK_URL"):
+        sinks.append(WebhookSink(os.environ["FLEET_NOTIFY_WEBHOOK_URL"]))
+    if os.environ.get("FLEET_NOTIFY_SMTP_HOST") and os.environ.get("FLEET_NOTIFY_SMTP_TO"):
+        sinks.append(SmtpSink(
+            host=os.environ["FLEET_NOTIFY_SMTP_HOST"],
+            port=int(os.environ.get("FLEET_NOTIFY_SMTP_PORT", "25")),
+            sender=os.environ.get("FLEET_NOTIFY_SMTP_FROM", "fleet-alerts@localhost"),
+            recipients=[r.strip() for r in os.environ["FLEET_NOTIFY_SMTP_TO"].split(",") if r.strip()],
+            username=os.environ.get("FLEET_NOTIFY_SMTP_USER"),
+            password=os.environ.get("FLEET_NOTIFY_SMTP_PASSWORD"),
+            starttls=os.environ.get("FLEET_NOTIFY_SMTP_STARTTLS", "").lower() in ("1", "true", "yes")
+        ))
+    if os.environ.get("FLEET_NOTIFY_FILE"):
+        sinks.append(FileSink(os.environ["FLEET_NOTIFY_FILE"]))
+    return sinks
@@ -0,0 +1,458 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+import cProfile
+import functools
+import hmac
+import inspect
+import itertools
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from fastapi import HTTPException, status
+from fastapi.routing import APIRoute
+from database.connectDB import statement_observer
+from services.memory_accounting import memory_accounting, estimate_bytes
+
+PROFILE_MODES = ("cprofile", "sample")
+PROFILE_FORMATS = ("pstats", "collapsed")
+
+# pstats' key for a function: (filename, first line, name)
+FunctionKey = Tuple[str, int, str]
+
+_current_capture: ContextVar[Optional["ProfileCapture"]] = ContextVar("profile_capture", default=None)
+
+def _label(func: FunctionKey) -> str:
+    filename, lineno, name = func
+    label = name if filename == "~" else f"{name} ({os.path.basename(filename)}:{lineno})"
+    return label.replace(";", ",")
+
+class ProfileCapture:
+    """One profiled request: its call profile and per-statement database timings"""
+    MAX_STATEMENTS = 200
+    MAX_SQL_LENGTH = 500
+
+    def __init__(self, capture_id: int, method: str, path: str, query: str, trigger: str, mode: str):
+        self.id = capture_id
+        self.method = method
+        self.path = path
+        self.query = query
+        self.trigger = trigger
+        self.mode = mode
+        self.captured_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.duration_seconds = 0.0
+        self.status_code: Optional[int] = None
+        self.notes: List[str] = []
+        self._lock = threading.Lock()
+        self.call_profiles: List[cProfile.Profile] = []
+        self.threads: Counter = Counter()
+        self.samples: Counter = Counter()  # stack, root first -> samples
+        self.stats: Dict[FunctionKey, tuple] = {}  # pstats' {func: (cc, nc, tt, ct, callers)}
+        self.statements: Dict[str, List[float]] = {}  # sql -> [executions, seconds, slowest execute]
+        self.approx_bytes = 0
+
+    def observe_statement(self, sql: str, seconds: float, executed: bool):
+        key = " ".join(sql.split())[:self.MAX_SQL_LENGTH]
+        with self._lock:
+            entry = self.statements.get(key)
+            if entry is None:
+                if len(self.statements) >= self.MAX_STATEMENTS:
+                    key = "(other statements)"
+                entry = self.statements.setdefault(key, [0, 0.0, 0.0])
+            entry[1] += seconds
+            if executed:
+                entry[0] += 1
+                entry[2] = max(entry[2], seconds)
+
+    def add_profile(self, profile: cProfile.Profile):
+        with self._lock:
+            self.call_profiles.append(profile)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "trigger": self.trigger,
+            "mode": self.mode,
+            "captured_at": self.captured_at.isoformat(),
+            "duration_ms": round(self.duration_seconds * 1000, 3),
+            "status_code": self.status_code,
+            "db_statements": int(sum(entry[0] for entry in self.statements.values())),
+            "db_ms": round(sum(entry[1] for entry in self.statements.values()) * 1000, 3),
+            "samples": sum(self.samples.values()),
+            "notes": self.notes
+        }
+
+class RequestProfiler:
+    """Opt-in profiling of individual API requests.
+
+    A request is captured when it carries X-Profile set to FLEET_PROFILING_TOKEN
+    (header profiling is off while no token is configured), or at random with
+    probability sample_rate. X-Profile-Mode picks the profiler for header
+    captures: "cprofile" records every call, "sample" walks the request's
+    thread stacks every SAMPLE_INTERVAL_SECONDS at far lower overhead. The
+    endpoint call is profiled in whichever thread runs it, and while the
+    request runs every statement on this process's connections is timed;
+    work done in shard processes shows only as the wait for their reply.
+    The newest MAX_PROFILES captures are kept; the response's X-Profile-Id
+    names the capture to download. The /admin/profiles endpoints need the
+    same token in X-Profiling-Token.
+    """
+    TOKEN = os.environ.get("FLEET_PROFILING_TOKEN") or None
+    MAX_PROFILES = int(os.environ.get("FLEET_PROFILE_BUFFER", "50"))
+    SAMPLE_INTERVAL_SECONDS = 0.002
+    MAX_STACK_DEPTH = 64
+    MIN_COLLAPSED_SECONDS = 1e-6
+    HEADER = b"x-profile"
+    MODE_HEADER = b"x-profile-mode"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles: deque = deque(maxlen=self.MAX_PROFILES)
+        self._active: set = set()
+        self._ids = itertools.count(1)
+        self._sampler: Optional[threading.Thread] = None
+        self._local = threading.local()
+        self.sample_rate = float(os.environ.get("FLEET_PROFILE_SAMPLE_RATE", "0"))
+        self.sampled_mode = os.environ.get("FLEET_PROFILE_SAMPLED_MODE", "sample")
+        self.rejected_headers = 0
+
+    def configure(self, sample_rate: Optional[float] = None, sampled_mode: Optional[str] = None) -> Dict[str, Any]:
+        if sampled_mode is not None and sampled_mode not in PROFILE_MODES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown profiling mode {sampled_mode}; use one of {', '.join(PROFILE_MODES)}"
+            )
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if sampled_mode is not None:
+            self.sampled_mode = sampled_mode
+        return self.get_config()
+
+    def authorize(self, token: Optional[str]):
+        """Check an X-Profiling-Token header for the profile endpoints"""
+        if self.TOKEN is None:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Profile endpoints are disabled until FLEET_PROFILING_TOKEN is set"
+            )
+        if token is None or not hmac.compare_digest(token.encode(), self.TOKEN.encode()):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="X-Profiling-Token does not match FLEET_PROFILING_TOKEN"
+            )
+
+    def pick(self, scope: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+        """(trigger, mode) when this request should be captured"""
+        profile_header = mode = None
+        for name, value in scope["headers"]:
+            if name == self.HEADER:
+                profile_header = value
+            elif name == self.MODE_HEADER:
+                mode = value.decode("latin-1").strip().lower()
+        if profile_header is not None:
+            if self.TOKEN and hmac.compare_digest(profile_header, self.TOKEN.encode()):
+                return "header", mode if mode in PROFILE_MODES else "cprofile"
+            self.rejected_headers += 1
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample", self.sampled_mode
+        return None
+
+    def begin(self, scope: Dict[str, Any], trigger: str, mode: str) -> ProfileCapture:
+        capture = ProfileCapture(
+            next(self._ids), scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"), trigger, mode
+        )
+        with self._lock:
+            self._active.add(capture)
+        return capture
+
+    def finish(self, capture: ProfileCapture, status_code: Optional[int]):
+        capture.duration_seconds = time.perf_counter() - capture.started
+        capture.status_code = status_code
+        with self._lock:
+            self._active.discard(capture)
+        if capture.mode == "cprofile":
+            if capture.call_profiles:
+                merged = pstats.Stats(capture.call_profiles[0])
+                for profile in capture.call_profiles[1:]:
+                    merged.add(profile)
+                capture.stats = merged.stats
+            capture.call_profiles = []
+        else:
+            capture.stats = self._samples_to_stats(capture.samples)
+        capture.approx_bytes = estimate_bytes(capture.stats) + estimate_bytes(capture.samples) + estimate_bytes(capture.statements)
+        with self._lock:
+            self._profiles.append(capture)
+
+    def wrap_endpoint(self, endpoint: Callable) -> Callable:
+        """The endpoint, profiled in the thread that runs it while its request is being captured"""
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def profiled_async(*args, **kwargs):
+                capture = _current_capture.get()
+                if capture is None:
+                    return await endpoint(*args, **kwargs)
+                handle = self._enter_thread(capture)
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    self._exit_thread(capture, handle)
+            return profiled_async
+
+        @functools.wraps(endpoint)
+        def profiled(*args, **kwargs):
+            capture = _current_capture.get()
+            if capture is None:
+                return endpoint(*args, **kwargs)
+            handle = self._enter_thread(capture)
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                self._exit_thread(capture, handle)
+        return profiled
+
+    def _enter_thread(self, capture: ProfileCapture):
+        if capture.mode == "sample":
+            ident = threading.get_ident()
+            with self._lock:
+                capture.threads[ident] += 1
+                if self._sampler is None:
+                    self._sampler = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+                    self._sampler.start()
+            return ident
+        # A thread has one profiler; overlapping async captures on the event loop would disturb each other
+        if getattr(self._local, "profiling", False):
+            capture.notes.append("Call profile skipped: another capture was already profiling this thread")
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process (sys.monitoring), not one per thread
+            capture.notes.append("Call profile skipped: another capture was already profiling in another thread")
+            return None
+        self._local.profiling = True
+        return profile
+
+    def _exit_thread(self, capture: ProfileCapture, handle):
+        if capture.mode == "sample":
+            with self._lock:
+                capture.threads[handle] -= 1
+                if capture.threads[handle] <= 0:
+                    del capture.threads[handle]
+            return
+        if handle is not None:
+            handle.disable()
+            self._local.profiling = False
+            capture.add_profile(handle)
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                sampled = [(capture, list(capture.threads)) for capture in self._active if capture.mode == "sample"]
+                if not sampled:
+                    self._sampler = None
+                    return
+            frames = sys._current_frames()
+            for capture, threads in sampled:
+                for ident in threads:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        capture.samples[self._stack(frame)] += 1
+            del frames
+            time.sleep(self.SAMPLE_INTERVAL_SECONDS)
+
+    def _stack(self, frame) -> Tuple[FunctionKey, ...]:
+        stack = []
+        while frame is not None and len(stack) < self.MAX_STACK_DEPTH:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _samples_to_stats(self, samples: Counter) -> Dict[FunctionKey, tuple]:
+        """Stack samples in pstats form; call counts are sample counts and times are samples x interval"""
+        interval = self.SAMPLE_INTERVAL_SECONDS
+        totals: Dict[FunctionKey, List] = {}
+        for stack, count in samples.items():
+            seconds = count * interval
+            for depth, func in enumerate(stack):
+                entry = totals.setdefault(func, [0, 0, 0.0, 0.0, {}])
+                leaf = depth == len(stack) - 1
+                if func not in stack[:depth]:
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if leaf:
+                    entry[2] += seconds
+                if depth:
+                    edge = entry[4].setdefault(stack[depth - 1], [0, 0, 0.0, 0.0])
+                    edge[0] += count
+                    edge[1] += count
+                    edge[2] += seconds if leaf else 0.0
+                    edge[3] += seconds
+        return {
+            func: (cc, nc, tt, ct, {caller: tuple(edge) for caller, edge in callers.items()})
+            for func, (cc, nc, tt, ct, callers) in totals.items()
+        }
+
+    def _get(self, profile_id: int) -> ProfileCapture:
+        with self._lock:
+            for capture in self._profiles:
+                if capture.id == profile_id:
+                    return capture
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Profile {profile_id} not found")
+
+    def get_profile(self, profile_id: int, top: int = 30) -> Dict[str, Any]:
+        capture = self._get(profile_id)
+        functions = sorted(capture.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        return {
+            **capture.summary(),
+            "statements": [
+                {
+                    "sql": sql,
+                    "executions": int(executions),
+                    "total_ms": round(seconds * 1000, 3),
+                    "slowest_execute_ms": round(slowest * 1000, 3)
+                }
+                for sql, (executions, seconds, slowest) in sorted(capture.statements.items(), key=lambda item: item[1][1], reverse=True)
+            ],
+            "top_functions": [
+                {
+                    "function": _label(func),
+                    "calls": nc,
+                    "self_ms": round(tt * 1000, 3),
+                    "cumulative_ms": round(ct * 1000, 3)
+                }
+                for func, (cc, nc, tt, ct, _) in functions
+            ]
+        }
+
+    def export(self, profile_id: int, fmt: str) -> Tuple[bytes, str, str]:
+        """(body, media type, filename) of a capture in pstats' dump format or as collapsed stacks"""
+        capture = self._get(profile_id)
+        if fmt == "pstats":
+            # The format Stats.dump_stats writes; load it with pstats.Stats(path) or snakeviz
+            return marshal.dumps(capture.stats), "application/octet-stream", f"profile-{profile_id}.pstats"
+        if fmt == "collapsed":
+            if capture.samples:
+                lines = Counter({";".join(_label(func) for func in stack): count for stack, count in capture.samples.items()})
+            else:
+                lines = self._collapse_stats(capture.stats)
+            body = "".join(f"{stack} {weight}\n" for stack, weight in sorted(lines.items()) if weight > 0)
+            return body.encode(), "text/plain; charset=utf-8", f"profile-{profile_id}.folded"
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown profile format {fmt}; use one of {', '.join(PROFILE_FORMATS)}"
+        )
+
+    def _collapse_stats(self, stats: Dict[FunctionKey, tuple]) -> Counter:
+        """Approximate stacks from a call graph, weighted in microseconds.
+
+        cProfile keeps caller -> callee totals rather than whole stacks, so a
+        callee's time is split across the paths into it in proportion to each
+        caller's share of its cumulative time.
+        """
+        children: Dict[FunctionKey, List[Tuple[FunctionKey, float]]] = {}
+        for func, (_, _, _, _, callers) in stats.items():
+            for caller, edge in callers.items():
+                children.setdefault(caller, []).append((func, edge[3]))
+        lines: Counter = Counter()
+
+        def walk(func: FunctionKey, path: Tuple[str, ...], on_path: frozenset, seconds: float):
+            _, _, tt, ct, _ = stats[func]
+            share = min(1.0, seconds / ct) if ct > 0 else 0.0
+            path = path + (_label(func),)
+            on_path = on_path | {func}
+            lines[";".join(path)] += int(round(tt * share * 1_000_000))
+            if len(path) >= self.MAX_STACK_DEPTH:
+                return
+            for child, child_seconds in children.get(func, ()):
+                child_seconds *= share
+                if child in stats and child not in on_path and child_seconds >= self.MIN_COLLAPSED_SECONDS:
+                    walk(child, path, on_path, child_seconds)
+
+        for func, (_, _, _, ct, callers) in stats.items():
+            if not callers:
+                walk(func, (), frozenset(), ct)
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+    def memory_usage(self) -> Dict[str, int]:
+        with self._lock:
+            return {"bytes": sum(capture.approx_bytes for capture in self._profiles), "entries": len(self._profiles), "fixed_bytes": 0}
+
+    def trim(self, max_entries: int) -> int:
+        """Drop the oldest captures"""
+        with self._lock:
+            excess = max(0, len(self._profiles) - max_entries)
+            for _ in range(excess):
+                self._profiles.popleft()
+            return excess
+
+    def get_config(self) -> Dict[str, Any]:
+        return {
+            "header_enabled": self.TOKEN is not None,
+            "sample_rate": self.sample_rate,
+            "sampled_mode": self.sampled_mode,
+            "max_profiles": self.MAX_PROFILES,
+            "sample_interval_seconds": self.SAMPLE_INTERVAL_SECONDS,
+            "rejected_headers": self.rejected_headers
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            profiles = [capture.summary() for capture in reversed(self._profiles)]
+            active = len(self._active)
+        return {**self.get_config(), "active_captures": active, "profiles": profiles}
+
+request_profiler = RequestProfiler()
+memory_accounting.register("request_profiles", request_profiler.memory_usage, request_profiler.trim, budget_bytes=64 * 1024 * 1024)
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose endpoint runs under request_profiler when its request is being captured"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, request_profiler.wrap_endpoint(endpoint), **kwargs)
+
+class RequestProfilingMiddleware:
+    """ASGI middleware that captures the requests request_profiler picks"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        picked = request_profiler.pick(scope) if scope["type"] == "http" else None
+        if picked is None:
+            await self.app(scope, receive, send)
+            return
+        capture = request_profiler.begin(scope, *picked)
+        status_code = None
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", str(capture.id).encode())]}
+            await send(message)
+
+        capture_token = _current_capture.set(capture)
+        observer_token = statement_observer.set(capture.observe_statement)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            statement_observer.reset(observer_token)
+            _current_capture.reset(capture_token)
+            request_profiler.finish(capture, status_code)
@@ -0,0 +1,196 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+import hashlib
+import json
+import threading
+import time
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from services.memory_accounting import memory_accounting
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    expires_at: float
+    tags: Tuple[str, ...]
+    size: int
+
+class ResponseCache:
+    """Read-through cache of serialized GET responses, bounded by entry count and bytes.
+
+    Entries carry tags such as "vehicles", "fleet:<id>", "vehicle:<vin>" or
+    "alerts:<vin>"; write paths invalidate exactly the tags they touch. Values
+    that follow telemetry (analytics) rely on their TTL instead. Every response
+    gets a content-hash ETag so polling clients can revalidate with 304s.
+    """
+    MAX_ENTRIES = 2048
+    MAX_BYTES = 32 * 1024 * 1024
+    ENTRY_OVERHEAD_BYTES = 256  # key, entry object and tag index bookkeeping
+    REGISTRY_TTL_SECONDS = 300
+    ALERTS_TTL_SECONDS = 60
+    ANALYTICS_TTL_SECONDS = 10  # analytics follow every telemetry sample, so only the TTL bounds staleness
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._keys_by_tag: Dict[str, set] = {}
+        # Only computes in flight compare versions, so a tag's version lives as long as they do
+        self._tag_versions: Dict[str, int] = {}
+        self._tags_in_flight: Counter = Counter()
+        self._bytes = 0
+        self._forwarder = None
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidated = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def set_forwarder(self, forwarder: Callable[[List[str]], None]):
+        """Send invalidations to another process instead of a local cache (used by ingest shards)"""
+        self._forwarder = forwarder
+
+    @staticmethod
+    def make_key(route: str, **params) -> str:
+        return route + "?" + "&".join(f"{name}={params[name]}" for name in sorted(params) if params[name] is not None)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _tag_snapshot(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        """Versions to hand back to put; every snapshot must be followed by _release_snapshot"""
+        with self._lock:
+            self._tags_in_flight.update(tags)
+            return tuple(self._tag_versions.get(tag, 0) for tag in tags)
+
+    def _release_snapshot(self, tags: Iterable[str]):
+        with self._lock:
+            for tag in tags:
+                self._tags_in_flight[tag] -= 1
+                if self._tags_in_flight[tag] <= 0:
+                    del self._tags_in_flight[tag]
+                    self._tag_versions.pop(tag, None)
+
+    def _make_entry(self, key: str, body: bytes, tags: Tuple[str, ...], ttl: float) -> CacheEntry:
+        return CacheEntry(
+            body=body, etag=f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"',
+            expires_at=time.monotonic() + ttl, tags=tags, size=len(body) + len(key) + self.ENTRY_OVERHEAD_BYTES
+        )
+
+    def put(self, key: str, body: bytes, tags: Tuple[str, ...], ttl: float, tag_snapshot: Tuple[int, ...]) -> CacheEntry:
+        entry = self._make_entry(key, body, tags, ttl)
+        with self._lock:
+            # A write that landed while the value was computed makes it stale already
+            if tuple(self._tag_versions.get(tag, 0) for tag in tags) != tag_snapshot:
+                return entry
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while self._entries and (len(self._entries) > self.MAX_ENTRIES or self._bytes > self.MAX_BYTES):
+                self._remove(next(iter(self._entries)))
+                self.evicted += 1
+        return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def invalidate(self, *tags: str):
+        if self._forwarder is not None:
+            self._forwarder(list(tags))
+            return
+        with self._lock:
+            for tag in tags:
+                if tag in self._tags_in_flight:
+                    self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+                    self.invalidated += 1
+
+    def clear(self):
+        with self._lock:
+            for tag in self._tags_in_flight:
+                self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+            self._entries.clear()
+            self._keys_by_tag.clear()
+            self._bytes = 0
+
+    def respond(self, request: Request, key: str, tags: Tuple[str, ...], ttl: float, compute: Callable[[], Any]) -> Response:
+        """Serve a JSON response from the cache, computing and storing it on a miss"""
+        if not self.enabled:
+            entry = self._make_entry(key, self._serialize(compute()), tags, 0)
+        elif (entry := self.get(key)) is None:
+            snapshot = self._tag_snapshot(tags)
+            try:
+                entry = self.put(key, self._serialize(compute()), tags, ttl, snapshot)
+            finally:
+                self._release_snapshot(tags)
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") in (entry.etag, f"W/{entry.etag}", "*"):
+            with self._lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    @staticmethod
+    def _serialize(value: Any) -> bytes:
+        return json.dumps(jsonable_encoder(value), separators=(",", ":")).encode()
+
+    def memory_usage(self) -> Dict[str, int]:
+        with self._lock:
+            return {"bytes": self._bytes, "entries": len(self._entries)}
+
+    def trim(self, max_entries: int) -> int:
+        """Drop least recently used entries beyond max_entries"""
+        evicted = 0
+        with self._lock:
+            while len(self._entries) > max_entries:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+            self.evicted += evicted
+        return evicted
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.MAX_ENTRIES,
+                "bytes": self._bytes,
+                "max_bytes": self.MAX_BYTES,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "not_modified": self.not_modified,
+                "invalidated": self.invalidated,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "tags": len(self._keys_by_tag)
+            }
+
+response_cache = ResponseCache()
+memory_accounting.register("response_cache", response_cache.memory_usage, response_cache.trim)
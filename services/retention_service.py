@@ -0,0 +1,269 @@
+from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta
+import gzip
+import json
+import os
+import threading
+import time
+from database.connectDB import execute_query, execute_update, get_db_connection, TIMESTAMP_FORMAT
+from database.telemetry_partitions import telemetry_partitions
+from database.telemetry_rollups import telemetry_rollups
+
+ARCHIVE_COLUMNS = [
+    "id", "vehicle_vin", "latitude", "longitude", "speed", "engine_status",
+    "fuel_battery_level", "odometer_reading", "diagnostic_codes", "timestamp"
+]
+
+class RetentionService:
+    RAW_RETENTION_DAYS = 30  # raw telemetry kept in the hot partitions
+    DELETE_CHUNK_SIZE = 2000  # rows deleted per short write transaction
+    CHUNK_PAUSE_SECONDS = 0.01  # yield the write lock between chunks
+    RUN_INTERVAL_SECONDS = 3600
+    ARCHIVE_DIR = "telemetry_archive"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="telemetry-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run_loop(self):
+        while not self._stop_event.wait(self.RUN_INTERVAL_SECONDS):
+            try:
+                self.run_retention()
+            except Exception as e:
+                print(f"Telemetry retention run failed: {e}")
+
+    def run_retention(self, retention_days: Optional[int] = None) -> Dict[str, Any]:
+        """Downsample, archive and purge every full day older than the retention window"""
+        retention_days = self.RAW_RETENTION_DAYS if retention_days is None else retention_days
+        with self._lock:
+            started = time.monotonic()
+            cutoff_day = (datetime.utcnow() - timedelta(days=retention_days)).date()
+            summary = {
+                "cutoff_day": cutoff_day.isoformat(), "days": [], "archived_rows": 0,
+                "deleted_rows": 0, "dropped_partitions": []
+            }
+
+            # Rows still in the legacy table are expired day by day with chunked deletes
+            if telemetry_partitions.legacy_has_rows:
+                legacy = telemetry_partitions.LEGACY_TABLE
+                for day in self._days_before(cutoff_day):
+                    start_str, end_str = self._day_bounds(day)
+                    self._downsample_range(day, legacy, legacy, start_str, end_str)
+                    summary["archived_rows"] += self._archive_range(day.isoformat(), legacy, start_str, end_str)
+                    summary["deleted_rows"] += self._delete_range_in_chunks(start_str, end_str)
+                    summary["days"].append(day.isoformat())
+                if not execute_query(f"SELECT 1 FROM {legacy} LIMIT 1"):
+                    telemetry_partitions.mark_legacy_empty()
+
+            # Partitioned days are expired by dropping the whole table
+            for day in telemetry_partitions.partition_days():
+                if day >= cutoff_day:
+                    break
+                table = telemetry_partitions.table_name(day)
+                source = f"({telemetry_partitions.select_sql(table, telemetry_partitions.id_base(day))})"
+                start_str, end_str = self._day_bounds(day)
+                self._downsample_range(day, table, source, start_str, end_str)
+                summary["archived_rows"] += self._archive_range(day.isoformat(), source, start_str, end_str)
+                telemetry_partitions.drop_partition(day)
+                summary["dropped_partitions"].append(day.isoformat())
+                if day.isoformat() not in summary["days"]:
+                    summary["days"].append(day.isoformat())
+
+            summary["pruned_rollups"] = telemetry_rollups.prune()
+            summary["duration_seconds"] = round(time.monotonic() - started, 3)
+            summary["finished_at"] = datetime.utcnow().isoformat()
+            self.last_run = summary
+            return summary
+
+    @staticmethod
+    def _day_bounds(day) -> tuple[str, str]:
+        day_start = datetime.combine(day, datetime.min.time())
+        return day_start.strftime(TIMESTAMP_FORMAT), (day_start + timedelta(days=1)).strftime(TIMESTAMP_FORMAT)
+
+    @staticmethod
+    def _days_before(cutoff_day) -> List:
+        query = """
+            SELECT DISTINCT date(timestamp) as day FROM telemetry_data
+            WHERE timestamp < ?
+            ORDER BY day
+        """
+        cutoff_str = datetime.combine(cutoff_day, datetime.min.time()).strftime(TIMESTAMP_FORMAT)
+        return [datetime.fromisoformat(row['day']).date() for row in execute_query(query, (cutoff_str,))]
+
+    @staticmethod
+    def _downsample_range(day, source_table: str, source: str, start_str: str, end_str: str):
+        """Merge one day of one raw table into the minute aggregates, at most once.
+
+        A day can have rows in both the legacy table and its partition, so buckets
+        are merged on conflict. The merge is recorded in the same transaction, so a
+        run that crashed after downsampling (or during the legacy chunked deletes,
+        which leave only part of the day behind) does not merge the day again.
+        """
+        query = f"""
+            INSERT INTO telemetry_minute_aggregates
+            (vehicle_vin, bucket_start, sample_count, avg_speed, max_speed,
+             avg_fuel_battery_level, min_fuel_battery_level, min_odometer_reading, max_odometer_reading)
+            SELECT vehicle_vin, strftime('%Y-%m-%d %H:%M:00', timestamp), COUNT(*),
+                   AVG(speed), MAX(speed), AVG(fuel_battery_level), MIN(fuel_battery_level),
+                   MIN(odometer_reading), MAX(odometer_reading)
+            FROM {source}
+            WHERE timestamp >= ? AND timestamp < ?
+            GROUP BY vehicle_vin, strftime('%Y-%m-%d %H:%M:00', timestamp)
+            ON CONFLICT(vehicle_vin, bucket_start) DO UPDATE SET
+                avg_speed = (avg_speed * sample_count + excluded.avg_speed * excluded.sample_count)
+                            / (sample_count + excluded.sample_count),
+                avg_fuel_battery_level = (avg_fuel_battery_level * sample_count
+                            + excluded.avg_fuel_battery_level * excluded.sample_count)
+                            / (sample_count + excluded.sample_count),
+                sample_count = sample_count + excluded.sample_count,
+                max_speed = MAX(max_speed, excluded.max_speed),
+                min_fuel_battery_level = MIN(min_fuel_battery_level, excluded.min_fuel_battery_level),
+                min_odometer_reading = MIN(min_odometer_reading, excluded.min_odometer_reading),
+                max_odometer_reading = MAX(max_odometer_reading, excluded.max_odometer_reading)
+        """
+        with get_db_connection() as conn:
+            claimed = conn.execute(
+                "INSERT OR IGNORE INTO telemetry_downsampled_days (day, source_table, downsampled_at) VALUES (?, ?, ?)",
+                (day.isoformat(), source_table, datetime.utcnow().strftime(TIMESTAMP_FORMAT))
+            ).rowcount
+            if not claimed:
+                return
+            conn.execute(query, (start_str, end_str))
+            conn.commit()
+
+    def _archive_range(self, day: str, source: str, start_str: str, end_str: str) -> int:
+        query = f"""
+            SELECT t.*, COALESCE(v.fleet_id, '') as fleet_id
+            FROM {source} t
+            LEFT JOIN vehicles v ON v.vin = t.vehicle_vin
+            WHERE t.timestamp >= ? AND t.timestamp < ?
+            ORDER BY t.timestamp, t.id
+        """
+        rows = execute_query(query, (start_str, end_str))
+        by_fleet: Dict[str, List[dict]] = {}
+        for row in rows:
+            by_fleet.setdefault(row['fleet_id'], []).append(row)
+
+        for fleet_id, fleet_rows in by_fleet.items():
+            self._append_archive_file(self._archive_path(day, fleet_id), fleet_rows)
+        return len(rows)
+
+    def _archive_path(self, day: str, fleet_id: str) -> str:
+        safe_fleet = "".join(c if c.isalnum() or c in "-_." else "_" for c in fleet_id) or "_unassigned"
+        return os.path.join(self.ARCHIVE_DIR, f"day={day}", f"fleet={safe_fleet}.json.gz")
+
+    @staticmethod
+    def _read_archive_file(path: str) -> Dict[str, list]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)["columns"]
+
+    def _append_archive_file(self, path: str, rows: List[dict]):
+        columns = {name: [] for name in ARCHIVE_COLUMNS}
+        if os.path.exists(path):
+            columns = self._read_archive_file(path)
+        # A crash between archiving and deleting re-archives the same rows on the next run
+        seen_ids = set(columns["id"])
+        for row in rows:
+            if row['id'] in seen_ids:
+                continue
+            for name in ARCHIVE_COLUMNS:
+                columns[name].append(row[name])
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"columns": columns}, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def _delete_range_in_chunks(self, start_str: str, end_str: str) -> int:
+        query = """
+            DELETE FROM telemetry_data WHERE id IN (
+                SELECT id FROM telemetry_data
+                WHERE timestamp >= ? AND timestamp < ?
+                LIMIT ?
+            )
+        """
+        deleted = 0
+        while True:
+            affected = execute_update(query, (start_str, end_str, self.DELETE_CHUNK_SIZE))
+            deleted += affected
+            if affected < self.DELETE_CHUNK_SIZE:
+                return deleted
+            time.sleep(self.CHUNK_PAUSE_SECONDS)
+
+    def read_archived_telemetry(self, vin: str, fleet_id: str,
+                                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                limit: Optional[int] = None) -> List[dict]:
+        """Archived rows for a vehicle, newest first, restricted to [start, end)"""
+        if not os.path.isdir(self.ARCHIVE_DIR):
+            return []
+
+        days = self._archived_days(vin, start, end)
+        start_str = start.strftime(TIMESTAMP_FORMAT) if start else None
+        end_str = end.strftime(TIMESTAMP_FORMAT) if end else None
+
+        rows = []
+        for day in days:
+            path = self._archive_path(day, fleet_id)
+            if not os.path.exists(path):
+                continue
+
+            columns = self._read_archive_file(path)
+            day_rows = []
+            for i, row_vin in enumerate(columns["vehicle_vin"]):
+                if row_vin != vin:
+                    continue
+                ts = columns["timestamp"][i]
+                if (start_str and ts < start_str) or (end_str and ts >= end_str):
+                    continue
+                day_rows.append({name: columns[name][i] for name in ARCHIVE_COLUMNS})
+            day_rows.sort(key=lambda r: (r['timestamp'], r['id']), reverse=True)
+            rows.extend(day_rows)
+
+            if limit is not None and len(rows) >= limit:
+                return rows[:limit]
+        return rows
+
+    @staticmethod
+    def _archived_days(vin: str, start: Optional[datetime], end: Optional[datetime]) -> List[str]:
+        """Days in [start, end) with archived rows for the vehicle, newest first.
+
+        Every archived day was downsampled in the same run, so the vehicle's minute
+        aggregates index its archive without listing or opening the day files.
+        """
+        clauses = ["vehicle_vin = ?"]
+        params = [vin]
+        if start:
+            clauses.append("bucket_start >= ?")
+            params.append(datetime.combine(start.date(), datetime.min.time()).strftime(TIMESTAMP_FORMAT))
+        if end:
+            clauses.append("bucket_start < ?")
+            params.append(end.strftime(TIMESTAMP_FORMAT))
+        query = f"""
+            SELECT DISTINCT date(bucket_start) as day FROM telemetry_minute_aggregates
+            WHERE {' AND '.join(clauses)}
+            ORDER BY day DESC
+        """
+        return [row['day'] for row in execute_query(query, tuple(params))]
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "raw_retention_days": self.RAW_RETENTION_DAYS,
+            "archive_dir": os.path.abspath(self.ARCHIVE_DIR),
+            "running": self._lock.locked(),
+            "last_run": self.last_run
+        }
+
+retention_service = RetentionService()
@@ -0,0 +1,140 @@
+from typing import List, Dict, Any, Tuple, NamedTuple, Optional
+from datetime import datetime
+import math
+import struct
+import sys
+from array import array
+from models.telemetry import TelemetryCreate, EngineStatus
+
+# Binary telemetry batch, little-endian, column-major:
+#   header     b"TLM1", uint32 record count n, uint16 VIN dictionary size m
+#   dictionary m x (uint8 length, UTF-8 VIN), zero padding to an 8-byte boundary
+#   columns    float64 latitude[n], float64 longitude[n], float64 odometer_reading[n],
+#              float32 speed[n], float32 fuel_battery_level[n],
+#              uint16 vin_index[n], uint8 engine_status[n]
+MAGIC = b"TLM1"
+HEADER = struct.Struct("<4sIH")
+ENGINE_STATUS_CODES = [EngineStatus.ON, EngineStatus.OFF, EngineStatus.IDLE]
+
+# (name, memoryview/array typecode, item size)
+COLUMNS = [
+    ("latitude", "d", 8),
+    ("longitude", "d", 8),
+    ("odometer_reading", "d", 8),
+    ("speed", "f", 4),
+    ("fuel_battery_level", "f", 4),
+    ("vin_index", "H", 2),
+    ("engine_status", "B", 1),
+]
+
+class TelemetryDecodeError(ValueError):
+    pass
+
+class BinaryTelemetrySample(NamedTuple):
+    """Read-only stand-in for TelemetryCreate built from already range-checked columns"""
+    vehicle_vin: str
+    latitude: float
+    longitude: float
+    speed: float
+    engine_status: EngineStatus
+    fuel_battery_level: float
+    odometer_reading: float
+    diagnostic_codes: tuple = ()
+    idempotency_key: Optional[str] = None
+    device_timestamp: Optional[datetime] = None
+    seq: Optional[int] = None
+
+def _column(view: memoryview, typecode: str):
+    if sys.byteorder == "little":
+        return view.cast(typecode)
+    # Big-endian hosts pay for one copy per column
+    values = array(typecode, view.tobytes())
+    values.byteswap()
+    return values
+
+def decode_telemetry_batch(payload: bytes) -> Tuple[List[str], Dict[str, Any], int]:
+    """VIN dictionary, column views and record count; numeric columns are not copied"""
+    view = memoryview(payload)
+    if len(view) < HEADER.size:
+        raise TelemetryDecodeError("Payload shorter than header")
+    magic, count, vin_count = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise TelemetryDecodeError("Unknown binary telemetry format")
+
+    offset = HEADER.size
+    vins = []
+    for _ in range(vin_count):
+        if offset >= len(view):
+            raise TelemetryDecodeError("Truncated VIN dictionary")
+        length = view[offset]
+        try:
+            vins.append(bytes(view[offset + 1:offset + 1 + length]).decode("utf-8"))
+        except UnicodeDecodeError:
+            raise TelemetryDecodeError(f"VIN {len(vins)} is not valid UTF-8")
+        offset += 1 + length
+    offset = (offset + 7) & ~7
+
+    expected = offset + count * sum(size for _, _, size in COLUMNS)
+    if len(view) != expected:
+        raise TelemetryDecodeError(f"Expected {expected} bytes for {count} records, got {len(view)}")
+
+    columns = {}
+    for name, typecode, size in COLUMNS:
+        columns[name] = _column(view[offset:offset + count * size], typecode)
+        offset += count * size
+    return vins, columns, count
+
+def columns_to_samples(vins: List[str], columns: Dict[str, Any], count: int) -> Tuple[List[Tuple[int, BinaryTelemetrySample]], List[Dict[str, Any]]]:
+    """Range-check the columns and build samples without per-field model validation"""
+    samples, rejected = [], []
+    vin_count, status_count = len(vins), len(ENGINE_STATUS_CODES)
+    isfinite = math.isfinite
+    rows = zip(
+        columns["vin_index"], columns["latitude"], columns["longitude"], columns["speed"],
+        columns["engine_status"], columns["fuel_battery_level"], columns["odometer_reading"]
+    )
+    for i, (vin_index, latitude, longitude, speed, engine_status, fuel, odometer) in enumerate(rows):
+        if vin_index >= vin_count:
+            rejected.append({"index": i, "error": "VIN index out of range"})
+        elif engine_status >= status_count:
+            rejected.append({"index": i, "error": "Unknown engine status"})
+        elif not 0 <= fuel <= 100:
+            rejected.append({"index": i, "error": "Fuel/battery level out of range"})
+        elif not (isfinite(latitude) and isfinite(longitude) and isfinite(speed) and isfinite(odometer)):
+            rejected.append({"index": i, "error": "Non-finite value"})
+        else:
+            samples.append((i, BinaryTelemetrySample(
+                vins[vin_index], latitude, longitude, speed,
+                ENGINE_STATUS_CODES[engine_status], fuel, odometer
+            )))
+    return samples, rejected
+
+def encode_telemetry_batch(samples: List[TelemetryCreate]) -> bytes:
+    """Client-side encoder for the binary batch format"""
+    vin_positions: Dict[str, int] = {}
+    for sample in samples:
+        vin_positions.setdefault(sample.vehicle_vin, len(vin_positions))
+
+    header = bytearray(HEADER.pack(MAGIC, len(samples), len(vin_positions)))
+    for vin in vin_positions:
+        encoded = vin.encode("utf-8")
+        header += bytes([len(encoded)]) + encoded
+    header += b"\0" * (-len(header) % 8)
+
+    codes = {status: code for code, status in enumerate(ENGINE_STATUS_CODES)}
+    values = {
+        "latitude": [s.latitude for s in samples],
+        "longitude": [s.longitude for s in samples],
+        "odometer_reading": [s.odometer_reading for s in samples],
+        "speed": [s.speed for s in samples],
+        "fuel_battery_level": [s.fuel_battery_level for s in samples],
+        "vin_index": [vin_positions[s.vehicle_vin] for s in samples],
+        "engine_status": [codes[EngineStatus(s.engine_status)] for s in samples],
+    }
+    body = bytearray(header)
+    for name, typecode, _ in COLUMNS:
+        column = array(typecode, values[name])
+        if sys.byteorder != "little":
+            column.byteswap()
+        body += column.tobytes()
+    return bytes(body)
@@ -0,0 +1,167 @@
+from typing import Any, Dict, List, Optional
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import os
+import sys
+import threading
+from models.telemetry import EngineStatus, TelemetryResponse
+from services.memory_accounting import memory_accounting, deep_sizeof
+
+EPOCH = datetime(1970, 1, 1)
+ENGINE_STATUSES = list(EngineStatus)
+ENGINE_STATUS_CODES = {status: code for code, status in enumerate(ENGINE_STATUSES)}
+
+class _TelemetryRing:
+    """A vehicle's newest samples in preallocated columns; head is the slot the next sample goes to"""
+    __slots__ = ("ids", "timestamp", "latitude", "longitude", "speed", "fuel_battery_level",
+                 "odometer_reading", "engine_status", "diagnostic_codes", "head", "count")
+
+    def __init__(self, capacity: int):
+        self.ids = array("q", [0]) * capacity
+        self.timestamp = array("q", [0]) * capacity  # whole seconds since the epoch; ingest stores whole seconds
+        self.latitude = array("d", [0.0]) * capacity
+        self.longitude = array("d", [0.0]) * capacity
+        self.speed = array("d", [0.0]) * capacity
+        self.fuel_battery_level = array("d", [0.0]) * capacity
+        self.odometer_reading = array("d", [0.0]) * capacity
+        self.engine_status = array("b", [0]) * capacity
+        # Comma-joined codes; nearly every sample shares the empty string
+        self.diagnostic_codes: List[str] = [""] * capacity
+        self.head = 0
+        self.count = 0
+
+    def _slot(self, age: int) -> int:
+        """Slot of the sample `age` places behind the newest"""
+        return (self.head - 1 - age) % len(self.ids)
+
+    def _move(self, source: int, target: int):
+        for name in ("ids", "timestamp", "latitude", "longitude", "speed", "fuel_battery_level",
+                     "odometer_reading", "engine_status", "diagnostic_codes"):
+            column = getattr(self, name)
+            column[target] = column[source]
+
+    def append(self, sample: TelemetryResponse):
+        capacity = len(self.ids)
+        timestamp = int((sample.timestamp - EPOCH).total_seconds())
+        # Batches committed out of receive order land a few slots back, matching the
+        # database's newest-by-timestamp order; anything older than a full ring is dropped
+        age = 0
+        while age < self.count and self.timestamp[self._slot(age)] > timestamp:
+            age += 1
+        if age == self.count and self.count == capacity:
+            return
+        slot = self.head
+        for shift in range(age):
+            previous = self._slot(shift)
+            self._move(previous, slot)
+            slot = previous
+        self.ids[slot] = sample.id
+        self.timestamp[slot] = timestamp
+        self.latitude[slot] = sample.latitude
+        self.longitude[slot] = sample.longitude
+        self.speed[slot] = sample.speed
+        self.fuel_battery_level[slot] = sample.fuel_battery_level
+        self.odometer_reading[slot] = sample.odometer_reading
+        self.engine_status[slot] = ENGINE_STATUS_CODES[sample.engine_status]
+        self.diagnostic_codes[slot] = ",".join(sample.diagnostic_codes) if sample.diagnostic_codes else ""
+        self.head = (self.head + 1) % capacity
+        self.count = min(self.count + 1, capacity)
+
+    def newest(self, vin: str, limit: int) -> List[TelemetryResponse]:
+        results = []
+        for age in range(min(limit, self.count)):
+            slot = self._slot(age)
+            codes = self.diagnostic_codes[slot]
+            results.append(TelemetryResponse(
+                id=self.ids[slot],
+                vehicle_vin=vin,
+                latitude=self.latitude[slot],
+                longitude=self.longitude[slot],
+                speed=self.speed[slot],
+                engine_status=ENGINE_STATUSES[self.engine_status[slot]],
+                fuel_battery_level=self.fuel_battery_level[slot],
+                odometer_reading=self.odometer_reading[slot],
+                diagnostic_codes=codes.split(",") if codes else [],
+                timestamp=EPOCH + timedelta(seconds=self.timestamp[slot])
+            ))
+        return results
+
+class TelemetryRingBuffer:
+    """The last CAPACITY stored samples of each vehicle, for latest and recent-history reads.
+
+    A ring is created by the first sample a process stores for a VIN and then
+    receives every later one, so it always holds an unbroken run of that
+    vehicle's newest samples. A read is answered from it only when the ring
+    holds at least the requested number of samples; shorter rings (a vehicle
+    first seen since startup, or a request deeper than CAPACITY) fall back to
+    the database and archive. Every ring costs the same ring_bytes whatever
+    the traffic. This relies on one process writing each database, which
+    holds for both the single-process and the sharded layout.
+    """
+    CAPACITY = int(os.environ.get("FLEET_TELEMETRY_RING_SIZE", "128"))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rings: "OrderedDict[str, _TelemetryRing]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Columns plus the VIN key and its OrderedDict link
+        self.ring_bytes = deep_sizeof(_TelemetryRing(max(self.CAPACITY, 0))) + sys.getsizeof("X" * 17) + 100
+
+    def record(self, samples: List[TelemetryResponse]):
+        """Add samples just committed to the database"""
+        if self.CAPACITY <= 0:
+            return
+        with self._lock:
+            for sample in samples:
+                ring = self._rings.get(sample.vehicle_vin)
+                if ring is None:
+                    ring = self._rings[sample.vehicle_vin] = _TelemetryRing(self.CAPACITY)
+                else:
+                    self._rings.move_to_end(sample.vehicle_vin)
+                ring.append(sample)
+
+    def newest(self, vin: str, limit: int) -> Optional[List[TelemetryResponse]]:
+        """The vehicle's newest `limit` samples, newest first, or None if the ring cannot answer alone"""
+        with self._lock:
+            ring = self._rings.get(vin)
+            if ring is None or ring.count < limit:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return ring.newest(vin, limit)
+
+    def forget_vehicle(self, vin: str):
+        with self._lock:
+            self._rings.pop(vin, None)
+
+    def memory_usage(self) -> Dict[str, int]:
+        with self._lock:
+            fixed = sys.getsizeof(self._rings)
+            return {"bytes": fixed + len(self._rings) * self.ring_bytes, "entries": len(self._rings), "fixed_bytes": fixed}
+
+    def trim(self, max_entries: int) -> int:
+        """Drop the rings of the vehicles that reported least recently; their reads go to the database"""
+        with self._lock:
+            excess = len(self._rings) - max_entries
+            for _ in range(max(0, excess)):
+                self._rings.popitem(last=False)
+            return max(0, excess)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "capacity_per_vehicle": self.CAPACITY,
+                "bytes_per_vehicle": self.ring_bytes,
+                "vehicles": len(self._rings),
+                "full_rings": sum(1 for ring in self._rings.values() if ring.count == self.CAPACITY),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+telemetry_ring_buffer = TelemetryRingBuffer()
+memory_accounting.register("telemetry_ring_buffer", telemetry_ring_buffer.memory_usage, telemetry_ring_buffer.trim,
+                           budget_bytes=128 * 1024 * 1024)
@@ -1,136 +1,258 @@
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 from datetime import datetime
 from models.telemetry import TelemetryCreate, TelemetryResponse
-from database.connectDB import execute_query, execute_insert
+from models.vehicle import Vehicle
+from database.connectDB import execute_query, TIMESTAMP_FORMAT
+from database.telemetry_partitions import telemetry_partitions
+from database.storage import storage
 from services.vehicle_service import vehicle_service
-from services.alert_service import alert_service
+from services.alert_pipeline import alert_pipeline
+from services.retention_service import retention_service
+from services.deadband_service import deadband_service
+from services.idempotency_service import idempotency_service
+from services.ingest_shards import ingest_shards
+from services.admission_service import admission_controller
+from services.telemetry_ring_buffer import telemetry_ring_buffer
+from services.telemetry_codec import decode_telemetry_batch, columns_to_samples, TelemetryDecodeError
 from fastapi import HTTPException, status
 
 class TelemetryService:
     @staticmethod
     def receive_telemetry(telemetry_data: TelemetryCreate) -> TelemetryResponse:
-        vehicle = vehicle_service.get_vehicle(telemetry_data.vehicle_vin)
-        if not vehicle:
+        result = TelemetryService.ingest_batch([telemetry_data])[0]
+        if not result:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Vehicle with VIN {telemetry_data.vehicle_vin} not found"
             )
+        return result
+    
+    @staticmethod
+    def ingest_batch(telemetry_list: List[TelemetryCreate]) -> List[Optional[TelemetryResponse]]:
+        """Store a batch of samples in one transaction, then run alerting for the stored ones.
+
+        Results line up with the input; None marks a sample for an unknown vehicle.
+        Retried and deadband-suppressed samples resolve to the already stored sample.
+        """
+        vehicles = vehicle_service.get_vehicles_by_vins({t.vehicle_vin for t in telemetry_list})
+        if ingest_shards.enabled:
+            return TelemetryService._ingest_sharded(telemetry_list, vehicles)
+        results: List[Optional[TelemetryResponse]] = [None] * len(telemetry_list)
+        batch_keys = {}
+        repeated = []
+        stored = []
         
-        diagnostic_codes_str = ",".join(telemetry_data.diagnostic_codes) if telemetry_data.diagnostic_codes else ""
+        received_at = datetime.utcnow().replace(microsecond=0)
         
-        query = """
-            INSERT INTO telemetry_data 
-            (vehicle_vin, latitude, longitude, speed, engine_status, fuel_battery_level, 
-            odometer_reading, diagnostic_codes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        params = (
-            telemetry_data.vehicle_vin,
-            telemetry_data.latitude,
-            telemetry_data.longitude,
-            telemetry_data.speed,
-            telemetry_data.engine_status.value,
-            telemetry_data.fuel_battery_level,
-            telemetry_data.odometer_reading,
-            diagnostic_codes_str
-        )
+        with storage.telemetry_writer(received_at) as writer:
+            for index, telemetry_data in enumerate(telemetry_list):
+                vehicle = vehicles.get(telemetry_data.vehicle_vin)
+                if not vehicle:
+                    continue
+                
+                # Retried samples return what was stored the first time
+                ingest_key = idempotency_service.key_for(telemetry_data)
+                if ingest_key:
+                    if ingest_key in batch_keys:
+                        repeated.append((index, batch_keys[ingest_key]))
+                        continue
+                    duplicate = TelemetryService._get_duplicate_response(ingest_key)
+                    if duplicate:
+                        results[index] = duplicate
+                        continue
+                
+                # Samples inside the fleet's deadband are neither stored nor sent through alerting
+                suppressing_sample = deadband_service.get_suppressing_sample(vehicle.fleet_id, telemetry_data)
+                if suppressing_sample:
+                    results[index] = suppressing_sample
+                    continue
+                
+                row = writer.append(telemetry_data, ingest_key)
+                if row is None:
+                    # A concurrent retry stored the sample first
+                    duplicate_id = idempotency_service.lookup_stored_key(ingest_key)
+                    stored_telemetry = TelemetryService.get_telemetry_by_id(duplicate_id) if duplicate_id is not None else None
+                    if stored_telemetry:
+                        idempotency_service.remember(ingest_key, duplicate_id)
+                        results[index] = TelemetryService._row_to_response(stored_telemetry)
+                        continue
+                    # The key outlived its sample (its partition was dropped), so this one is stored as new
+                    row = writer.append(telemetry_data, ingest_key, replace_key=True)
+                if ingest_key:
+                    batch_keys[ingest_key] = index
+                
+                response = TelemetryService._row_to_response(row)
+                results[index] = response
+                stored.append(response)
+                deadband_service.record_stored(vehicle.fleet_id, response)
+        telemetry_ring_buffer.record(stored)
         
-        telemetry_id = execute_insert(query, params)
-        stored_telemetry = TelemetryService.get_telemetry_by_id(telemetry_id)
+        for ingest_key, index in batch_keys.items():
+            idempotency_service.remember(ingest_key, results[index].id)
+        for index, first_index in repeated:
+            results[index] = results[first_index]
         
-        # Process alerts - convert to dict format for alert processing
-        telemetry_dict = {
-            'vehicle_vin': stored_telemetry['vehicle_vin'],
-            'speed': stored_telemetry['speed'],
-            'fuel_battery_level': stored_telemetry['fuel_battery_level'],
-            'timestamp': datetime.fromisoformat(stored_telemetry['timestamp'])
-        }
-        alert_service.process_telemetry_alerts(telemetry_dict)
+        for response in stored:
+            # Alerts are evaluated by the pipeline workers; the caller only waits for the write
+            telemetry_dict = {
+                'vehicle_vin': response.vehicle_vin,
+                'speed': response.speed,
+                'fuel_battery_level': response.fuel_battery_level,
+                'timestamp': response.timestamp
+            }
+            alert_pipeline.submit(telemetry_dict)
         
-        diagnostic_codes = [code.strip() for code in stored_telemetry['diagnostic_codes'].split(",") if code.strip()] if stored_telemetry['diagnostic_codes'] else []
+        return results
+    
+    @staticmethod
+    def _ingest_sharded(telemetry_list: List[TelemetryCreate], vehicles: Dict[str, Vehicle]) -> List[Optional[TelemetryResponse]]:
+        by_shard: Dict[int, List[int]] = {}
+        for index, telemetry_data in enumerate(telemetry_list):
+            if telemetry_data.vehicle_vin in vehicles:
+                by_shard.setdefault(ingest_shards.shard_for(telemetry_data.vehicle_vin), []).append(index)
         
-        return TelemetryResponse(
-            id=stored_telemetry['id'],
-            vehicle_vin=stored_telemetry['vehicle_vin'],
-            latitude=stored_telemetry['latitude'],
-            longitude=stored_telemetry['longitude'],
-            speed=stored_telemetry['speed'],
-            engine_status=stored_telemetry['engine_status'],
-            fuel_battery_level=stored_telemetry['fuel_battery_level'],
-            odometer_reading=stored_telemetry['odometer_reading'],
-            diagnostic_codes=diagnostic_codes,
-            timestamp=datetime.fromisoformat(stored_telemetry['timestamp'])
-        )
+        # Every shard stores its part of the batch concurrently
+        futures = {}
+        for shard, indexes in by_shard.items():
+            shard_vins = {telemetry_list[i].vehicle_vin for i in indexes}
+            futures[shard] = ingest_shards.submit(
+                shard, "telemetry_service", "ingest_for_shard",
+                [vehicles[vin] for vin in shard_vins], [telemetry_list[i] for i in indexes]
+            )
+        
+        results: List[Optional[TelemetryResponse]] = [None] * len(telemetry_list)
+        for shard, future in futures.items():
+            for index, result in zip(by_shard[shard], future.result(ingest_shards.CALL_TIMEOUT_SECONDS)):
+                results[index] = result
+        return results
+    
+    @staticmethod
+    def ingest_for_shard(vehicles: List[Vehicle], telemetry_list: List[TelemetryCreate]) -> List[Optional[TelemetryResponse]]:
+        """Shard-side ingest; the API process owns the vehicle registry and ships the rows along"""
+        vehicle_service.upsert_vehicles(vehicles)
+        return TelemetryService.ingest_batch(telemetry_list)
+    
+    @staticmethod
+    def receive_binary_batch(payload: bytes) -> Dict[str, Any]:
+        try:
+            vins, columns, count = decode_telemetry_batch(payload)
+        except TelemetryDecodeError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        
+        samples, rejected = columns_to_samples(vins, columns, count)
+        decisions = admission_controller.admit([sample.vehicle_vin for _, sample in samples])
+        admitted = []
+        for (index, sample), retry_after in zip(samples, decisions):
+            if retry_after is None:
+                admitted.append((index, sample))
+            else:
+                rejected.append({"index": index, "error": "Rate limit exceeded", "retry_after": round(retry_after, 3)})
+        samples = admitted
+        results = TelemetryService.ingest_batch([sample for _, sample in samples])
+        for (index, sample), result in zip(samples, results):
+            if not result:
+                rejected.append({"index": index, "error": f"Vehicle with VIN {sample.vehicle_vin} not found"})
+        
+        return {
+            "received": count,
+            "accepted": count - len(rejected),
+            "rejected": sorted(rejected, key=lambda r: r["index"])
+        }
+    
+    @staticmethod
+    def _get_duplicate_response(ingest_key: str) -> Optional[TelemetryResponse]:
+        telemetry_id = idempotency_service.find_duplicate(ingest_key)
+        if telemetry_id is None:
+            return None
+        stored_telemetry = TelemetryService.get_telemetry_by_id(telemetry_id)
+        return TelemetryService._row_to_response(stored_telemetry) if stored_telemetry else None
     
     @staticmethod
     def get_telemetry_by_id(telemetry_id: int) -> Optional[dict]:
-        query = "SELECT * FROM telemetry_data WHERE id = ?"
-        results = execute_query(query, (telemetry_id,))
-        if results:
-            return results[0]
-        return None
+        return storage.get_telemetry(telemetry_id)
     
     @staticmethod
     def get_latest_telemetry(vin: str) -> Optional[TelemetryResponse]:
-        query = """
-            SELECT * FROM telemetry_data 
-            WHERE vehicle_vin = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 1
-        """
-        results = execute_query(query, (vin,))
+        if ingest_shards.enabled:
+            return ingest_shards.call_for_vin(vin, "telemetry_service", "get_latest_telemetry", vin)
+        buffered = telemetry_ring_buffer.newest(vin, 1)
+        if buffered:
+            return buffered[0]
+        results = storage.recent_telemetry(vin, 1)
         if results:
-            row = results[0]
-            diagnostic_codes = [code.strip() for code in row['diagnostic_codes'].split(",") if code.strip()] if row['diagnostic_codes'] else []
-            return TelemetryResponse(
-                id=row['id'],
-                vehicle_vin=row['vehicle_vin'],
-                latitude=row['latitude'],
-                longitude=row['longitude'],
-                speed=row['speed'],
-                engine_status=row['engine_status'],
-                fuel_battery_level=row['fuel_battery_level'],
-                odometer_reading=row['odometer_reading'],
-                diagnostic_codes=diagnostic_codes,
-                timestamp=datetime.fromisoformat(row['timestamp'])
-            )
+            return TelemetryService._row_to_response(results[0])
         return None
     
+    @staticmethod
+    def _row_to_response(row: dict) -> TelemetryResponse:
+        diagnostic_codes = [code.strip() for code in row['diagnostic_codes'].split(",") if code.strip()] if row['diagnostic_codes'] else []
+        return TelemetryResponse(
+            id=row['id'],
+            vehicle_vin=row['vehicle_vin'],
+            latitude=row['latitude'],
+            longitude=row['longitude'],
+            speed=row['speed'],
+            engine_status=row['engine_status'],
+            fuel_battery_level=row['fuel_battery_level'],
+            odometer_reading=row['odometer_reading'],
+            diagnostic_codes=diagnostic_codes,
+            timestamp=datetime.fromisoformat(row['timestamp'])
+        )
+
+    @staticmethod
+    def _read_archive(vin: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      limit: Optional[int] = None) -> List[dict]:
+        vehicle = vehicle_service.get_vehicle(vin)
+        # The archive is written by the SQLite retention job
+        if not vehicle or not storage.sql_backed:
+            return []
+        return retention_service.read_archived_telemetry(vin, vehicle.fleet_id, start, end, limit)
+
     @staticmethod
     def get_telemetry_history(vin: str, limit: int = 100) -> List[TelemetryResponse]:
-        query = """
-            SELECT * FROM telemetry_data 
-            WHERE vehicle_vin = ? 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        """
-        results = execute_query(query, (vin, limit))
-        telemetry_list = []
-        for row in results:
-            diagnostic_codes = [code.strip() for code in row['diagnostic_codes'].split(",") if code.strip()] if row['diagnostic_codes'] else []
-            telemetry_list.append(TelemetryResponse(
-                id=row['id'],
-                vehicle_vin=row['vehicle_vin'],
-                latitude=row['latitude'],
-                longitude=row['longitude'],
-                speed=row['speed'],
-                engine_status=row['engine_status'],
-                fuel_battery_level=row['fuel_battery_level'],
-                odometer_reading=row['odometer_reading'],
-                diagnostic_codes=diagnostic_codes,
-                timestamp=datetime.fromisoformat(row['timestamp'])
-            ))
-        return telemetry_list
+        if ingest_shards.enabled:
+            return ingest_shards.call_for_vin(vin, "telemetry_service", "get_telemetry_history", vin, limit)
+        buffered = telemetry_ring_buffer.newest(vin, limit)
+        if buffered is not None:
+            return buffered
+        results = storage.recent_telemetry(vin, limit)
+        # Older samples may already have been moved to the cold archive
+        if len(results) < limit:
+            end = datetime.fromisoformat(results[-1]['timestamp']) if results else None
+            seen_ids = {row['id'] for row in results}
+            archived = TelemetryService._read_archive(vin, end=end, limit=limit)
+            results.extend(row for row in archived if row['id'] not in seen_ids)
+            results = results[:limit]
+        return [TelemetryService._row_to_response(row) for row in results]
+
+    @staticmethod
+    def export_telemetry(vin: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[TelemetryResponse]:
+        """All samples for a vehicle in [start, end), oldest first, from the hot table and the archive"""
+        if ingest_shards.enabled:
+            return ingest_shards.call_for_vin(vin, "telemetry_service", "export_telemetry", vin, start, end)
+        clauses = ["vehicle_vin = ?"]
+        params = [vin]
+        if start:
+            clauses.append("timestamp >= ?")
+            params.append(start.strftime(TIMESTAMP_FORMAT))
+        if end:
+            clauses.append("timestamp < ?")
+            params.append(end.strftime(TIMESTAMP_FORMAT))
+
+        query = f"SELECT * FROM {telemetry_partitions.source_sql(start, end)} WHERE {' AND '.join(clauses)} ORDER BY timestamp, id"
+        hot_rows = execute_query(query, tuple(params))
+        hot_ids = {row['id'] for row in hot_rows}
+        archived = [row for row in reversed(TelemetryService._read_archive(vin, start, end)) if row['id'] not in hot_ids]
+        return [TelemetryService._row_to_response(row) for row in archived + hot_rows]
     
     @staticmethod
     def receive_multiple_telemetry(telemetry_list: List[TelemetryCreate]) -> List[TelemetryResponse]:
         results = []
-        for telemetry_data in telemetry_list:
-            try:
-                result = TelemetryService.receive_telemetry(telemetry_data)
+        for telemetry_data, result in zip(telemetry_list, TelemetryService.ingest_batch(telemetry_list)):
+            if result:
                 results.append(result)
-            except HTTPException as e:
-                print(f"Error processing telemetry for VIN {telemetry_data.vehicle_vin}: {e.detail}")
+            else:
+                print(f"Error processing telemetry for VIN {telemetry_data.vehicle_vin}: Vehicle with VIN {telemetry_data.vehicle_vin} not found")
         return results
 
 telemetry_service = TelemetryService()
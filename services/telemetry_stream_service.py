@@ -0,0 +1,162 @@
+from typing import List, Optional, Dict, Any, Tuple
+import json
+import threading
+import time
+from pydantic import ValidationError
+from models.telemetry import TelemetryCreate
+from services.telemetry_service import telemetry_service
+from services.admission_service import admission_controller
+from services.telemetry_codec import decode_telemetry_batch, columns_to_samples, TelemetryDecodeError
+
+class TelemetryStreamSession:
+    """Micro-batching state for one streaming ingest connection.
+
+    Text frames carry newline-separated JSON samples and binary frames carry a
+    batch in the telemetry_codec format. Samples are acknowledged by
+    their `seq` (or arrival order when absent) once the batch holding them has
+    been stored, and every processed sample returns one flow-control credit.
+    Samples over the ingest rate limit are rejected with a retry_after.
+    A frame carrying more samples than the client has credit for is dropped
+    and marks the session as violating flow control.
+    """
+
+    def __init__(self, service: "TelemetryStreamService"):
+        self._service = service
+        self._next_seq = 0
+        self.pending: List[Tuple[int, TelemetryCreate]] = []
+        self.rejected: List[Dict[str, Any]] = []
+        self.batch_started: Optional[float] = None
+        self.credits = service.CREDIT_WINDOW
+        self.credit_exceeded = False
+
+    def _consume_credits(self, samples: int) -> bool:
+        if samples > self.credits:
+            self.credit_exceeded = True
+            return False
+        self.credits -= samples
+        return True
+
+    def _take_seq(self, sample: Any) -> int:
+        seq = sample.get("seq") if isinstance(sample, dict) else None
+        if not isinstance(seq, int):
+            seq = self._next_seq
+        self._next_seq = max(self._next_seq, seq + 1)
+        return seq
+
+    def add_text_frame(self, text: str):
+        lines = [line for line in text.splitlines() if line.strip()]
+        if not self._consume_credits(len(lines)):
+            return
+        for line in lines:
+            try:
+                sample = json.loads(line)
+            except ValueError as e:
+                self._reject(self._take_seq(None), f"Invalid JSON: {e}")
+                continue
+            seq = self._take_seq(sample)
+            try:
+                self._add(seq, TelemetryCreate.model_validate(sample))
+            except ValidationError as e:
+                self._reject(seq, str(e.errors()[0]['msg']))
+
+    def add_binary_frame(self, payload: bytes):
+        first_seq = self._next_seq
+        try:
+            vins, columns, count = decode_telemetry_batch(payload)
+        except TelemetryDecodeError as e:
+            if self._consume_credits(1):
+                self._reject(self._take_seq(None), str(e))
+            return
+        if not self._consume_credits(count):
+            return
+        self._next_seq += count
+        samples, rejected = columns_to_samples(vins, columns, count)
+        for index, telemetry_data in samples:
+            self._add(first_seq + index, telemetry_data)
+        for rejection in rejected:
+            self._reject(first_seq + rejection["index"], rejection["error"])
+
+    def _add(self, seq: int, telemetry_data: TelemetryCreate):
+        if self.batch_started is None:
+            self.batch_started = time.monotonic()
+        self.pending.append((seq, telemetry_data))
+
+    def _reject(self, seq: int, error: str):
+        if self.batch_started is None:
+            self.batch_started = time.monotonic()
+        self.rejected.append({"seq": seq, "error": error})
+
+    def time_until_flush(self) -> Optional[float]:
+        if self.batch_started is None:
+            return None
+        return max(0.0, self._service.BATCH_LINGER_SECONDS - (time.monotonic() - self.batch_started))
+
+    def should_flush(self) -> bool:
+        if self.batch_started is None:
+            return False
+        return (len(self.pending) >= self._service.BATCH_MAX_SAMPLES
+                or time.monotonic() - self.batch_started >= self._service.BATCH_LINGER_SECONDS)
+
+    def flush(self) -> Dict[str, Any]:
+        pending, rejected = self.pending, self.rejected
+        self.pending, self.rejected, self.batch_started = [], [], None
+
+        # Streamed samples draw on the same per-VIN and per-fleet rate limits as HTTP ingest
+        decisions = admission_controller.admit([telemetry_data.vehicle_vin for _, telemetry_data in pending])
+        admitted = []
+        for (seq, telemetry_data), retry_after in zip(pending, decisions):
+            if retry_after is None:
+                admitted.append((seq, telemetry_data))
+            else:
+                rejected.append({"seq": seq, "error": "Rate limit exceeded", "retry_after": round(retry_after, 3)})
+        pending = admitted
+
+        acked = []
+        if pending:
+            results = telemetry_service.ingest_batch([telemetry_data for _, telemetry_data in pending])
+            for (seq, telemetry_data), result in zip(pending, results):
+                if result:
+                    acked.append(seq)
+                else:
+                    rejected.append({"seq": seq, "error": f"Vehicle with VIN {telemetry_data.vehicle_vin} not found"})
+
+        self._service.record_batch(len(acked), len(rejected))
+        self.credits += len(acked) + len(rejected)
+        return {"type": "ack", "acked": acked, "rejected": rejected, "credits": len(acked) + len(rejected)}
+
+class TelemetryStreamService:
+    BATCH_MAX_SAMPLES = 500
+    BATCH_LINGER_SECONDS = 0.05
+    CREDIT_WINDOW = 2000  # samples a client may have in flight before waiting for acks
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"open_connections": 0, "total_connections": 0, "batches": 0, "acked_samples": 0, "rejected_samples": 0,
+                       "credit_violations": 0}
+
+    def open_session(self) -> TelemetryStreamSession:
+        with self._lock:
+            self._stats["open_connections"] += 1
+            self._stats["total_connections"] += 1
+        return TelemetryStreamSession(self)
+
+    def close_session(self, session: TelemetryStreamSession):
+        with self._lock:
+            self._stats["open_connections"] -= 1
+            if session.credit_exceeded:
+                self._stats["credit_violations"] += 1
+
+    def initial_credit(self) -> Dict[str, Any]:
+        return {"type": "credit", "credits": self.CREDIT_WINDOW, "max_batch": self.BATCH_MAX_SAMPLES}
+
+    def record_batch(self, acked: int, rejected: int):
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["acked_samples"] += acked
+            self._stats["rejected_samples"] += rejected
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+telemetry_stream_service = TelemetryStreamService()
@@ -0,0 +1,175 @@
+from typing import Iterable, Iterator, List, Dict, Any, Tuple
+from enum import Enum
+import codecs
+import csv
+import json
+import sqlite3
+from datetime import datetime
+from pydantic import ValidationError
+from fastapi import HTTPException, status
+from models.vehicle import VehicleCreate
+from database.connectDB import execute_query, get_db_connection, TIMESTAMP_FORMAT
+from services.response_cache import response_cache
+
+class ImportFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+class ImportConflictMode(str, Enum):
+    SKIP = "skip"  # rows for registered VINs are reported as errors
+    UPDATE_STATUS = "update_status"  # rows for registered VINs update registration_status only
+
+CSV_REQUIRED_COLUMNS = {"vin", "manufacturer", "model", "fleet_id", "owner_operator"}
+
+class VehicleImportService:
+    CHUNK_SIZE = 500  # rows validated, looked up and written per transaction; also under SQLite's parameter limit
+    MAX_REPORTED_ERRORS = 10_000
+
+    @staticmethod
+    def _lines(chunks: Iterable[bytes]) -> Iterator[str]:
+        """Decode a byte stream into lines without holding more than one line in memory"""
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        partial = ""
+        for chunk in chunks:
+            text = partial + decoder.decode(chunk)
+            lines = text.splitlines(keepends=True)
+            partial = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+            yield from lines
+        tail = partial + decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    @staticmethod
+    def _records(chunks: Iterable[bytes], import_format: ImportFormat) -> Iterator[Tuple[int, Any]]:
+        """(row number, raw record) pairs; a raw record that failed to parse is an Exception"""
+        lines = VehicleImportService._lines(chunks)
+        if import_format == ImportFormat.CSV:
+            reader = csv.DictReader(lines)
+            columns = {name.strip() for name in (reader.fieldnames or [])}
+            missing = CSV_REQUIRED_COLUMNS - columns
+            if missing:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"CSV header is missing columns: {', '.join(sorted(missing))}"
+                )
+            for row_number, row in enumerate(reader, start=1):
+                record = {key.strip(): value.strip() for key, value in row.items() if key and value is not None}
+                if not record.get("registration_status"):
+                    record.pop("registration_status", None)
+                yield row_number, record
+        else:
+            row_number = 0
+            for line in lines:
+                if not line.strip():
+                    continue
+                row_number += 1
+                try:
+                    yield row_number, json.loads(line)
+                except ValueError as e:
+                    yield row_number, ValueError(f"Invalid JSON: {e}")
+
+    @staticmethod
+    def import_vehicles(chunks: Iterable[bytes], import_format: ImportFormat,
+                        on_conflict: ImportConflictMode = ImportConflictMode.SKIP) -> Dict[str, Any]:
+        """Validate and register vehicles chunk by chunk; rows never fail the whole import"""
+        report = {"format": import_format.value, "rows": 0, "created": 0, "updated": 0, "unchanged": 0, "failed": 0, "errors": []}
+        first_seen: Dict[str, int] = {}
+        chunk: List[Tuple[int, VehicleCreate]] = []
+
+        for row_number, record in VehicleImportService._records(chunks, import_format):
+            report["rows"] += 1
+            vin = record.get("vin") if isinstance(record, dict) else None
+            if isinstance(record, Exception):
+                VehicleImportService._fail(report, row_number, vin, str(record))
+                continue
+            try:
+                vehicle = VehicleCreate.model_validate(record)
+            except ValidationError as e:
+                error = e.errors()[0]
+                field = ".".join(str(part) for part in error["loc"])
+                VehicleImportService._fail(report, row_number, vin, f"{field}: {error['msg']}" if field else error["msg"])
+                continue
+            if not vehicle.vin:
+                VehicleImportService._fail(report, row_number, vin, "vin: must not be empty")
+                continue
+            if vehicle.vin in first_seen:
+                VehicleImportService._fail(report, row_number, vehicle.vin, f"Duplicate VIN in file (first seen at row {first_seen[vehicle.vin]})")
+                continue
+            first_seen[vehicle.vin] = row_number
+            chunk.append((row_number, vehicle))
+            if len(chunk) >= VehicleImportService.CHUNK_SIZE:
+                VehicleImportService._write_chunk(chunk, on_conflict, report)
+                chunk = []
+        if chunk:
+            VehicleImportService._write_chunk(chunk, on_conflict, report)
+
+        report["errors"].sort(key=lambda error: error["row"])
+        report["errors_truncated"] = report["failed"] > len(report["errors"])
+        return report
+
+    @staticmethod
+    def _fail(report: Dict[str, Any], row_number: int, vin: Any, error: str):
+        report["failed"] += 1
+        if len(report["errors"]) < VehicleImportService.MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row_number, "vin": vin if isinstance(vin, str) else None, "error": error})
+
+    @staticmethod
+    def _write_chunk(chunk: List[Tuple[int, VehicleCreate]], on_conflict: ImportConflictMode, report: Dict[str, Any]):
+        # One set-based lookup tells new VINs from registered ones
+        vins = [vehicle.vin for _, vehicle in chunk]
+        existing, stored_fleets, removed = {}, {}, set()
+        for row in execute_query(f"SELECT vin, fleet_id, registration_status, deleted_at FROM vehicles WHERE vin IN ({', '.join('?' for _ in vins)})", tuple(vins)):
+            existing[row['vin']] = row['registration_status']
+            stored_fleets[row['vin']] = row['fleet_id']
+            if row['deleted_at']:
+                removed.add(row['vin'])
+
+        new_rows, status_changes = [], []
+        for row_number, vehicle in chunk:
+            current_status = existing.get(vehicle.vin)
+            if current_status is None:
+                new_rows.append((row_number, vehicle))
+            elif vehicle.vin in removed:
+                VehicleImportService._fail(report, row_number, vehicle.vin, "Vehicle is still being removed")
+            elif on_conflict == ImportConflictMode.SKIP:
+                VehicleImportService._fail(report, row_number, vehicle.vin, "Vehicle already exists")
+            elif current_status != vehicle.registration_status.value:
+                status_changes.append((vehicle.registration_status.value, vehicle.vin))
+            else:
+                report["unchanged"] += 1
+
+        created_at = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+        insert_query = """
+            INSERT INTO vehicles (vin, manufacturer, model, fleet_id, owner_operator, registration_status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+        insert_params = [
+            (v.vin, v.manufacturer, v.model, v.fleet_id, v.owner_operator, v.registration_status.value, created_at)
+            for _, v in new_rows
+        ]
+        if not insert_params and not status_changes:
+            return
+        with get_db_connection() as conn:
+            try:
+                conn.executemany(insert_query, insert_params)
+                report["created"] += len(insert_params)
+            except sqlite3.IntegrityError:
+                # A VIN was registered concurrently; fall back to row-by-row inserts for this chunk
+                conn.rollback()
+                for (row_number, vehicle), params in zip(new_rows, insert_params):
+                    try:
+                        conn.execute(insert_query, params)
+                        report["created"] += 1
+                    except sqlite3.IntegrityError:
+                        VehicleImportService._fail(report, row_number, vehicle.vin, "Vehicle already exists")
+            if status_changes:
+                conn.executemany("UPDATE vehicles SET registration_status = ? WHERE vin = ?", status_changes)
+                report["updated"] += len(status_changes)
+            conn.commit()
+        # Updates only touch the status, so a registered vehicle stays in the fleet it is stored under
+        fleets = {v.fleet_id for _, v in new_rows} | {stored_fleets[vin] for _, vin in status_changes}
+        response_cache.invalidate(
+            "vehicles", *(f"fleet:{fleet_id}" for fleet_id in fleets), *(f"vehicle:{vin}" for _, vin in status_changes)
+        )
+
+vehicle_import_service = VehicleImportService()
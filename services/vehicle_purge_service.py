@@ -0,0 +1,181 @@
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import sqlite3
+import threading
+import time
+from database.connectDB import execute_query, execute_update, get_db_connection, TIMESTAMP_FORMAT
+from database.telemetry_partitions import telemetry_partitions
+from database.telemetry_rollups import telemetry_rollups
+from services.response_cache import response_cache
+
+class VehiclePurgeService:
+    """Removes the rows of deleted vehicles in small transactions.
+
+    Deleting a vehicle only stamps vehicles.deleted_at and queues a purge; the
+    worker then deletes its alerts and telemetry DELETE_CHUNK_SIZE rows at a
+    time, pausing between chunks so ingest can take the write lock, and
+    finally deletes the vehicle row once nothing is left for ON DELETE CASCADE
+    to do. Purges are persisted in vehicle_purges and resume after a restart.
+    """
+    DELETE_CHUNK_SIZE = 2000
+    CHUNK_PAUSE_SECONDS = 0.01
+    POLL_SECONDS = 30
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        self.current_vin: Optional[str] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="vehicle-purge", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+
+    def enqueue(self, vin: str):
+        execute_update(
+            """INSERT INTO vehicle_purges (vin, requested_at) VALUES (?, ?)
+               ON CONFLICT(vin) DO UPDATE SET status = 'pending', phase = NULL, rows_deleted = 0,
+                   requested_at = excluded.requested_at, started_at = NULL, completed_at = NULL""",
+            (vin, datetime.utcnow().strftime(TIMESTAMP_FORMAT))
+        )
+        self._wakeup.set()
+
+    def _run_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"Vehicle purge failed: {e}")
+            self._wakeup.wait(self.POLL_SECONDS)
+            self._wakeup.clear()
+
+    def run_pending(self) -> int:
+        """Purge every queued vehicle, oldest request first; interrupted purges pick up where they stopped"""
+        purged = 0
+        while not self._stop_event.is_set():
+            rows = execute_query(
+                "SELECT vin FROM vehicle_purges WHERE status != 'completed' ORDER BY requested_at LIMIT 1"
+            )
+            if not rows:
+                break
+            if self.purge_vehicle(rows[0]['vin']):
+                purged += 1
+        return purged
+
+    def _steps(self, vin: str) -> List[Tuple[str, str, str]]:
+        """(phase, table, chunked DELETE) in dependency order, children before parents"""
+        steps = [
+            ("alert_relationships", "alert_relationships", """
+                DELETE FROM alert_relationships WHERE id IN (
+                    SELECT ar.id FROM alert_relationships ar
+                    JOIN active_alerts aa ON aa.id = ar.active_alert_id
+                    WHERE aa.vehicle_vin = ? LIMIT ?
+                )"""),
+            ("active_alerts", "active_alerts",
+             "DELETE FROM active_alerts WHERE id IN (SELECT id FROM active_alerts WHERE vehicle_vin = ? LIMIT ?)"),
+            ("alerts", "alerts",
+             "DELETE FROM alerts WHERE id IN (SELECT id FROM alerts WHERE vehicle_vin = ? LIMIT ?)"),
+            ("telemetry_minute_aggregates", "telemetry_minute_aggregates",
+             "DELETE FROM telemetry_minute_aggregates WHERE rowid IN (SELECT rowid FROM telemetry_minute_aggregates WHERE vehicle_vin = ? LIMIT ?)"),
+            # Clustered on its primary key, so the resolutions are listed to let the lookup use it
+            ("telemetry_rollups", "telemetry_rollups", f"""
+                DELETE FROM telemetry_rollups WHERE (resolution, vehicle_vin, bucket_start) IN (
+                    SELECT resolution, vehicle_vin, bucket_start FROM telemetry_rollups
+                    WHERE resolution IN ({', '.join(str(r) for r in telemetry_rollups.RESOLUTIONS.values())})
+                      AND vehicle_vin = ? LIMIT ?
+                )"""),
+        ]
+        for table, _ in telemetry_partitions.tables_for_range():
+            steps.append((
+                "telemetry", table,
+                f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE vehicle_vin = ? LIMIT ?)"
+            ))
+        return steps
+
+    def purge_vehicle(self, vin: str) -> bool:
+        """Run one vehicle's purge to completion; False if stopped first"""
+        self.current_vin = vin
+        execute_update(
+            "UPDATE vehicle_purges SET status = 'running', started_at = COALESCE(started_at, ?) WHERE vin = ?",
+            (datetime.utcnow().strftime(TIMESTAMP_FORMAT), vin)
+        )
+        try:
+            for phase, table, query in self._steps(vin):
+                while True:
+                    if self._stop_event.is_set():
+                        return False
+                    try:
+                        with get_db_connection() as conn:
+                            deleted = conn.execute(query, (vin, self.DELETE_CHUNK_SIZE)).rowcount
+                            conn.execute(
+                                "UPDATE vehicle_purges SET phase = ?, rows_deleted = rows_deleted + ? WHERE vin = ?",
+                                (phase, deleted, vin)
+                            )
+                            conn.commit()
+                    except sqlite3.OperationalError as e:
+                        # Retention may drop a telemetry partition while we are working through it
+                        if "no such table" in str(e):
+                            break
+                        raise
+                    if deleted < self.DELETE_CHUNK_SIZE:
+                        break
+                    time.sleep(self.CHUNK_PAUSE_SECONDS)
+
+            # Only the vehicle row is left, so the cascade is empty; keep it if the VIN was re-registered meanwhile
+            with get_db_connection() as conn:
+                conn.execute("DELETE FROM vehicles WHERE vin = ? AND deleted_at IS NOT NULL", (vin,))
+                conn.execute(
+                    "UPDATE vehicle_purges SET status = 'completed', phase = NULL, completed_at = ? WHERE vin = ?",
+                    (datetime.utcnow().strftime(TIMESTAMP_FORMAT), vin)
+                )
+                conn.commit()
+            response_cache.invalidate(f"alerts:{vin}")
+            return True
+        finally:
+            self.current_vin = None
+
+    def get_progress(self, vin: str) -> Optional[Dict[str, Any]]:
+        rows = execute_query("SELECT * FROM vehicle_purges WHERE vin = ?", (vin,))
+        if not rows:
+            return None
+        progress = rows[0]
+        if progress['status'] != 'completed':
+            progress['rows_remaining'] = self._remaining_rows(vin)
+        return progress
+
+    def _remaining_rows(self, vin: str) -> Dict[str, int]:
+        remaining = {}
+        for table in ("active_alerts", "alerts", "telemetry_minute_aggregates", "telemetry_rollups"):
+            remaining[table] = execute_query(f"SELECT COUNT(*) as count FROM {table} WHERE vehicle_vin = ?", (vin,))[0]['count']
+        telemetry = 0
+        for table, _ in telemetry_partitions.tables_for_range():
+            try:
+                telemetry += execute_query(f"SELECT COUNT(*) as count FROM {table} WHERE vehicle_vin = ?", (vin,))[0]['count']
+            except sqlite3.OperationalError:
+                continue
+        remaining["telemetry"] = telemetry
+        return remaining
+
+    def get_status(self) -> Dict[str, Any]:
+        counts = {row['status']: row['count'] for row in execute_query(
+            "SELECT status, COUNT(*) as count FROM vehicle_purges GROUP BY status"
+        )}
+        queued = execute_query(
+            "SELECT * FROM vehicle_purges WHERE status != 'completed' ORDER BY requested_at LIMIT 100"
+        )
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "current_vin": self.current_vin,
+            "chunk_size": self.DELETE_CHUNK_SIZE,
+            "counts": counts,
+            "queued": queued
+        }
+
+vehicle_purge_service = VehiclePurgeService()
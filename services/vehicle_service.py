@@ -1,105 +1,101 @@
-from typing import List, Optional
+from typing import List, Optional, Dict
 from datetime import datetime
-from models.vehicle import Vehicle, VehicleCreate
-from database.connectDB import execute_query, execute_insert, execute_update
+from models.vehicle import Vehicle, VehicleBase, VehicleCreate, RegistrationStatus
+from database.connectDB import TIMESTAMP_FORMAT
+from database.storage import storage
+from services.deadband_service import deadband_service
+from services.alert_event_bus import alert_event_bus
+from services.ingest_shards import ingest_shards
+from services.admission_service import admission_controller
+from services.vehicle_purge_service import vehicle_purge_service
+from services.response_cache import response_cache
+from services.telemetry_ring_buffer import telemetry_ring_buffer
 from fastapi import HTTPException, status
 
 class VehicleService:
     @staticmethod
+    def _row_to_vehicle(row: dict) -> Vehicle:
+        return Vehicle(
+            id=row['id'],
+            vin=row['vin'],
+            manufacturer=row['manufacturer'],
+            model=row['model'],
+            fleet_id=row['fleet_id'],
+            owner_operator=row['owner_operator'],
+            registration_status=row['registration_status'],
+            created_at=datetime.fromisoformat(row['created_at'])
+        )
+    @staticmethod
     def create_vehicle(vehicle_data: VehicleCreate) -> Vehicle:
-        existing = VehicleService.get_vehicle(vehicle_data.vin)
+        existing = storage.get_vehicle(vehicle_data.vin, include_deleted=True)
+        if existing and existing['deleted_at']:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Vehicle with VIN {vehicle_data.vin} is still being removed; retry once its purge completes"
+            )
         if existing:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Vehicle with VIN {vehicle_data.vin} already exists"
             )
         
-        query = """
-            INSERT INTO vehicles (vin, manufacturer, model, fleet_id, owner_operator, registration_status)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """
-        params = (
-            vehicle_data.vin,
-            vehicle_data.manufacturer,
-            vehicle_data.model,
-            vehicle_data.fleet_id,
-            vehicle_data.owner_operator,
-            vehicle_data.registration_status.value
-        )
-        
-        vehicle_id = execute_insert(query, params)
-        return VehicleService.get_vehicle_by_id(vehicle_id) 
+        row = storage.insert_vehicle(vehicle_data)
+        response_cache.invalidate("vehicles", f"fleet:{vehicle_data.fleet_id}")
+        return VehicleService._row_to_vehicle(row)
     @staticmethod
     def get_vehicle(vin: str) -> Optional[Vehicle]:
-        query = "SELECT * FROM vehicles WHERE vin = ?"
-        results = execute_query(query, (vin,))
-        if results:
-            row = results[0]
-            return Vehicle(
-                id=row['id'],
-                vin=row['vin'],
-                manufacturer=row['manufacturer'],
-                model=row['model'],
-                fleet_id=row['fleet_id'],
-                owner_operator=row['owner_operator'],
-                registration_status=row['registration_status'],
-                created_at=datetime.fromisoformat(row['created_at'])
-            )
-        return None
+        row = storage.get_vehicle(vin)
+        return VehicleService._row_to_vehicle(row) if row else None
+    @staticmethod
+    def get_vehicles_by_vins(vins) -> Dict[str, Vehicle]:
+        return {vin: VehicleService._row_to_vehicle(row) for vin, row in storage.get_vehicles_by_vins(vins).items()}
+    @staticmethod
+    def upsert_vehicles(vehicles: List[Vehicle]):
+        """Mirror registry rows shipped by the API process into a shard's database.
+
+        Rows that already match are not rewritten, so steady ingest costs one read.
+        The API process owns the registry and its cache, so nothing is invalidated here.
+        """
+        stored = VehicleService.get_vehicles_by_vins({v.vin for v in vehicles})
+        registry_fields = set(VehicleBase.model_fields)
+        changed = [
+            v for v in vehicles
+            if v.vin not in stored or stored[v.vin].model_dump(include=registry_fields) != v.model_dump(include=registry_fields)
+        ]
+        if not changed:
+            return
+        storage.upsert_vehicles([
+            {
+                'vin': v.vin, 'manufacturer': v.manufacturer, 'model': v.model, 'fleet_id': v.fleet_id,
+                'owner_operator': v.owner_operator, 'registration_status': RegistrationStatus(v.registration_status).value,
+                'created_at': v.created_at.strftime(TIMESTAMP_FORMAT)
+            }
+            for v in changed
+        ])
     @staticmethod
     def get_vehicle_by_id(vehicle_id: int) -> Optional[Vehicle]:
-        query = "SELECT * FROM vehicles WHERE id = ?"
-        results = execute_query(query, (vehicle_id,))
-        if results:
-            row = results[0]
-            return Vehicle(
-                id=row['id'],
-                vin=row['vin'],
-                manufacturer=row['manufacturer'],
-                model=row['model'],
-                fleet_id=row['fleet_id'],
-                owner_operator=row['owner_operator'],
-                registration_status=row['registration_status'],
-                created_at=datetime.fromisoformat(row['created_at'])
-            )
-        return None
+        row = storage.get_vehicle_by_id(vehicle_id)
+        return VehicleService._row_to_vehicle(row) if row else None
     @staticmethod
     def get_all_vehicles() -> List[Vehicle]:
-        query = "SELECT * FROM vehicles ORDER BY created_at DESC"
-        results = execute_query(query)
-        vehicles = []
-        for row in results:
-            vehicles.append(Vehicle(
-                id=row['id'],
-                vin=row['vin'],
-                manufacturer=row['manufacturer'],
-                model=row['model'],
-                fleet_id=row['fleet_id'],
-                owner_operator=row['owner_operator'],
-                registration_status=row['registration_status'],
-                created_at=datetime.fromisoformat(row['created_at'])
-            ))
-        return vehicles
+        return [VehicleService._row_to_vehicle(row) for row in storage.list_vehicles()]
     @staticmethod
     def delete_vehicle(vin: str) -> bool:
-        query = "DELETE FROM vehicles WHERE vin = ?"
-        affected_rows = execute_update(query, (vin,))
-        return affected_rows > 0
+        """Hide the vehicle at once; its telemetry and alerts are removed by the background purge"""
+        fleet_id = storage.mark_vehicle_deleted(vin, datetime.utcnow())
+        if fleet_id is not None:
+            response_cache.invalidate("vehicles", f"fleet:{fleet_id}", f"vehicle:{vin}", f"alerts:{vin}")
+            # Other engines drop the vehicle's data in mark_vehicle_deleted
+            if storage.sql_backed:
+                vehicle_purge_service.enqueue(vin)
+        deadband_service.forget_vehicle(vin)
+        alert_event_bus.forget_vehicle(vin)
+        admission_controller.forget_vehicle(vin)
+        telemetry_ring_buffer.forget_vehicle(vin)
+        if ingest_shards.enabled:
+            ingest_shards.call_for_vin(vin, "vehicle_service", "delete_vehicle", vin)
+        return fleet_id is not None
     @staticmethod
     def get_vehicles_by_fleet(fleet_id: str) -> List[Vehicle]:
-        query = "SELECT * FROM vehicles WHERE fleet_id = ? ORDER BY created_at DESC"
-        results = execute_query(query, (fleet_id,))
-        vehicles = []
-        for row in results:
-            vehicles.append(Vehicle(
-                id=row['id'],
-                vin=row['vin'],
-                manufacturer=row['manufacturer'],
-                model=row['model'],
-                fleet_id=row['fleet_id'],
-                owner_operator=row['owner_operator'],
-                registration_status=row['registration_status'],
-                created_at=datetime.fromisoformat(row['created_at'])
-            ))
-        return vehicles
+        return [VehicleService._row_to_vehicle(row) for row in storage.list_vehicles(fleet_id)]
 vehicle_service = VehicleService()
@@ -0,0 +1,44 @@
+import threading
+from datetime import datetime
+from database.connectDB import execute_query
+from database.storage import storage
+from models.vehicle import VehicleCreate
+from services.alert_sender_service import alert_sender_service
+
+THREADS = 16
+VIN = "1HGCM82633A004352"
+
+def test_concurrent_raw_alerts_share_one_open_active_alert(temp_db):
+    storage.insert_vehicle(VehicleCreate(
+        vin=VIN, manufacturer="Honda", model="Accord", fleet_id="fleet-1", owner_operator="Dedup Test"
+    ))
+    raw_alerts = [
+        storage.insert_alert(VIN, "speed_violation", "high", f"Speed {121 + i} km/h", datetime.utcnow())
+        for i in range(THREADS)
+    ]
+    barrier = threading.Barrier(THREADS)
+    errors = []
+
+    def process(raw_alert):
+        barrier.wait()
+        try:
+            alert_sender_service.process_raw_alert(raw_alert)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=process, args=(raw_alert,)) for raw_alert in raw_alerts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    open_alerts = execute_query(
+        "SELECT * FROM active_alerts WHERE vehicle_vin = ? AND alert_type = 'speed_violation' AND status = 'active'", (VIN,)
+    )
+    assert len(open_alerts) == 1
+    assert open_alerts[0]['occurrence_count'] == THREADS
+    relationships = execute_query(
+        "SELECT raw_alert_id FROM alert_relationships WHERE active_alert_id = ?", (open_alerts[0]['id'],)
+    )
+    assert sorted(row['raw_alert_id'] for row in relationships) == sorted(raw_alert['id'] for raw_alert in raw_alerts)
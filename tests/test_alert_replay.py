@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+import pytest
+from database.connectDB import execute_query, execute_update, get_db_connection
+from database.storage import storage
+from models.vehicle import VehicleCreate
+from services.alert_replay_service import _rebuild_vin
+
+VIN = "1HGCM82633A004352"
+NOW = datetime.utcnow().replace(microsecond=0)
+BASE = NOW - timedelta(hours=1)
+SPEEDING = ("speed_violation", "high", "Speed violation: 150 km/h (limit: 120 km/h)")
+
+def raise_alerts(minutes):
+    for minute in minutes:
+        timestamp = BASE + timedelta(minutes=minute)
+        raw = storage.insert_alert(VIN, *SPEEDING, timestamp)
+        storage.record_active_alert({**raw, 'timestamp': timestamp}, "Speeding", "Speeding")
+
+def replay(start_minute: int, end_minute: int, replayed_minutes):
+    raw_alerts = [(*SPEEDING, BASE + timedelta(minutes=minute)) for minute in replayed_minutes]
+    with get_db_connection() as conn:
+        _rebuild_vin(conn, VIN, raw_alerts, BASE + timedelta(minutes=start_minute), BASE + timedelta(minutes=end_minute), NOW)
+        conn.commit()
+
+@pytest.fixture
+def vehicle(temp_db):
+    storage.insert_vehicle(VehicleCreate(
+        vin=VIN, manufacturer="Honda", model="Accord", fleet_id="fleet-1", owner_operator="Replay Test"
+    ))
+    # One speeding alert, still open, with occurrences before, inside and after the replayed range
+    raise_alerts([0, 10, 20, 40, 50])
+
+def unlinked_raw_alerts():
+    return execute_query("""
+        SELECT COUNT(*) AS count FROM alerts a
+        WHERE vehicle_vin = ? AND NOT EXISTS (SELECT 1 FROM alert_relationships ar WHERE ar.raw_alert_id = a.id)
+    """, (VIN,))[0]['count']
+
+@pytest.mark.parametrize("start_minute,replayed,occurrences", [
+    (-30, [5, 25], 4),      # the open alert was opened inside the range and is rebuilt
+    (5, [15, 25], 5),       # it was opened before the range and keeps its first occurrence
+])
+def test_occurrences_after_the_range_stay_with_the_open_alert(vehicle, start_minute, replayed, occurrences):
+    replay(start_minute, 30, replayed)
+
+    assert unlinked_raw_alerts() == 0
+    alerts = execute_query("SELECT * FROM active_alerts WHERE vehicle_vin = ?", (VIN,))
+    assert len(alerts) == 1
+    alert = alerts[0]
+    assert (alert['status'], alert['resolved_by']) == ("active", None)
+    assert alert['occurrence_count'] == alert['related_alerts_count'] == occurrences
+    assert alert['last_occurrence'] == (BASE + timedelta(minutes=50)).isoformat()
+
+def test_status_set_by_hand_after_the_range_is_kept(vehicle):
+    execute_update("UPDATE active_alerts SET status = 'resolved', resolved_at = ?, resolved_by = 'operator'", (NOW.isoformat(),))
+
+    replay(-30, 30, [5, 25])
+
+    assert unlinked_raw_alerts() == 0
+    alert = execute_query("SELECT * FROM active_alerts WHERE vehicle_vin = ?", (VIN,))[0]
+    assert (alert['status'], alert['resolved_at'], alert['resolved_by']) == ("resolved", NOW.isoformat(), "operator")
+    assert alert['occurrence_count'] == 4
@@ -0,0 +1,163 @@
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from database.connectDB import execute_query, execute_update
+from models.alert_sender import ActiveAlert
+from services.notification_service import NotificationDispatcher
+from services.notification_sinks import WebhookSink
+
+class WebhookStandIn:
+    """Local HTTP server that records posted batches and answers 500 to the first `failures` requests"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.batches = []
+        self.request_times = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                stand_in.request_times.append(time.monotonic())
+                if stand_in.failures > 0:
+                    stand_in.failures -= 1
+                    status = 500
+                else:
+                    stand_in.batches.append(json.loads(body)["notifications"])
+                    status = 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/alerts"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def notifications(self):
+        return [notification for batch in self.batches for notification in batch]
+
+    def wait_for(self, count: int, timeout: float = 10.0):
+        deadline = time.monotonic() + timeout
+        while len(self.notifications) < count and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert len(self.notifications) >= count, f"expected {count} notifications, got {self.notifications}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def webhook():
+    servers = []
+
+    def start(failures: int = 0) -> WebhookStandIn:
+        server = WebhookStandIn(failures)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+@pytest.fixture
+def dispatcher(temp_db):
+    dispatcher = NotificationDispatcher()
+    dispatcher.LINGER_SECONDS = 0.05
+    dispatcher.MIN_BATCH_INTERVAL_SECONDS = 0.0
+    dispatcher.POLL_SECONDS = 0.05
+    dispatcher.RETRY_BASE_SECONDS = 0.1
+    yield dispatcher
+    dispatcher.stop()
+
+def wait_for_outbox(status: str, timeout: float = 10.0):
+    """The sink hears a batch before the dispatcher records the outcome"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        statuses = {row['status'] for row in execute_query("SELECT status FROM notification_outbox")}
+        if statuses == {status}:
+            return
+        time.sleep(0.02)
+    raise AssertionError(f"outbox never settled on {status}: {statuses}")
+
+def make_alert(alert_sender_id: str, severity: str = "high") -> ActiveAlert:
+    now = datetime.utcnow()
+    return ActiveAlert(
+        id=1, alert_sender_id=alert_sender_id, vehicle_vin="1HGCM82633A004352", alert_type="speed_violation",
+        severity=severity, title="Speed violation", description="Speed over the limit", status="active",
+        first_occurrence=now, last_occurrence=now, occurrence_count=1, created_at=now
+    )
+
+def test_queued_alerts_are_sent_as_one_batch(dispatcher, webhook):
+    server = webhook()
+    dispatcher.register_sink(WebhookSink(server.url))
+    for i in range(5):
+        assert dispatcher.enqueue("created", make_alert(f"alert-{i}"))
+
+    dispatcher.start()
+    server.wait_for(5)
+    wait_for_outbox("delivered")
+
+    assert len(server.batches) == 1
+    assert sorted(n["alert"]["alert_sender_id"] for n in server.notifications) == [f"alert-{i}" for i in range(5)]
+    assert dispatcher.get_stats()["sinks"][0]["outbox"] == {"delivered": 5}
+
+def test_failed_batches_are_retried_with_backoff(dispatcher, webhook):
+    server = webhook(failures=2)
+    dispatcher.register_sink(WebhookSink(server.url))
+    dispatcher.enqueue("created", make_alert("alert-1"))
+
+    dispatcher.start()
+    server.wait_for(1)
+    wait_for_outbox("delivered")
+
+    assert len(server.request_times) == 3
+    first_gap = server.request_times[1] - server.request_times[0]
+    second_gap = server.request_times[2] - server.request_times[1]
+    # Backoff is RETRY_BASE_SECONDS * 2 ** (attempts - 1), jittered down to half
+    assert first_gap >= 0.05
+    assert second_gap >= 0.1
+    row = execute_query("SELECT status, attempts, last_error FROM notification_outbox")[0]
+    assert (row['status'], row['attempts'], row['last_error']) == ("delivered", 3, None)
+    assert dispatcher.get_stats()["sinks"][0]["failed_batches"] == 2
+
+def test_only_new_and_escalated_alerts_are_sent(dispatcher, webhook):
+    server = webhook()
+    dispatcher.register_sink(WebhookSink(server.url))
+    dispatcher.start()
+
+    assert dispatcher.enqueue("created", make_alert("alert-1", "high"))
+    server.wait_for(1)
+    assert not dispatcher.enqueue("updated", make_alert("alert-1", "high"))
+    assert not dispatcher.enqueue("updated", make_alert("alert-1", "medium"))
+    assert dispatcher.enqueue("updated", make_alert("alert-1", "critical"))
+    server.wait_for(2)
+
+    assert [(n["event"], n["alert"]["severity"]) for n in server.notifications] == [
+        ("created", "high"), ("escalated", "critical")
+    ]
+
+def test_restart_requeues_batches_that_were_in_flight(dispatcher, webhook):
+    server = webhook()
+    dispatcher.register_sink(WebhookSink(server.url))
+    # The process died while the created notification was being sent and an escalation was queued behind it
+    dispatcher.enqueue("created", make_alert("alert-1", "high"))
+    execute_update("UPDATE notification_outbox SET status = 'sending'")
+    dispatcher.enqueue("updated", make_alert("alert-1", "critical"))
+
+    dispatcher.start()
+    server.wait_for(1)
+    wait_for_outbox("delivered")
+
+    assert [(n["event"], n["alert"]["severity"]) for n in server.notifications] == [("created", "critical")]
+    statuses = execute_query("SELECT status FROM notification_outbox")
+    assert [row['status'] for row in statuses] == ["delivered"]
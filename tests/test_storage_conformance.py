@@ -0,0 +1,159 @@
+import random
+from datetime import datetime, timedelta
+import pytest
+from database import connectDB
+from database.storage import STORAGE_ENGINES, SQLiteStorage, StorageBackend, create_storage
+from database.telemetry_partitions import telemetry_partitions
+from models.telemetry import TelemetryCreate
+from models.vehicle import VehicleCreate
+
+VEHICLES = 20
+RECEIVED_AT = datetime.utcnow().replace(microsecond=0)
+
+@pytest.fixture
+def fresh_storage(tmp_path, monkeypatch):
+    """Factory for empty engines; every SQLite engine gets its own database file"""
+    created = []
+
+    def make(engine: str) -> StorageBackend:
+        if engine == "sqlite":
+            monkeypatch.setattr(connectDB, "DB_FILE", str(tmp_path / f"fleet-{len(created)}.db"))
+            connectDB.create_database_schema()
+            telemetry_partitions.refresh()
+        created.append(engine)
+        return create_storage(engine)
+
+    yield make
+    telemetry_partitions._days = None
+
+@pytest.fixture(params=list(STORAGE_ENGINES))
+def storage(request, fresh_storage):
+    engine = fresh_storage(request.param)
+    register_vehicles(engine)
+    return engine
+
+def vin(i: int) -> str:
+    return f"VIN{i:014d}"
+
+def register_vehicles(storage: StorageBackend):
+    for i in range(VEHICLES):
+        storage.insert_vehicle(VehicleCreate(
+            vin=vin(i), manufacturer="Make", model="Model", fleet_id=f"FLEET{i % 4}", owner_operator="Owner"
+        ))
+
+def make_samples(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [
+        TelemetryCreate(
+            vehicle_vin=vin(i % VEHICLES),
+            latitude=rng.uniform(-90, 90),
+            longitude=rng.uniform(-180, 180),
+            speed=rng.uniform(0, 140),
+            engine_status=rng.choice(["On", "Off", "Idle"]),
+            fuel_battery_level=rng.uniform(0, 100),
+            odometer_reading=rng.uniform(0, 300000),
+            diagnostic_codes=["P0300"] if i % 7 == 0 else [],
+        )
+        for i in range(count)
+    ]
+
+def comparable(value):
+    """Engine-independent form of a result: no ids or creation times, floats rounded"""
+    if isinstance(value, dict):
+        return {k: comparable(v) for k, v in value.items() if k not in ("id", "alert_id", "alert_sender_id", "created_at")}
+    if isinstance(value, (list, tuple)):
+        return [comparable(v) for v in value]
+    if isinstance(value, float):
+        return round(value, 6)
+    return value
+
+def conformance_trace(storage: StorageBackend) -> list:
+    register_vehicles(storage)
+    trace = [storage.get_vehicle(vin(3)), storage.get_vehicle("missing"), storage.list_vehicles("FLEET1")]
+    trace.append(storage.mark_vehicle_deleted(vin(1), RECEIVED_AT))
+    trace.append(storage.mark_vehicle_deleted(vin(1), RECEIVED_AT))
+    trace.append([storage.get_vehicle(vin(1)), storage.get_vehicle(vin(1), include_deleted=True)])
+    trace.append(sorted(storage.get_vehicles_by_vins([vin(0), vin(1), "missing"])))
+    trace.append(storage.count_vehicles())
+    for batch in range(3):
+        rows = storage.append_telemetry(make_samples(100, batch), RECEIVED_AT + timedelta(seconds=batch))
+        trace.append(len(rows))
+        trace.append(rows[:3])
+    with storage.telemetry_writer(RECEIVED_AT + timedelta(seconds=3)) as writer:
+        sample = make_samples(1, 99)[0]
+        keyed = writer.append(sample, "key-1")
+        trace.append([keyed, writer.append(sample, "key-1"), writer.append(sample)])
+    trace.append([storage.get_ingest_key("key-1") == keyed['id'], storage.get_ingest_key("missing")])
+    trace.append([storage.get_telemetry(keyed['id']), storage.get_telemetry(rows[0]['id']), storage.get_telemetry(keyed['id'] + 1000)])
+    trace.append([storage.ingest_keys_since(RECEIVED_AT), storage.ingest_keys_since(RECEIVED_AT + timedelta(seconds=4))])
+    trace.append(storage.recent_telemetry(vin(2), 5))
+    trace.append(storage.recent_telemetry(vin(1), 5))
+    trace.append(storage.recent_telemetry("missing", 5))
+    for i, (alert_type, severity) in enumerate([("speed_violation", "medium"), ("speed_violation", "high"), ("low_fuel_battery", "medium")]):
+        raw = storage.insert_alert(vin(2), alert_type, severity, f"message {i}", RECEIVED_AT + timedelta(seconds=i))
+        trace.append(raw)
+        linked = storage.record_active_alert({**raw, 'timestamp': datetime.fromisoformat(raw['timestamp'])}, "title", "description")
+        trace.append(linked)
+        trace.append(storage.get_active_alert(linked['id']))
+    # Linking the same raw alert twice bumps the occurrence but not the related count
+    relinked = storage.record_active_alert({**raw, 'timestamp': datetime.fromisoformat(raw['timestamp'])}, "title", "description")
+    trace.append(storage.get_active_alert(relinked['id']))
+    trace.append(storage.fleet_aggregates(RECEIVED_AT - timedelta(hours=24)))
+    trace.append(storage.fleet_aggregates(RECEIVED_AT))
+    return comparable(trace)
+
+@pytest.mark.parametrize("engine", [engine for engine in STORAGE_ENGINES if engine != SQLiteStorage.name])
+def test_engine_trace_matches_sqlite(engine, fresh_storage):
+    reference = conformance_trace(fresh_storage("sqlite"))
+    trace = conformance_trace(fresh_storage(engine))
+    assert len(trace) == len(reference)
+    for step, (expected, actual) in enumerate(zip(reference, trace)):
+        assert actual == expected, f"{engine} differs from sqlite at step {step}"
+
+def test_deleted_vehicle_is_hidden(storage):
+    assert storage.mark_vehicle_deleted(vin(5), RECEIVED_AT) == "FLEET1"
+    assert storage.mark_vehicle_deleted(vin(5), RECEIVED_AT) is None
+    assert storage.get_vehicle(vin(5)) is None
+    assert storage.get_vehicle(vin(5), include_deleted=True)['deleted_at'] is not None
+    assert vin(5) not in storage.get_vehicles_by_vins([vin(5)])
+    assert vin(5) not in [row['vin'] for row in storage.list_vehicles()]
+
+def test_recent_telemetry_is_newest_first_and_limited(storage):
+    for batch in range(3):
+        storage.append_telemetry(make_samples(VEHICLES, batch), RECEIVED_AT + timedelta(seconds=batch))
+    rows = storage.recent_telemetry(vin(4), 2)
+    assert [row['timestamp'] for row in rows] == [
+        (RECEIVED_AT + timedelta(seconds=seconds)).strftime(connectDB.TIMESTAMP_FORMAT) for seconds in (2, 1)
+    ]
+    assert storage.recent_telemetry(vin(4), 10) == storage.recent_telemetry(vin(4), 3)
+
+def test_ingest_key_is_claimed_once(storage):
+    sample = make_samples(1, 0)[0]
+    with storage.telemetry_writer(RECEIVED_AT) as writer:
+        first = writer.append(sample, "device-1|7")
+        assert writer.append(sample, "device-1|7") is None
+    with storage.telemetry_writer(RECEIVED_AT + timedelta(seconds=1)) as writer:
+        assert writer.append(sample, "device-1|7") is None
+    assert [row['id'] for row in storage.recent_telemetry(sample.vehicle_vin, 10)] == [first['id']]
+    assert storage.get_ingest_key("device-1|7") == first['id']
+
+def test_expired_ingest_keys_are_released(storage):
+    sample = make_samples(1, 0)[0]
+    with storage.telemetry_writer(RECEIVED_AT) as writer:
+        writer.append(sample, "old")
+    with storage.telemetry_writer(RECEIVED_AT + timedelta(seconds=10)) as writer:
+        writer.append(sample, "new")
+    assert storage.prune_ingest_keys(RECEIVED_AT + timedelta(seconds=5)) == 1
+    assert (storage.get_ingest_key("old"), storage.ingest_keys_since(RECEIVED_AT)) == (None, ["new"])
+    with storage.telemetry_writer(RECEIVED_AT + timedelta(seconds=11)) as writer:
+        assert writer.append(sample, "old") is not None
+
+def test_active_alerts_group_by_type(storage):
+    linked = []
+    for i, alert_type in enumerate(["speed_violation", "speed_violation", "low_fuel_battery"]):
+        raw = storage.insert_alert(vin(2), alert_type, "high", "message", RECEIVED_AT + timedelta(seconds=i))
+        linked.append(storage.record_active_alert({**raw, 'timestamp': datetime.fromisoformat(raw['timestamp'])}, "title", "description"))
+    assert [row['created'] for row in linked] == [True, False, True]
+    assert linked[0]['id'] == linked[1]['id'] != linked[2]['id']
+    speeding = storage.get_active_alert(linked[0]['id'])
+    assert (speeding['occurrence_count'], speeding['related_alerts_count']) == (2, 2)